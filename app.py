@@ -11,6 +11,10 @@ import shutil
 import io
 import re
 import csv
+import hashlib
+import queue
+import threading
+import time
 import requests as _requests
 from datetime import datetime, timedelta
 from urllib.parse import quote
@@ -34,6 +38,31 @@ logging.basicConfig(level=logging.DEBUG)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['SECRET_KEY'] = os.urandom(24)  # Secret key cho session
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=5)  # Session timeout 5h
+# Số process trích xuất song song theo sheet (0/1 = tắt, chạy serial)
+app.config['EXTRACT_WORKERS'] = int(os.environ.get('EXTRACT_WORKERS', '0') or 0)
+# Số process patch song song theo part khi nạp bản dịch Excel (0/1 = tắt, chạy serial)
+app.config['INJECT_WORKERS'] = int(os.environ.get('INJECT_WORKERS', '0') or 0)
+# Nạp bản dịch Excel vào xl/sharedStrings.xml (dedup, cell t="s") thay vì inlineStr từng cell
+app.config['INJECT_XLSX_SHARED_STRINGS'] = False
+# Cache kết quả trích xuất trên đĩa (theo SHA-256 file + tùy chọn), LRU theo số entry và dung lượng.
+# Entry chứa toàn bộ text của tài liệu: cùng quy tắc với cleanup_old_sessions, entry dùng lần cuối
+# từ hôm qua trở về trước bị xóa cùng các folder phiên cũ.
+app.config['EXTRACT_CACHE_DIR'] = 'extract_cache'
+app.config['EXTRACT_CACHE_MAX_ENTRIES'] = 200
+app.config['EXTRACT_CACHE_MAX_BYTES'] = 512 * 1024 * 1024
+# Cache glossary đã compile (_GlossaryMatcher) trong process, LRU theo số entry và dung lượng ước tính
+app.config['GLOSSARY_CACHE_MAX_ENTRIES'] = 16
+app.config['GLOSSARY_CACHE_MAX_BYTES'] = 256 * 1024 * 1024
+# Backend lưu glossary: 'csv' (mỗi glossary một file CSV + meta.json, mặc định) hoặc 'sqlite' (GLOSSARY_DB_PATH)
+app.config['GLOSSARY_BACKEND'] = os.environ.get('GLOSSARY_BACKEND', 'csv')
+app.config['GLOSSARY_DB_PATH'] = os.path.join('glossaries', 'glossaries.db')
+# Sheet XML (chưa nén) lớn hơn ngưỡng này được patch dạng stream khi inject (bộ nhớ không phụ thuộc kích thước sheet)
+app.config['INJECT_STREAM_SHEET_BYTES'] = 64 * 1024 * 1024
+# Chuẩn hóa value trước khi gom dedup. 'strip' (bỏ khoảng trắng đầu/cuối, khôi phục lại từng key khi expand)
+# không làm mất gì. Các bước sau làm MẤT dạng gốc bên trong value (bản dịch ghi lại không còn nbsp/\r\n...),
+# chỉ bật khi chấp nhận được: 'newline' (\r\n, \r → \n), 'space' (khoảng trắng full-width/nbsp → ' '),
+# 'nfc' hoặc 'nfkc' (dạng Unicode). () = chỉ gom các value giống hệt nhau
+app.config['DEDUP_NORMALIZE'] = ('strip',)
 
 # Các định dạng file được phép
 ALLOWED_EXTENSIONS = {'xlsx', 'pptx', 'docx'}
@@ -125,29 +154,374 @@ def load_templates(lang='default'):
         return get_default_templates()
 
 
-def apply_glossary(extracted_data: dict, glossary_ids: list) -> dict:
+import sys as _sys
+import unicodedata as _unicodedata
+from collections import OrderedDict as _OrderedDict
+
+
+def _glossary_pattern(src: str):
+    """
+    Regex tìm src (case-insensitive, exact match):
+    dùng \\b nếu src bắt đầu/kết thúc bằng ký tự word; fallback lookaround nếu không.
     """
-    Thay thế các cụm từ trong extracted_data theo các file glossary được chọn.
+    escaped = re.escape(src)
+    prefix = r'\b' if re.match(r'\w', src[0])  else r'(?<![^\s])'
+    suffix = r'\b' if re.match(r'\w', src[-1]) else r'(?![^\s])'
+    return re.compile(prefix + escaped + suffix, re.IGNORECASE)
 
-    Logic:
-    - Với mỗi cặp (src, dst) trong glossary: tìm src (case-insensitive, exact match)
-      trong từng value của extracted_data, thay bằng dst.
-    - "Exact match" = cụm từ đứng độc lập, không phải substring nằm giữa ký tự chữ.
-      Dùng regex word-boundary \\b kết hợp re.IGNORECASE.
-    - Ưu tiên thay thế cụm dài trước (tránh thay một phần của cụm dài hơn).
-    - Nếu glossary_ids rỗng hoặc không có file nào, trả về nguyên extracted_data.
 
-    CSV format: cột A = ngôn ngữ đích (dst), cột B = ngôn ngữ gốc (src)
+class _GlossaryFoldTable(dict):
     """
-    if not glossary_ids:
-        return extracted_data
+    Bảng str.translate gộp các ký tự mà re.IGNORECASE coi là bằng nhau (I/i/ı/İ, ſ/s, ς/σ, ﬅ/ﬆ...):
+    NFKD → upper → NFKD → casefold, bỏ dấu kết hợp. Gộp thô hơn re (é ~ e) cũng không sao
+    vì match thật vẫn do regex quyết định. Ký tự được tính khi gặp lần đầu.
+    """
+
+    def __missing__(self, code):
+        ch = _unicodedata.normalize('NFKD', chr(code)).upper()
+        folded = _unicodedata.normalize('NFKD', ch).casefold()
+        folded = ''.join(c for c in folded if not _unicodedata.combining(c))
+        self[code] = folded
+        return folded
+
+
+_GLOSSARY_FOLD = _GlossaryFoldTable()
+
+
+class _GlossaryMatcher:
+    """
+    Áp dụng danh sách (src, dst) đã sắp theo thứ tự ưu tiên (cụm dài trước), kết quả
+    giống hệt chạy lần lượt _glossary_pattern(src).sub(dst, value) cho MỌI cặp:
+    - Aho-Corasick trên text đã fold (_GLOSSARY_FOLD) tìm trong MỘT lượt quét các src
+      có xuất hiện trong value; cặp không xuất hiện thì chắc chắn regex không match, bỏ qua
+    - Chỉ cặp ứng viên mới chạy regex thật (giữ nguyên \\b / lookaround và thứ tự ưu tiên);
+      value đổi sau một lần thay thì quét lại cho các cặp sau (dst có thể tạo ra src mới)
+    Regex của mỗi cặp chỉ compile khi lần đầu là ứng viên.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self._patterns = [None] * len(pairs)
+        # Trie: goto[(state << 21) | ord(ch)] → state; own[state]: index các cặp kết thúc tại state
+        goto = {}
+        own = [[]]
+        self._always = []     # src fold thành chuỗi rỗng (chỉ có dấu kết hợp): luôn là ứng viên
+        for idx, (src, _dst) in enumerate(pairs):
+            term = src.translate(_GLOSSARY_FOLD)
+            if not term:
+                self._always.append(idx)
+                continue
+            state = 0
+            for ch in term:
+                edge = (state << 21) | ord(ch)
+                nxt = goto.get(edge)
+                if nxt is None:
+                    nxt = goto[edge] = len(own)
+                    own.append([])
+                state = nxt
+            own[state].append(idx)
+
+        # Fail link + output link (state gần nhất trên chuỗi fail có own) theo BFS
+        children = {}
+        for edge, nxt in goto.items():
+            children.setdefault(edge >> 21, []).append((edge & 0x1FFFFF, nxt))
+        fail = [0] * len(own)
+        link = [0] * len(own)
+        level = [0]
+        while level:
+            next_level = []
+            for state in level:
+                for code, nxt in children.get(state, ()):
+                    if state:
+                        f = fail[state]
+                        while f and ((f << 21) | code) not in goto:
+                            f = fail[f]
+                        fail[nxt] = goto.get((f << 21) | code, 0)
+                    link[nxt] = fail[nxt] if own[fail[nxt]] else link[fail[nxt]]
+                    next_level.append(nxt)
+            level = next_level
+        self._goto, self._fail, self._own, self._link = goto, fail, own, link
+        # Dung lượng ước tính (cho LRU của _glossary_cache): trie + chuỗi; cộng thêm regex khi compile
+        self.nbytes = (
+            _sys.getsizeof(goto) + 64 * len(goto)
+            + _sys.getsizeof(own) + sum(_sys.getsizeof(out) for out in own)
+            + _sys.getsizeof(fail) + _sys.getsizeof(link) + _sys.getsizeof(pairs)
+            + sum(_sys.getsizeof(src) + _sys.getsizeof(dst) for src, dst in pairs)
+        )
+
+    def _candidates(self, value):
+        """Index các cặp có src (đã fold) là chuỗi con của value (đã fold)."""
+        goto, fail, own, link = self._goto, self._fail, self._own, self._link
+        found = set(self._always)
+        state = 0
+        for code in map(ord, value.translate(_GLOSSARY_FOLD)):
+            nxt = goto.get((state << 21) | code)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto.get((state << 21) | code)
+            state = nxt or 0
+            out = state if own[state] else link[state]
+            while out:
+                found.update(own[out])
+                out = link[out]
+        return found
+
+    def _pattern(self, idx):
+        pattern = self._patterns[idx]
+        if pattern is None:
+            pattern = self._patterns[idx] = _glossary_pattern(self.pairs[idx][0])
+            self.nbytes += _sys.getsizeof(pattern)
+        return pattern
+
+    def apply(self, value: str) -> str:
+        pending = sorted(self._candidates(value))
+        pos = 0
+        while pos < len(pending):
+            idx = pending[pos]
+            pos += 1
+            new_value = self._pattern(idx).sub(self.pairs[idx][1], value)
+            if new_value != value:
+                value = new_value
+                pending = sorted(j for j in self._candidates(value) if j > idx)
+                pos = 0
+        return value
+
+
+# ==================== GLOSSARY SQLITE STORE ====================
+# Backend tùy chọn (GLOSSARY_BACKEND='sqlite'): mỗi thuật ngữ là một dòng của bảng terms (thứ tự theo id),
+# index theo (glossary_id, src_norm, dst_norm) với *_norm = lower() — đúng key dedup của các route import,
+# nên merge chỉ tra index thay vì đọc/ghi lại cả glossary. Mỗi lần sửa đặt glossaries.version = time_ns()
+# để cache _GlossaryMatcher tự miss. Lần đầu tạo DB thì nạp các CSV đang có trong GLOSSARY_DIR; xuất ngược ra CSV
+# qua /api/glossaries/<gid>/export.
+
+import sqlite3 as _sqlite3
+from contextlib import contextmanager as _contextmanager
+
+_GLOSSARY_DB_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS glossaries (
+        id      TEXT PRIMARY KEY,
+        name    TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS terms (
+        id          INTEGER PRIMARY KEY,
+        glossary_id TEXT NOT NULL,
+        dst         TEXT NOT NULL,
+        src         TEXT NOT NULL,
+        dst_norm    TEXT NOT NULL,
+        src_norm    TEXT NOT NULL
+    )""",
+    'CREATE INDEX IF NOT EXISTS terms_glossary_norm ON terms (glossary_id, src_norm, dst_norm)',
+)
+_glossary_db_lock = threading.Lock()
+_glossary_db_ready = set()   # các đường dẫn DB đã kiểm tra schema trong process
+
+
+def _glossary_use_db():
+    return app.config['GLOSSARY_BACKEND'] == 'sqlite'
+
+
+def _glossary_csv_rows(f):
+    """Các dòng (dst, src) đã strip của file CSV glossary (cột A = đích, cột B = gốc), bỏ dòng rỗng."""
+    rows = []
+    for r in csv.reader(f):
+        if len(r) >= 2:
+            dst, src = r[0].strip(), r[1].strip()
+        elif len(r) == 1:
+            dst, src = r[0].strip(), ''
+        else:
+            continue
+        if dst or src:
+            rows.append((dst, src))
+    return rows
+
+
+@_contextmanager
+def _glossary_db(write=False):
+    """
+    Kết nối tới DB glossary (tạo schema + nạp CSV cũ ở lần đầu). write=True: chạy trong
+    BEGIN IMMEDIATE, commit khi thoát bình thường, rollback nếu lỗi.
+    """
+    path = app.config['GLOSSARY_DB_PATH']
+    conn = _sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        if path not in _glossary_db_ready:
+            with _glossary_db_lock:
+                if path not in _glossary_db_ready:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        if conn.execute('PRAGMA user_version').fetchone()[0] == 0:
+                            for statement in _GLOSSARY_DB_SCHEMA:
+                                conn.execute(statement)
+                            _glossary_db_import_dir(conn)
+                            conn.execute('PRAGMA user_version = 1')
+                        conn.execute('COMMIT')
+                    except BaseException:
+                        conn.execute('ROLLBACK')
+                        raise
+                    _glossary_db_ready.add(path)
+        if not write:
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+
+def _glossary_db_import_dir(conn):
+    """Nạp mọi glossary CSV đang có trong GLOSSARY_DIR vào DB (chạy một lần khi tạo DB)."""
+    for fname in sorted(os.listdir(GLOSSARY_DIR)):
+        if not fname.endswith('.csv'):
+            continue
+        gid = fname[:-4]
+        try:
+            with open(os.path.join(GLOSSARY_DIR, fname), 'r', encoding='utf-8-sig') as f:
+                rows = _glossary_csv_rows(f)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            print(f"Warning: Bỏ qua glossary {fname} khi tạo DB: {e}")
+            continue
+        _glossary_db_create(conn, gid, _glossary_read_name(gid), rows)
+
+
+def _glossary_db_insert(conn, gid, rows):
+    conn.executemany(
+        'INSERT INTO terms (glossary_id, dst, src, dst_norm, src_norm) VALUES (?, ?, ?, ?, ?)',
+        ((gid, dst, src, dst.lower(), src.lower()) for dst, src in rows),
+    )
+
+
+def _glossary_db_touch(conn, gid):
+    """Đổi version của glossary sau mỗi lần sửa."""
+    conn.execute('UPDATE glossaries SET version = ? WHERE id = ?', (time.time_ns(), gid))
+
+
+def _glossary_db_create(conn, gid, name, rows):
+    """Tạo glossary gid (ghi đè nếu đã có, như ghi lại file CSV cùng tên)."""
+    conn.execute('DELETE FROM terms WHERE glossary_id = ?', (gid,))
+    conn.execute(
+        'INSERT INTO glossaries (id, name, version) VALUES (?, ?, ?) '
+        'ON CONFLICT(id) DO UPDATE SET name = excluded.name, version = excluded.version',
+        (gid, name, time.time_ns()),
+    )
+    _glossary_db_insert(conn, gid, rows)
+
+
+def _glossary_db_name(conn, gid):
+    """Tên hiển thị của glossary, None nếu không có."""
+    row = conn.execute('SELECT name FROM glossaries WHERE id = ?', (gid,)).fetchone()
+    return row[0] if row else None
+
+
+def _glossary_db_rows(conn, gid):
+    """Các dòng (dst, src) của glossary theo thứ tự lưu."""
+    return conn.execute('SELECT dst, src FROM terms WHERE glossary_id = ? ORDER BY id', (gid,)).fetchall()
+
+
+def _glossary_db_count(conn, gid):
+    return conn.execute('SELECT COUNT(*) FROM terms WHERE glossary_id = ?', (gid,)).fetchone()[0]
+
+
+def _glossary_db_replace_rows(conn, gid, rows):
+    """
+    Thay nội dung glossary bằng rows, sửa tại chỗ theo vị trí: dòng không đổi giữ nguyên,
+    dòng khác thì UPDATE, phần dư thì DELETE/INSERT — sửa một thuật ngữ chỉ chạm một dòng.
+    """
+    existing = conn.execute('SELECT id, dst, src FROM terms WHERE glossary_id = ? ORDER BY id', (gid,)).fetchall()
+    changed = len(existing) != len(rows)
+    updates = []
+    for (term_id, old_dst, old_src), (dst, src) in zip(existing, rows):
+        if (old_dst, old_src) != (dst, src):
+            updates.append((dst, src, dst.lower(), src.lower(), term_id))
+    if updates:
+        conn.executemany('UPDATE terms SET dst = ?, src = ?, dst_norm = ?, src_norm = ? WHERE id = ?', updates)
+        changed = True
+    if len(existing) > len(rows):
+        conn.executemany('DELETE FROM terms WHERE id = ?', ((term_id,) for term_id, _dst, _src in existing[len(rows):]))
+    elif len(rows) > len(existing):
+        _glossary_db_insert(conn, gid, rows[len(existing):])
+    if changed:
+        _glossary_db_touch(conn, gid)
+
+
+def _glossary_db_merge(conn, gid, rows):
+    """Thêm các dòng (dst, src) chưa có (so theo lower() qua index). Trả (added, skipped)."""
+    seen = set()
+    new_rows = []
+    for dst, src in rows:
+        key = (src.lower(), dst.lower())
+        if key in seen or conn.execute(
+            'SELECT 1 FROM terms WHERE glossary_id = ? AND src_norm = ? AND dst_norm = ? LIMIT 1',
+            (gid, key[0], key[1]),
+        ).fetchone():
+            continue
+        seen.add(key)
+        new_rows.append((dst, src))
+    if new_rows:
+        _glossary_db_insert(conn, gid, new_rows)
+        _glossary_db_touch(conn, gid)
+    return len(new_rows), len(rows) - len(new_rows)
+
 
-    # Thu thập tất cả cặp (src, dst) từ các file glossary được chọn
+def _glossary_db_list(conn):
+    """Danh sách {id, name, rows} của mọi glossary, sắp theo id."""
+    return [
+        {'id': gid, 'name': name, 'rows': rows}
+        for gid, name, rows in conn.execute(
+            'SELECT g.id, g.name, COUNT(t.id) FROM glossaries g '
+            'LEFT JOIN terms t ON t.glossary_id = g.id GROUP BY g.id ORDER BY g.id'
+        )
+    ]
+
+
+# Cache _GlossaryMatcher trong process: key = các glossary id theo thứ tự chọn kèm (mtime_ns, size)
+# của từng file CSV (hoặc version trong DB glossary), nên sửa ở đâu cũng tự miss. Route sửa/xóa/import glossary gọi thêm
+# _glossary_cache_invalidate(gid) (phòng khi ghi lại trong cùng tick mtime với cùng kích thước).
+_glossary_cache = _OrderedDict()
+_glossary_cache_lock = threading.Lock()
+
+
+def _glossary_cache_invalidate(gid):
+    """Bỏ mọi entry có chứa glossary gid."""
+    with _glossary_cache_lock:
+        for key in [key for key in _glossary_cache if any(part[0] == gid for part in key)]:
+            del _glossary_cache[key]
+
+
+def _glossary_cache_evict():
+    """Bỏ entry ít dùng nhất cho tới khi thỏa cả giới hạn số entry và tổng dung lượng (gọi khi đang giữ lock)."""
+    max_entries = app.config['GLOSSARY_CACHE_MAX_ENTRIES']
+    max_bytes = app.config['GLOSSARY_CACHE_MAX_BYTES']
+    total = sum(matcher.nbytes for matcher in _glossary_cache.values() if matcher is not None)
+    while _glossary_cache and (len(_glossary_cache) > max_entries or total > max_bytes):
+        _key, matcher = _glossary_cache.popitem(last=False)
+        if matcher is not None:
+            total -= matcher.nbytes
+
+
+def _load_glossary_pairs(glossary_ids, stats):
+    """Đọc các cặp (src, dst) của các glossary (bỏ glossary không có trong stats), cụm dài trước."""
     pairs = []
+    if _glossary_use_db():
+        with _glossary_db() as conn:
+            for gid in glossary_ids:
+                if gid in stats:
+                    pairs.extend(conn.execute(
+                        "SELECT src, dst FROM terms WHERE glossary_id = ? AND src <> '' AND dst <> '' ORDER BY id",
+                        (gid,),
+                    ))
+        pairs.sort(key=lambda x: len(x[0]), reverse=True)
+        return pairs
     for gid in glossary_ids:
-        filepath = os.path.join(GLOSSARY_DIR, f'{gid}.csv')
-        if not os.path.exists(filepath):
+        if gid not in stats:
             continue
+        filepath = os.path.join(GLOSSARY_DIR, f'{gid}.csv')
         with open(filepath, 'r', encoding='utf-8-sig') as f:
             reader = csv.reader(f)
             for row in reader:
@@ -157,49 +531,156 @@ def apply_glossary(extracted_data: dict, glossary_ids: list) -> dict:
                     if src and dst:
                         pairs.append((src, dst))
 
-    if not pairs:
-        return extracted_data
-
     # Sắp xếp: cụm dài trước để tránh thay nhầm phần của cụm dài
     pairs.sort(key=lambda x: len(x[0]), reverse=True)
+    return pairs
 
-    # Build regex patterns (một lần, tái sử dụng)
-    # Dùng \b nếu src bắt đầu/kết thúc bằng ký tự word; fallback lookaround nếu không
-    def make_pattern(src: str):
-        escaped = re.escape(src)
-        prefix = r'\b' if re.match(r'\w', src[0])  else r'(?<![^\s])'
-        suffix = r'\b' if re.match(r'\w', src[-1]) else r'(?![^\s])'
-        return re.compile(prefix + escaped + suffix, re.IGNORECASE)
 
-    compiled = [(make_pattern(src), dst) for src, dst in pairs]
+def get_glossary_matcher(glossary_ids):
+    """_GlossaryMatcher của các glossary được chọn (qua cache), hoặc None nếu không có cặp nào."""
+    stats = {}
+    if _glossary_use_db():
+        with _glossary_db() as conn:
+            for gid in glossary_ids:
+                row = conn.execute('SELECT version FROM glossaries WHERE id = ?', (gid,)).fetchone()
+                if row:
+                    stats[gid] = ('db', row[0])
+    else:
+        for gid in glossary_ids:
+            try:
+                st = os.stat(os.path.join(GLOSSARY_DIR, f'{gid}.csv'))
+            except OSError:
+                continue
+            stats[gid] = (st.st_mtime_ns, st.st_size)
+    key = tuple((gid, stats.get(gid)) for gid in glossary_ids)
+    with _glossary_cache_lock:
+        if key in _glossary_cache:
+            _glossary_cache.move_to_end(key)
+            return _glossary_cache[key]
+
+    pairs = _load_glossary_pairs(glossary_ids, stats)
+    matcher = _GlossaryMatcher(pairs) if pairs else None
+    with _glossary_cache_lock:
+        _glossary_cache[key] = matcher
+        _glossary_cache.move_to_end(key)
+        _glossary_cache_evict()
+    return matcher
 
-    # Áp dụng thay thế lên từng value
-    result = {}
-    for key, value in extracted_data.items():
-        if not isinstance(value, str):
-            result[key] = value
-            continue
-        for pattern, dst in compiled:
-            value = pattern.sub(dst, value)
-        result[key] = value
 
-    return result
+def apply_glossary(extracted_data: dict, glossary_ids: list) -> dict:
+    """Như apply_glossary_grouped nhưng chỉ trả về extracted_data đã áp glossary."""
+    return apply_glossary_grouped(extracted_data, glossary_ids)[0]
+
+
+def apply_glossary_grouped(extracted_data: dict, glossary_ids: list, value_to_keys=None):
+    """
+    Thay thế các cụm từ trong extracted_data theo các glossary được chọn.
+
+    Logic:
+    - Với mỗi cặp (src, dst) trong glossary: tìm src (case-insensitive, exact match)
+      trong từng value của extracted_data, thay bằng dst. Value không phải str giữ nguyên.
+    - "Exact match" = cụm từ đứng độc lập, không phải substring nằm giữa ký tự chữ.
+      Dùng regex word-boundary \\b kết hợp re.IGNORECASE.
+    - Ưu tiên thay thế cụm dài trước (tránh thay một phần của cụm dài hơn).
+    - Chỉ chạy regex cho các cặp mà _GlossaryMatcher thấy có xuất hiện trong value.
+    - Matcher được cache trong process theo (glossary id, mtime, size) của từng file
+      (hoặc version trong DB glossary).
+    - Glossary chỉ chạy MỘT lần cho mỗi value khác nhau, kết quả fan-out lại về từng key.
+    - Nếu glossary_ids rỗng hoặc không có glossary nào, trả về nguyên extracted_data.
+
+    CSV format: cột A = ngôn ngữ đích (dst), cột B = ngôn ngữ gốc (src)
+
+    value_to_keys: nhóm {value: [keys]} đã gom sẵn lúc extract, hoặc None/{} để tự gom.
+    Returns: (extracted_data đã áp glossary, value_to_keys mới cho build_dedup_data —
+              None khi hai value khác nhau thành giống nhau sau glossary, cần gom lại)
+    """
+    matcher = get_glossary_matcher(glossary_ids) if glossary_ids else None
+    if matcher is None:
+        return extracted_data, value_to_keys
+
+    if not value_to_keys:
+        value_to_keys = {}
+        for key, value in extracted_data.items():
+            if value not in value_to_keys:
+                value_to_keys[value] = []
+            value_to_keys[value].append(key)
+
+    # Áp dụng thay thế một lần cho mỗi value (non-str giữ nguyên)
+    mapped = {value: matcher.apply(value) if isinstance(value, str) else value for value in value_to_keys}
+    result = {
+        key: mapped[value] if isinstance(value, str) else value
+        for key, value in extracted_data.items()
+    }
+
+    if len(set(mapped.values())) != len(mapped):
+        return result, None
+    return result, {mapped[value]: keys for value, keys in value_to_keys.items()}
+
 
+# Khoảng trắng "lạ" coi như space thường khi gom dedup (bước 'space')
+_DEDUP_SPACE_TABLE = dict.fromkeys(
+    [0x00A0, 0x1680, 0x202F, 0x205F, 0x3000] + list(range(0x2000, 0x200B)), ' '
+)
 
-def build_dedup_data(extracted_data, chunk_size=400):
+
+def _dedup_normalize(value, steps):
+    """Dạng chuẩn của value dùng làm key gom dedup (non-str giữ nguyên)."""
+    if not isinstance(value, str):
+        return value
+    if 'newline' in steps:
+        value = value.replace('\r\n', '\n').replace('\r', '\n')
+    if 'space' in steps:
+        value = value.translate(_DEDUP_SPACE_TABLE)
+    if 'nfkc' in steps:
+        value = _unicodedata.normalize('NFKC', value)
+    elif 'nfc' in steps:
+        value = _unicodedata.normalize('NFC', value)
+    if 'strip' in steps:
+        value = value.strip()
+    return value
+
+
+def _dedup_affixes(value):
+    """(khoảng trắng đầu, khoảng trắng cuối) của value gốc; value toàn khoảng trắng tính hết vào phần đầu."""
+    core_start = len(value) - len(value.lstrip())
+    rest = value[core_start:]
+    return value[:core_start], rest[len(rest.rstrip()):]
+
+
+def build_dedup_data(extracted_data, chunk_size=400, value_to_keys=None, normalize=None):
     """
-    Gộp các keys có cùng value để giảm số lượng cần dịch.
+    Gộp các keys có cùng value (sau chuẩn hóa DEDUP_NORMALIZE) để giảm số lượng cần dịch.
+    value_to_keys: nhóm {value: [keys]} đã gom sẵn lúc extract (theo thứ tự xuất hiện),
+                   hoặc None để gom từ extracted_data.
+    normalize: các bước chuẩn hóa, None = app.config['DEDUP_NORMALIZE'].
     Returns: (dedup_files, mapping, stats)
       - dedup_files: list of {name, content} – các chunk dedup (giống format files thường)
-      - mapping: {dedup_key: [orig_key1, orig_key2, ...]}
+      - mapping: {dedup_key: [orig_key1, orig_key2, ...]}; key có khoảng trắng đầu/cuối bị
+                 'strip' bỏ đi được ghi dạng [orig_key, đầu, cuối] để expand khôi phục
       - stats: {total, unique, saved, percent_saved}
     """
     # Group keys by value (giữ order)
-    value_to_keys = {}
-    for key, value in extracted_data.items():
-        if value not in value_to_keys:
-            value_to_keys[value] = []
-        value_to_keys[value].append(key)
+    if value_to_keys is None:
+        value_to_keys = {}
+        for key, value in extracted_data.items():
+            if value not in value_to_keys:
+                value_to_keys[value] = []
+            value_to_keys[value].append(key)
+
+    # Gộp tiếp các value trùng nhau sau chuẩn hóa (dedup_N theo lần xuất hiện đầu của nhóm)
+    steps = app.config['DEDUP_NORMALIZE'] if normalize is None else normalize
+    if steps:
+        strip = 'strip' in steps
+        groups = {}
+        for value, keys in value_to_keys.items():
+            norm = _dedup_normalize(value, steps)
+            group = groups.setdefault(norm, [])
+            if strip and isinstance(value, str) and value.strip() != value:
+                prefix, suffix = _dedup_affixes(value)
+                group.extend([key, prefix, suffix] for key in keys)
+            else:
+                group.extend(keys)
+        value_to_keys = groups
 
     # Build dedup dict và mapping
     dedup_data = {}
@@ -231,7 +712,8 @@ def build_dedup_data(extracted_data, chunk_size=400):
 
 def expand_dedup_data(json_data, session_folder):
     """
-    Mở rộng dedup JSON (dedup_N → value) thành keys gốc dựa trên mapping đã lưu.
+    Mở rộng dedup JSON (dedup_N → value) thành keys gốc dựa trên mapping đã lưu;
+    key dạng [orig_key, đầu, cuối] được gắn lại khoảng trắng đầu/cuối gốc quanh bản dịch.
     Nếu không tìm thấy mapping file thì trả về nguyên.
     """
     mapping_path = os.path.join(session_folder, 'dedup_mapping.json')
@@ -244,6 +726,11 @@ def expand_dedup_data(json_data, session_folder):
         for key, value in json_data.items():
             if key.startswith('dedup_') and key in mapping:
                 for orig_key in mapping[key]:
+                    if isinstance(orig_key, list):
+                        orig_key, prefix, suffix = orig_key
+                        if isinstance(value, str):
+                            expanded[orig_key] = prefix + value.strip() + suffix
+                            continue
                     expanded[orig_key] = value
             else:
                 expanded[key] = value  # key thường, giữ nguyên
@@ -252,7 +739,73 @@ def expand_dedup_data(json_data, session_folder):
         return json_data
 
 
-def stream_extract(filepath, original_filename, glossary_ids, session_folder, color_filter=None, proofread_mode=False):
+# ==================== EXTRACT PROGRESS ====================
+
+class _ExtractProgress:
+    """
+    Theo dõi tiến độ trích xuất và gọi callback(info) tối đa mỗi `interval` giây,
+    để việc báo tiến độ không làm chậm vòng lặp nóng (mỗi lần advance chỉ cộng số
+    và đọc đồng hồ).
+    - work: khối lượng đã biết trước (byte của các part XML, số slide, số đoạn...)
+      → dùng để tính tỉ lệ hoàn thành và ETA.
+    - items: số text đã lấy được → ngoại suy ra tổng ước tính theo tỉ lệ work.
+    info = {'section', 'done', 'total', 'rate', 'eta', 'fraction'}
+    """
+
+    def __init__(self, callback, total_work, interval=0.5):
+        self.callback = callback
+        self.total_work = max(total_work, 1)
+        self.interval = interval
+        self.section = ''
+        self.items = 0
+        self.work_done = 0
+        self.position = None   # callable → work đã xong trong part đang đọc (vd fp.tell)
+        self.started = time.monotonic()
+        self.next_emit = self.started + interval
+
+    def begin(self, section, position=None):
+        self.section = section
+        self.position = position
+
+    def advance(self, items=0, work=0):
+        self.items += items
+        self.work_done += work
+        now = time.monotonic()
+        if now >= self.next_emit:
+            self.next_emit = now + self.interval
+            self.emit(now)
+
+    def end_part(self, work, items=0):
+        """Kết thúc part hiện tại: cộng toàn bộ work của part, bỏ position."""
+        self.position = None
+        self.advance(items, work)
+
+    def finish(self):
+        self.position = None
+        self.work_done = self.total_work
+        self.emit(time.monotonic())
+
+    def emit(self, now):
+        work = self.work_done
+        if self.position is not None:
+            try:
+                work += self.position()
+            except (OSError, ValueError):
+                pass
+        fraction = min(work / self.total_work, 1.0)
+        elapsed = max(now - self.started, 1e-6)
+        self.callback({
+            'section': self.section,
+            'done': self.items,
+            'total': round(self.items / fraction) if fraction > 0 else None,
+            'rate': round(self.items / elapsed, 1),
+            'eta': round(elapsed * (1 - fraction) / fraction, 1) if fraction > 0 else None,
+            'fraction': round(fraction, 4),
+        })
+
+
+def stream_extract(filepath, original_filename, glossary_ids, session_folder, color_filter=None, proofread_mode=False,
+                   selected_sheets=None):
     """
     Generator cho SSE progress events khi trích xuất file.
     Yields chuỗi SSE format: data: {json}\n\n
@@ -267,36 +820,48 @@ def stream_extract(filepath, original_filename, glossary_ids, session_folder, co
 
         yield _evt('reading', 10, message='Đang đọc file...')
 
-        # Bước 1: Trích xuất text
-        if original_ext == 'xlsx':
-            workbook = load_workbook(filepath)
-            extracted_data = {}
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                for row in sheet.iter_rows():
-                    for cell in row:
-                        if cell.value is None:
-                            continue
-                        if isinstance(cell.value, str) and not cell.value.startswith('='):
-                            if color_filter is None or (_get_font_rgb_xlsx(cell) or '000000') in color_filter:
-                                extracted_data[f"{sheet_name}!{cell.coordinate}"] = cell.value
-            extracted_data.update(extract_xlsx_shapes(filepath))
-            workbook.close()
-        elif original_ext == 'pptx':
-            extracted_data = extract_text_from_pptx(filepath, color_filter)
-        elif original_ext == 'docx':
-            extracted_data = extract_text_from_docx(filepath, color_filter)
-        else:
+        # Bước 1: Trích xuất text — chạy ở thread riêng, tiến độ chuyển qua queue
+        # để generator forward thành SSE ngay khi engine báo (10% → 40%)
+        if original_ext not in ALLOWED_EXTENSIONS:
             yield _evt('error', 0, error=f'Không hỗ trợ định dạng .{original_ext}')
             return
 
-        if proofread_mode:
-            extracted_data = _filter_proofread_extract_data(extracted_data)
+        progress_queue = queue.Queue()
+        outcome = {}
+        value_groups = {}
+
+        def _run():
+            try:
+                outcome['data'] = extract_cached(filepath, original_ext, color_filter, selected_sheets,
+                                                 proofread_mode=proofread_mode, progress=progress_queue.put,
+                                                 value_groups=value_groups)
+            except Exception as exc:
+                outcome['error'] = exc
+            finally:
+                progress_queue.put(None)
+
+        threading.Thread(target=_run, daemon=True).start()
+        while True:
+            info = progress_queue.get()
+            if info is None:
+                break
+            message = f"Đang đọc {info['section']}: {info['done']}"
+            if info['total'] is not None:
+                message += f"/~{info['total']}"
+            message += f" mục, {info['rate']}/s"
+            if info['eta'] is not None:
+                message += f", còn ~{int(info['eta'])}s"
+            yield _evt('reading', 10 + int(30 * info['fraction']), message=message, progress=info)
+
+        if 'error' in outcome:
+            raise outcome['error']
+        extracted_data = outcome['data']
 
         yield _evt('chunking', 40, message='Đang áp dụng glossary...')
 
         if glossary_ids:
-            extracted_data = apply_glossary(extracted_data, glossary_ids)
+            # Glossary chạy theo value duy nhất rồi fan-out; value_groups đi theo sang dedup
+            extracted_data, value_groups = apply_glossary_grouped(extracted_data, glossary_ids, value_groups)
 
         yield _evt('chunking', 60, message='Đang tạo file JSON...')
 
@@ -354,7 +919,7 @@ def stream_extract(filepath, original_filename, glossary_ids, session_folder, co
         yield _evt('writing', 88, message='Đang tính dedup...')
 
         # Dedup
-        dedup_files, dedup_mapping, dedup_stats = build_dedup_data(extracted_data, CHUNK_SIZE)
+        dedup_files, dedup_mapping, dedup_stats = build_dedup_data(extracted_data, CHUNK_SIZE, value_groups or None)
         dedup_map_path = os.path.join(session_folder, 'dedup_mapping.json')
         with open(dedup_map_path, 'w', encoding='utf-8') as f:
             json.dump(dedup_mapping, f, ensure_ascii=False, indent=2)
@@ -398,17 +963,6 @@ def _get_rgb6(cell) -> str:
 
 # ==================== COLOR FILTER HELPERS ====================
 
-def _get_font_rgb_xlsx(cell) -> str:
-    """Đọc màu chữ HEX 6 ký tự từ openpyxl cell. Trả '' nếu không xác định."""
-    try:
-        color = cell.font.color if (cell.font and cell.font.color) else None
-        if color and color.type == 'rgb' and color.rgb:
-            return str(color.rgb).upper()[-6:]  # lấy 6 ký tự cuối của ARGB
-    except Exception:
-        pass
-    return ''
-
-
 def _get_font_rgb_pptx(run) -> str:
     """Đọc màu chữ HEX 6 ký tự từ python-pptx run. Trả '' nếu không xác định."""
     try:
@@ -441,6 +995,21 @@ def _normalize_color_filter(color_list: list) -> set:
     return result
 
 
+def _parse_selected_sheets(form):
+    """
+    Đọc danh sách sheet được chọn từ form-data: nhiều field selected_sheets,
+    hoặc một field chứa JSON array (tên sheet có thể chứa dấu phẩy).
+    Trả về list tên sheet, hoặc None (tất cả).
+    """
+    values = [v for v in form.getlist('selected_sheets') if v.strip()]
+    if len(values) == 1 and values[0].lstrip().startswith('['):
+        try:
+            values = [str(v) for v in json.loads(values[0])]
+        except ValueError:
+            pass
+    return values or None
+
+
 _PROOF_URL_RE = re.compile(r'^(?:https?://|ftp://|www\.)\S+$', re.IGNORECASE)
 _PROOF_EMAIL_RE = re.compile(r'^[^\s@]+@[^\s@]+\.[^\s@]+$')
 _PROOF_DATE_RE = re.compile(r'^\d{1,4}[\-/]\d{1,2}[\-/]\d{1,4}$')
@@ -480,30 +1049,6 @@ def _filter_proofread_extract_data(extracted_data: dict) -> dict:
     return filtered
 
 
-def _pptx_shape_matches_color_filter(shape, color_filter: set) -> bool:
-    """
-    Trả về True nếu bất kỳ run nào trong text_frame của shape khớp color_filter.
-    Nếu không có run nào → match khi '000000' trong filter (màu mặc định).
-    """
-    if not hasattr(shape, 'text_frame'):
-        return True  # không kiểm tra được → include mặc định
-    all_runs = [run for para in shape.text_frame.paragraphs for run in para.runs]
-    if not all_runs:
-        return '000000' in color_filter
-    return any((_get_font_rgb_pptx(run) or '000000') in color_filter for run in all_runs)
-
-
-def _pptx_cell_matches_color_filter(cell, color_filter: set) -> bool:
-    """Trả về True nếu bất kỳ run nào trong table cell của pptx khớp color_filter."""
-    tf = getattr(cell, 'text_frame', None)
-    if tf is None:
-        return True
-    all_runs = [run for para in tf.paragraphs for run in para.runs]
-    if not all_runs:
-        return '000000' in color_filter
-    return any((_get_font_rgb_pptx(run) or '000000') in color_filter for run in all_runs)
-
-
 def _docx_para_matches_color_filter(para, color_filter: set) -> bool:
     """Trả về True nếu bất kỳ run nào trong paragraph docx khớp color_filter."""
     if not para.runs:
@@ -511,19 +1056,6 @@ def _docx_para_matches_color_filter(para, color_filter: set) -> bool:
     return any((_get_font_rgb_docx(run) or '000000') in color_filter for run in para.runs)
 
 
-def _docx_cell_matches_color_filter(cell, color_filter: set) -> bool:
-    """Trả về True nếu bất kỳ run nào trong table cell docx khớp color_filter."""
-    has_any_run = False
-    for para in cell.paragraphs:
-        for run in para.runs:
-            has_any_run = True
-            if (_get_font_rgb_docx(run) or '000000') in color_filter:
-                return True
-    if not has_any_run:
-        return '000000' in color_filter
-    return False
-
-
 def _collect_pptx_shape_colors(shape, colors: set):
     """Thu thập màu chữ từ tất cả runs trong shape pptx (đệ quy cho grouped shapes)."""
     if hasattr(shape, 'text_frame'):
@@ -917,7 +1449,12 @@ def get_session_folder():
     return session_folder
 
 def cleanup_old_sessions():
-    """Xóa tất cả folder của các phiên từ hôm qua trở về trước"""
+    """Xóa tất cả folder của các phiên (và entry extract cache) từ hôm qua trở về trước"""
+    # Cache trích xuất giữ text tài liệu → hết hạn cùng quy tắc với folder phiên
+    try:
+        _extract_cache_cleanup_old()
+    except Exception as e:
+        print(f"Lỗi khi cleanup extract cache: {e}")
     try:
         upload_folder = app.config['UPLOAD_FOLDER']
         if not os.path.exists(upload_folder):
@@ -1009,86 +1546,70 @@ def internal_server_error(error):
         return jsonify({'error': f'Lỗi máy chủ: {str(error)}'}), 500
     return str(error), 500
 
-def extract_text_from_shape(shape, shape_path, extracted_data, color_filter=None):
+class _PptxShapeIndex:
     """
-    Hàm đệ quy để trích xuất text từ shape, bao gồm cả grouped shapes
-    shape_path: đường dẫn đến shape, ví dụ "Shape1" hoặc "Shape1_2_3"
-    color_filter: set HEX strings hoặc None (không lọc)
+    Index địa chỉ shape của một Presentation, dựng trong MỘT lượt duyệt slide/shape
+    (cùng thứ tự với extract_text_from_pptx):
+    - shapes: (slide, (Y, Z, ...)) → shape của key "SlideX!ShapeY_Z"
+    - cells:  (slide, (Y, Z, ...), row, col) → table cell của key "...!Table_RxCy" (row/col 0-based)
+    proof-map tra key O(1) thay vì prs.slides[i] / shapes[j] cho từng key
+    (mỗi lần index như vậy python-pptx dựng lại cả list proxy).
     """
-    # Trích xuất text từ text frame của shape hiện tại
-    if hasattr(shape, "text") and shape.text:
-        text_content = shape.text.strip()
-        if text_content:  # Chỉ lấy nội dung không rỗng
-            if color_filter is None or _pptx_shape_matches_color_filter(shape, color_filter):
-                extracted_data[shape_path] = text_content
-    
-    # Trích xuất text từ table nếu có
-    if hasattr(shape, "has_table") and shape.has_table:
-        table = shape.table
-        for row_idx, row in enumerate(table.rows, start=1):
-            for col_idx, cell in enumerate(row.cells, start=1):
-                if cell.text.strip():
-                    if color_filter is None or _pptx_cell_matches_color_filter(cell, color_filter):
-                        key = f"{shape_path}!Table_R{row_idx}C{col_idx}"
-                        extracted_data[key] = cell.text.strip()
-    
-    # Kiểm tra xem shape có phải là GroupShape không (chứa các shape con)
-    if hasattr(shape, "shapes"):
-        # Đây là grouped shape, duyệt qua các shape con
-        for child_idx, child_shape in enumerate(shape.shapes, start=1):
-            child_path = f"{shape_path}_{child_idx}"
-            extract_text_from_shape(child_shape, child_path, extracted_data, color_filter)
 
-def extract_text_from_pptx(filepath, color_filter=None):
-    """
-    Trích xuất text từ file PPTX, bao gồm cả text trong grouped shapes
-    Trả về dictionary với format: {"SlideX!ShapeY": "Content"}
-    Với nested shapes: {"SlideX!ShapeY_Z": "Content"} (Z là shape con)
-    color_filter: set HEX strings hoặc None (không lọc)
-    """
-    extracted_data = {}
-    prs = Presentation(filepath)
-    
-    for slide_idx, slide in enumerate(prs.slides, start=1):
-        for shape_idx, shape in enumerate(slide.shapes, start=1):
-            shape_path = f"Slide{slide_idx}!Shape{shape_idx}"
-            extract_text_from_shape(shape, shape_path, extracted_data, color_filter)
-    
-    return extracted_data
+    def __init__(self, prs):
+        self.shapes = {}
+        self.cells = {}
+        for slide_no, slide in enumerate(prs.slides, start=1):
+            for shape_no, shape in enumerate(slide.shapes, start=1):
+                self._add(slide_no, (shape_no,), shape)
+
+    def _add(self, slide_no, path, shape):
+        self.shapes[(slide_no, path)] = shape
+        if hasattr(shape, 'has_table') and shape.has_table:
+            for row_idx, row in enumerate(shape.table.rows):
+                for col_idx, cell in enumerate(row.cells):
+                    self.cells[(slide_no, path, row_idx, col_idx)] = cell
+        if hasattr(shape, 'shapes'):
+            for child_no, child in enumerate(shape.shapes, start=1):
+                self._add(slide_no, path + (child_no,), child)
+
+    @staticmethod
+    def parse_key(key):
+        """
+        Parse key format:
+        "SlideX!ShapeY" hoặc "SlideX!ShapeY_Z" (nested)
+        hoặc "SlideX!ShapeY!Table_RxCy" hoặc "SlideX!ShapeY_Z!Table_RxCy"
+        → (slide, (Y, Z, ...), (row, col) 0-based hoặc None); key không hợp lệ → None
+        """
+        parts = key.split('!')
+        if len(parts) < 2 or not parts[0].startswith('Slide') or not parts[1].startswith('Shape'):
+            return None
+        try:
+            slide_no = int(parts[0].replace('Slide', ''))
+            # Tách các indices: "Shape2_3_1" -> (2, 3, 1)
+            path = tuple(int(idx) for idx in parts[1].replace('Shape', '').split('_'))
+            table_pos = None
+            if len(parts) == 3 and parts[2].startswith('Table_R'):
+                table_part = parts[2].replace('Table_R', '').split('C')
+                table_pos = (int(table_part[0]) - 1, int(table_part[1]) - 1)
+        except (ValueError, IndexError):
+            return None
+        return slide_no, path, table_pos
+
+    def text_frame(self, key):
+        """Text frame mà key trỏ tới (shape hoặc table cell), hoặc None."""
+        parsed = self.parse_key(key)
+        if parsed is None:
+            return None
+        slide_no, path, table_pos = parsed
+        if table_pos is not None:
+            cell = self.cells.get((slide_no, path) + table_pos)
+            return cell.text_frame if cell is not None else None
+        shape = self.shapes.get((slide_no, path))
+        if shape is None or not hasattr(shape, 'text_frame'):
+            return None
+        return shape.text_frame
 
-def inject_text_to_shape(shape, shape_indices, translated_value, is_table_cell=False, table_pos=None):
-    """
-    Hàm đệ quy để nạp text vào shape, bao gồm cả grouped shapes
-    shape_indices: list các index để navigate đến shape đúng, ví dụ [2, 3] cho Shape2_3
-    is_table_cell: có phải là table cell không
-    table_pos: tuple (row_idx, col_idx) nếu là table cell
-    """
-    # Nếu là shape cuối cùng trong path
-    if len(shape_indices) == 0:
-        if is_table_cell and table_pos:
-            # Nạp vào table cell - giữ nguyên định dạng
-            row_idx, col_idx = table_pos
-            if hasattr(shape, "has_table") and shape.has_table:
-                table = shape.table
-                if row_idx < len(table.rows) and col_idx < len(table.rows[row_idx].cells):
-                    cell = table.rows[row_idx].cells[col_idx]
-                    # Thay thế text trong từng paragraph/run để giữ định dạng
-                    if cell.text_frame:
-                        replace_text_keep_format(cell.text_frame, translated_value)
-        else:
-            # Nạp vào text frame của shape - giữ nguyên định dạng
-            if hasattr(shape, "text_frame") and shape.text_frame:
-                replace_text_keep_format(shape.text_frame, translated_value)
-        return True
-    
-    # Navigate đến shape con
-    if hasattr(shape, "shapes"):
-        next_idx = shape_indices[0]
-        if next_idx <= len(shape.shapes):
-            child_shape = shape.shapes[next_idx - 1]  # Chuyển từ 1-indexed sang 0-indexed
-            return inject_text_to_shape(child_shape, shape_indices[1:], translated_value, is_table_cell, table_pos)
-    
-    return False
 
 def replace_text_keep_format(text_frame, new_text):
     """
@@ -1122,71 +1643,92 @@ def replace_text_keep_format(text_frame, new_text):
     # Gán text mới vào run đầu tiên (giữ nguyên định dạng)
     first_run.text = new_text
 
-def inject_text_to_pptx(filepath, json_data):
+# ==================== ZIP PASSTHROUGH WRITER ====================
+# Ghi lại package OOXML (xlsx/pptx/docx) mà chỉ nén lại các part đã patch:
+# part không đổi được copy nguyên byte đã nén từ file gốc (không giải nén/nén lại),
+# output ghi thẳng ra đĩa theo từng entry.
+
+import struct as _struct
+
+_ZIP_COPY_CHUNK = 1024 * 1024
+
+
+def _zip_entry_info(original):
+    """ZipInfo mới giữ tên, thời gian, kiểu nén và thuộc tính của entry gốc."""
+    zi = zipfile.ZipInfo(original.filename, original.date_time)
+    zi.compress_type = original.compress_type
+    zi.external_attr = original.external_attr
+    zi.create_system = original.create_system
+    return zi
+
+
+def _zip_copy_raw(z_in, original, z_out):
     """
-    Nạp text đã dịch vào file PPTX, bao gồm cả grouped shapes
+    Copy một entry từ z_in sang z_out ở dạng đã nén (byte-for-byte):
+    local header mới + dữ liệu nén gốc, CRC/size lấy từ central directory.
+    Entry mã hóa không hỗ trợ -> False (caller tự ghi lại bằng writestr).
     """
-    prs = Presentation(filepath)
-    
-    for key, translated_value in json_data.items():
-        try:
-            # Parse key format: 
-            # "SlideX!ShapeY" hoặc "SlideX!ShapeY_Z" (nested) 
-            # hoặc "SlideX!ShapeY!Table_RxCy" hoặc "SlideX!ShapeY_Z!Table_RxCy"
-            if '!' not in key:
-                continue
-            
-            parts = key.split('!')
-            if len(parts) < 2:
-                continue
-            
-            # Lấy slide index
-            slide_part = parts[0]
-            if not slide_part.startswith('Slide'):
-                continue
-            slide_idx = int(slide_part.replace('Slide', '')) - 1
-            
-            if slide_idx >= len(prs.slides):
-                continue
-            
-            slide = prs.slides[slide_idx]
-            
-            # Parse shape path: "Shape2" hoặc "Shape2_3_1" (nested)
-            shape_part = parts[1]
-            if not shape_part.startswith('Shape'):
-                continue
-            
-            # Tách các indices: "Shape2_3_1" -> [2, 3, 1]
-            shape_str = shape_part.replace('Shape', '')
-            shape_indices = [int(idx) for idx in shape_str.split('_')]
-            
-            # Lấy shape đầu tiên (top-level shape)
-            first_shape_idx = shape_indices[0] - 1  # Chuyển sang 0-indexed
-            if first_shape_idx >= len(slide.shapes):
+    if original.flag_bits & 0x1:
+        return False
+    fp_in = z_in.fp
+    fp_in.seek(original.header_offset)
+    header = fp_in.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        return False
+    name_len, extra_len = _struct.unpack('<HH', header[26:30])
+    fp_in.seek(original.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+
+    zi = _zip_entry_info(original)
+    zi.flag_bits = original.flag_bits & ~0x08   # CRC/size ghi luôn trong local header
+    zi.CRC = original.CRC
+    zi.compress_size = original.compress_size
+    zi.file_size = original.file_size
+    zip64 = zi.file_size > zipfile.ZIP64_LIMIT or zi.compress_size > zipfile.ZIP64_LIMIT
+
+    fp_out = z_out.fp
+    zi.header_offset = fp_out.tell()
+    fp_out.write(zi.FileHeader(zip64))
+    remaining = original.compress_size
+    while remaining > 0:
+        chunk = fp_in.read(min(_ZIP_COPY_CHUNK, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f'Entry bị cắt cụt: {original.filename}')
+        fp_out.write(chunk)
+        remaining -= len(chunk)
+    z_out.filelist.append(zi)
+    z_out.NameToInfo[zi.filename] = zi
+    z_out.start_dir = fp_out.tell()
+    z_out._didModify = True
+    return True
+
+
+def _zip_rewrite(z_in, output_filepath, patched):
+    """
+    Ghi package mới theo đúng thứ tự entry của z_in.
+    patched: {part_name: bytes | callable(fp)} — chỉ các part này được nén lại; còn lại copy raw.
+    callable nhận file-like ghi thẳng vào entry output (part patch dạng stream).
+    Part trong patched mà không có trong gốc được thêm vào cuối.
+    """
+    written = set()
+    with zipfile.ZipFile(output_filepath, 'w') as z_out:
+        for original in z_in.infolist():
+            name = original.filename
+            if name in written:
                 continue
-            
-            shape = slide.shapes[first_shape_idx]
-            
-            # Kiểm tra xem có phải table cell không
-            is_table_cell = False
-            table_pos = None
-            
-            if len(parts) == 3 and parts[2].startswith('Table_R'):
-                # Parse table cell position
-                is_table_cell = True
-                table_part = parts[2].replace('Table_R', '').split('C')
-                row_idx = int(table_part[0]) - 1
-                col_idx = int(table_part[1]) - 1
-                table_pos = (row_idx, col_idx)
-            
-            # Navigate và nạp text (bỏ qua index đầu tiên vì đã lấy shape rồi)
-            inject_text_to_shape(shape, shape_indices[1:], translated_value, is_table_cell, table_pos)
-            
-        except (ValueError, IndexError, AttributeError) as e:
-            # Bỏ qua các key không hợp lệ
-            continue
-    
-    return prs
+            if name in patched:
+                content = patched[name]
+                if callable(content):
+                    zi = _zip_entry_info(original)
+                    with z_out.open(zi, 'w', force_zip64=original.file_size > zipfile.ZIP64_LIMIT // 2) as fp_out:
+                        content(fp_out)
+                else:
+                    z_out.writestr(_zip_entry_info(original), content)
+            elif not _zip_copy_raw(z_in, original, z_out):
+                z_out.writestr(_zip_entry_info(original), z_in.read(name))
+            written.add(name)
+        for name, content in patched.items():
+            if name not in written:
+                z_out.writestr(name, content)
 
 # ==================== XLSX SHAPE / OBJECT SUPPORT ====================
 # Namespaces dùng trong drawing XML của xlsx
@@ -1196,69 +1738,6 @@ _NS_R   = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
 _NS_WB  = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
 
 
-def _xlsx_get_sheet_drawing_map(z):
-    """
-    Từ ZipFile đang mở, trả về dict: sheet_name → list các đường dẫn drawing XML
-    Ví dụ: {'Sheet1': ['xl/drawings/drawing1.xml']}
-    """
-    names_set = set(z.namelist())
-
-    # Đọc workbook.xml để lấy tên sheet và rId
-    wb_xml = z.read('xl/workbook.xml')
-    wb_root = _etree.fromstring(wb_xml)
-
-    # Đọc rels của workbook để map rId → target file
-    wb_rels_xml = z.read('xl/_rels/workbook.xml.rels')
-    wb_rels_root = _etree.fromstring(wb_rels_xml)
-    rid_to_target = {rel.get('Id'): rel.get('Target') for rel in wb_rels_root}
-
-    # Thu thập (sheet_name, sheet_path)
-    sheet_info = []
-    for sheet_el in wb_root.iter(f'{{{_NS_WB}}}sheet'):
-        name = sheet_el.get('name')
-        rid  = sheet_el.get(f'{{{_NS_R}}}id')
-        target = rid_to_target.get(rid, '')
-        # Chuẩn hóa path: "worksheets/sheet1.xml" → "xl/worksheets/sheet1.xml"
-        if target.startswith('../'):
-            sheet_path = 'xl/' + target[3:]
-        elif not target.startswith('xl/'):
-            sheet_path = 'xl/' + target
-        else:
-            sheet_path = target
-        sheet_info.append((name, sheet_path))
-
-    result = {}
-    for sheet_name, sheet_path in sheet_info:
-        if sheet_path not in names_set:
-            continue
-        parts = sheet_path.rsplit('/', 1)
-        sheet_dir  = parts[0] if len(parts) > 1 else ''
-        sheet_file = parts[-1]
-        rels_path  = f"{sheet_dir}/_rels/{sheet_file}.rels"
-        if rels_path not in names_set:
-            continue
-
-        rels_xml  = z.read(rels_path)
-        rels_root = _etree.fromstring(rels_xml)
-
-        drawing_paths = []
-        for rel in rels_root:
-            if 'drawing' in rel.get('Type', '').lower():
-                tgt = rel.get('Target', '')
-                if tgt.startswith('../'):
-                    draw_path = 'xl/' + tgt[3:]
-                elif tgt.startswith('/'):
-                    draw_path = tgt.lstrip('/')
-                else:
-                    draw_path = f"{sheet_dir}/{tgt.lstrip('./')}"
-                if draw_path in names_set:
-                    drawing_paths.append(draw_path)
-        if drawing_paths:
-            result[sheet_name] = drawing_paths
-
-    return result
-
-
 def _collect_sp_elements(drawing_root):
     """
     Thu thập tất cả phần tử <xdr:sp> (shape/text-box) theo thứ tự cây (tree-order),
@@ -1336,177 +1815,873 @@ def _set_sp_text(sp, new_text):
         first_t.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
 
 
-def extract_xlsx_shapes(filepath):
+# ==================== XLSX STREAMING EXTRACTOR ====================
+# Đọc trực tiếp xl/worksheets/sheetN.xml bằng iterparse thay vì load_workbook:
+# bộ nhớ chỉ tỉ lệ với 1 row, không dựng object model của openpyxl.
+# Kết quả (keys "Sheet!A1", thứ tự, bỏ công thức, lọc màu chữ) giống hệt
+# cách duyệt sheet.iter_rows() trên workbook load đầy đủ.
+
+import posixpath as _posixpath
+import multiprocessing as _multiprocessing
+from concurrent.futures import ProcessPoolExecutor as _ProcessPoolExecutor
+from bisect import bisect_left as _bisect_left, bisect_right as _bisect_right
+from openpyxl.utils.cell import (
+    column_index_from_string as _column_index_from_string,
+    get_column_letter as _get_column_letter,
+    range_boundaries as _range_boundaries,
+)
+
+_XLSX_ROW_TAG   = f'{{{_NS_WB}}}row'
+_XLSX_C_TAG     = f'{{{_NS_WB}}}c'
+_XLSX_V_TAG     = f'{{{_NS_WB}}}v'
+_XLSX_F_TAG     = f'{{{_NS_WB}}}f'
+_XLSX_IS_TAG    = f'{{{_NS_WB}}}is'
+_XLSX_T_TAG     = f'{{{_NS_WB}}}t'
+_XLSX_R_TAG     = f'{{{_NS_WB}}}r'
+_XLSX_SI_TAG    = f'{{{_NS_WB}}}si'
+_XLSX_MERGE_TAG = f'{{{_NS_WB}}}mergeCell'
+_XLSX_COORD_RE  = re.compile(r'([A-Za-z]+)(\d+)')
+
+
+def _xlsx_part_path(base_dir, target):
+    """Chuẩn hóa Target trong file .rels thành đường dẫn part trong ZIP."""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return _posixpath.normpath(_posixpath.join(base_dir, target))
+
+
+def _xlsx_text_content(elem):
+    """Text thuần của <si>/<is>, giống openpyxl Text.content: <t> trực tiếp + <r><t>, bỏ <rPh>."""
+    snippets = []
+    plain = elem.find(_XLSX_T_TAG)
+    if plain is not None and plain.text:
+        snippets.append(plain.text)
+    for run in elem.iterfind(_XLSX_R_TAG):
+        run_t = run.find(_XLSX_T_TAG)
+        if run_t is not None and run_t.text:
+            snippets.append(run_t.text)
+    return ''.join(snippets)
+
+
+def _xlsx_read_shared_strings(z, sst_path):
+    """Đọc bảng sharedStrings theo kiểu streaming (giống openpyxl read_string_table)."""
+    strings = []
+    if not sst_path or sst_path not in z.NameToInfo:
+        return strings
+    with z.open(sst_path) as fp:
+        for _event, si in _etree.iterparse(fp, events=('end',), tag=_XLSX_SI_TAG, huge_tree=True):
+            strings.append(_xlsx_text_content(si).replace('x005F_', ''))
+            si.clear()
+            while si.getprevious() is not None:
+                del si.getparent()[0]
+    return strings
+
+
+def _xlsx_read_style_rgbs(z, styles_path):
     """
-    Trích xuất text từ tất cả shape/object (text-box) trong file xlsx.
-    Trả về dict: {"SheetName!XLShape{n}": "text"}
-    - n là thứ tự shape (đếm TẤT CẢ sp, bao gồm cả sp không có text) → index ổn định.
+    Đọc styles.xml một lần → list style_rgbs, style_rgbs[s] = màu chữ HEX 6 ký tự
+    của cellXfs thứ s (s = thuộc tính s của <c>), qua cellXfs.fontId → fonts.
+    Chỉ màu dạng rgb mới được tính (6 ký tự cuối của ARGB, viết hoa); màu theme/indexed/auto
+    hoặc không có màu → ''. Không phải dựng Font của openpyxl cho từng ô.
     """
-    shapes_data = {}
-    try:
-        with zipfile.ZipFile(filepath, 'r') as z:
-            sheet_drawing_map = _xlsx_get_sheet_drawing_map(z)
-            for sheet_name, drawing_paths in sheet_drawing_map.items():
-                for drawing_path in drawing_paths:
-                    drawing_xml  = z.read(drawing_path)
-                    drawing_root = _etree.fromstring(drawing_xml)
-                    for shape_idx, sp in enumerate(_collect_sp_elements(drawing_root), start=1):
-                        text = _get_sp_text(sp)
-                        if text.strip():
-                            key = f"{sheet_name}!XLShape{shape_idx}"
-                            shapes_data[key] = text.strip()
-    except Exception as e:
-        print(f"Warning: Không thể trích xuất shapes từ xlsx: {e}")
-    return shapes_data
-
-
-def _xlsx_sheet_path_map(files):
-    """Trả về map: sheet_name -> sheet_xml_path từ workbook + workbook.rels."""
-    workbook_root = _etree.fromstring(files['xl/workbook.xml'])
-    rels_root = _etree.fromstring(files['xl/_rels/workbook.xml.rels'])
-    rid_to_target = {rel.get('Id'): rel.get('Target') for rel in rels_root}
-
-    sheet_map = {}
-    for sheet_el in workbook_root.iter(f'{{{_NS_WB}}}sheet'):
-        sheet_name = sheet_el.get('name')
-        rid = sheet_el.get(f'{{{_NS_R}}}id')
-        target = rid_to_target.get(rid, '')
-        if target.startswith('/'):
-            path = target.lstrip('/')
-        elif target.startswith('xl/'):
-            path = target
-        else:
-            path = f'xl/{target}'
-        sheet_map[sheet_name] = path
-    return sheet_map
-
+    if not styles_path or styles_path not in z.NameToInfo:
+        return []
+    root = _etree.fromstring(z.read(styles_path))
+
+    font_rgbs = []
+    fonts_el = root.find(f'{{{_NS_WB}}}fonts')
+    if fonts_el is not None:
+        for font in fonts_el.iterfind(f'{{{_NS_WB}}}font'):
+            color = font.find(f'{{{_NS_WB}}}color')
+            rgb = ''
+            if color is not None and not any(
+                    color.get(attr) is not None for attr in ('indexed', 'theme', 'auto')):
+                rgb = (color.get('rgb') or '00000000').upper()[-6:]
+            font_rgbs.append(rgb)
+
+    style_rgbs = []
+    xfs_el = root.find(f'{{{_NS_WB}}}cellXfs')
+    if xfs_el is not None:
+        for xf in xfs_el.iterfind(f'{{{_NS_WB}}}xf'):
+            font_id = int(xf.get('fontId') or 0)
+            style_rgbs.append(font_rgbs[font_id] if font_id < len(font_rgbs) else '')
+    return style_rgbs
+
+
+def _xlsx_style_filter(style_rgbs, color_filter):
+    """
+    Dịch color_filter thành bảng tra theo thuộc tính s của <c> (giữ dạng chuỗi, khỏi int()):
+    trả về (style_ok, default_ok) — style_ok[s] cho mọi style trong cellXfs,
+    default_ok cho s ngoài bảng (màu mặc định '000000'). Ô không có s tương đương s="0".
+    """
+    style_ok = {str(sid): (rgb or '000000') in color_filter for sid, rgb in enumerate(style_rgbs)}
+    return style_ok, '000000' in color_filter
 
-def _xlsx_sheet_drawing_map_from_files(files, sheet_map):
-    """Trả về map: sheet_name -> [drawing_xml_paths]."""
-    result = {}
-    names_set = set(files.keys())
-
-    for sheet_name, sheet_path in sheet_map.items():
-        parts = sheet_path.rsplit('/', 1)
-        sheet_dir = parts[0] if len(parts) > 1 else ''
-        sheet_file = parts[-1]
-        rels_path = f"{sheet_dir}/_rels/{sheet_file}.rels"
-        if rels_path not in names_set:
-            continue
 
-        rels_root = _etree.fromstring(files[rels_path])
-        drawing_paths = []
-        for rel in rels_root:
-            if 'drawing' in (rel.get('Type') or '').lower():
-                tgt = rel.get('Target', '')
-                if tgt.startswith('/'):
-                    draw_path = tgt.lstrip('/')
-                else:
-                    draw_path = os.path.normpath(os.path.join(sheet_dir, tgt)).replace('\\', '/')
-                if draw_path in names_set:
-                    drawing_paths.append(draw_path)
+def _xlsx_cell_text(c, shared_strings, data_only):
+    """
+    Giá trị string của một <c> (None nếu không phải string), theo đúng quy tắc của openpyxl:
+    - không data_only: ô có <f> → công thức ('=...') → None
+    - t="s" → sharedStrings, t="inlineStr" → <is>, t="str"/"e" → text của <v>
+    - số/bool/ngày → None
+    """
+    data_type = c.get('t', 'n')
+    if not data_only and c.find(_XLSX_F_TAG) is not None:
+        return None
+    if data_type == 'inlineStr':
+        is_elem = c.find(_XLSX_IS_TAG)
+        return _xlsx_text_content(is_elem) if is_elem is not None else None
+    value = c.findtext(_XLSX_V_TAG)
+    if not value:
+        return None
+    if data_type == 's':
+        idx = int(value)
+        return shared_strings[idx] if 0 <= idx < len(shared_strings) else None
+    if data_type in ('n', 'b', 'd'):
+        return None
+    return value
+
+
+def _xlsx_cell_has_value(c, data_only):
+    """True nếu openpyxl sẽ đọc ra cell.value khác None (mọi kiểu dữ liệu, kể cả công thức)."""
+    if not data_only and c.find(_XLSX_F_TAG) is not None:
+        return True
+    if c.get('t') == 'inlineStr':
+        return c.find(_XLSX_IS_TAG) is not None
+    return bool(c.findtext(_XLSX_V_TAG))
 
-        if drawing_paths:
-            result[sheet_name] = drawing_paths
 
-    return result
+def _xlsx_merged_hidden_cells(cells, merged_refs):
+    """
+    openpyxl biến các ô không phải top-left trong vùng merge thành MergedCell (value=None).
+    <mergeCells> nằm SAU <sheetData> nên chỉ lọc được sau khi stream xong sheet.
+    cells: iterable (row, col). Trả về set (row, col) bị che bởi vùng merge.
+    """
+    by_row = {}
+    for row, col in cells:
+        by_row.setdefault(row, []).append(col)
+    rows_sorted = sorted(by_row)
+    hidden = set()
+    for ref in merged_refs:
+        try:
+            min_col, min_row, max_col, max_row = _range_boundaries(ref)
+        except (ValueError, TypeError):
+            continue
+        i = _bisect_left(rows_sorted, min_row)
+        while i < len(rows_sorted) and rows_sorted[i] <= max_row:
+            row = rows_sorted[i]
+            for col in by_row[row]:
+                if min_col <= col <= max_col and (row, col) != (min_row, min_col):
+                    hidden.add((row, col))
+            i += 1
+    return hidden
 
 
-def _xlsx_set_cell_inline_text(sheet_root, cell_ref, text_value):
-    """Gán text vào một cell theo kiểu inlineStr, giữ nguyên style của cell nếu có."""
-    m = re.fullmatch(r'([A-Za-z]+)(\d+)', cell_ref or '')
+class _XlsxValueGroups:
+    """
+    Gom key theo value ngay trong lúc extract, để build_dedup_data không phải regroup.
+    Mọi ô t="s" cùng shared-string index dùng chung MỘT object str của bảng sharedStrings,
+    nên hash đã được cache trên object và dict so khớp bằng identity — thực chất là gom
+    theo index, không hash lại chuỗi. Ô inline/XLShape trùng text vẫn vào cùng nhóm,
+    nên kết quả giống hệt build_dedup_data (thứ tự nhóm = lần xuất hiện đầu tiên).
+    """
+
+    def __init__(self):
+        self.groups = {}        # value → [(seq, key), ...] theo thứ tự extract
+        self.seq = 0
+        self.reordered = False  # True khi key đầu của một nhóm bị bỏ (merged cell)
+
+    def add(self, value, key):
+        self.seq += 1
+        entries = self.groups.get(value)
+        if entries is None:
+            self.groups[value] = [(self.seq, key)]
+        else:
+            entries.append((self.seq, key))
+
+    def discard(self, value, key):
+        entries = self.groups.get(value)
+        if not entries:
+            return
+        for i, (_seq, k) in enumerate(entries):
+            if k == key:
+                del entries[i]
+                if i == 0:
+                    self.reordered = True
+                break
+        if not entries:
+            del self.groups[value]
+
+    def value_to_keys(self):
+        """{value: [keys]} theo thứ tự xuất hiện đầu tiên — cùng format với build_dedup_data."""
+        items = self.groups.items()
+        if self.reordered:
+            items = sorted(items, key=lambda item: item[1][0][0])
+        return {value: [key for _seq, key in entries] for value, entries in items}
+
+
+def _xlsx_iter_sheet_rows(z, sheet_path, merged_refs, progress=None):
+    """
+    Stream một worksheet part, yield list [(row, col, <c>), ...] cho từng <row>
+    theo thứ tự cột. Các ref của <mergeCell> được ghi vào merged_refs.
+    Mỗi <row> bị xóa khỏi cây sau khi yield → phải dùng xong <c> trước lần lặp kế tiếp.
+    progress: _ExtractProgress hoặc None — nhận vị trí byte đang đọc của part.
+    """
+    row_counter = 0
+    with z.open(sheet_path) as fp:
+        if progress is not None:
+            progress.position = fp.tell
+        for _event, elem in _etree.iterparse(fp, events=('end',), tag=(_XLSX_ROW_TAG, _XLSX_MERGE_TAG),
+                                            huge_tree=True):
+            if elem.tag == _XLSX_MERGE_TAG:
+                if elem.get('ref'):
+                    merged_refs.append(elem.get('ref'))
+                elem.clear()
+                continue
+
+            r_attr = elem.get('r')
+            if r_attr:
+                try:
+                    row_counter = int(r_attr)
+                except ValueError:
+                    row_counter = int(float(r_attr))
+            else:
+                row_counter += 1
+
+            col_counter = 0
+            row_cells = []
+            ordered = True
+            for c in elem.iterchildren(_XLSX_C_TAG):
+                coord = c.get('r')
+                m = _XLSX_COORD_RE.fullmatch(coord) if coord else None
+                if m:
+                    row, col = int(m.group(2)), _column_index_from_string(m.group(1).upper())
+                else:
+                    row, col = row_counter, col_counter + 1
+                if row_cells and col < row_cells[-1][1]:
+                    ordered = False
+                col_counter = col
+                row_cells.append((row, col, c))
+
+            if not ordered:
+                row_cells.sort(key=lambda item: (item[0], item[1]))
+            yield row_cells
+
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+class _XlsxPackage:
+    """
+    Đọc package XLSX một lần duy nhất: mở ZIP, parse workbook.xml + rels,
+    resolve map sheet → part và sheet → drawing, cache sharedStrings/styles.
+    Dùng chung cho extract (cell + XLShape), /api/extract-colors và inject_xlsx_shapes
+    để mỗi request chỉ giải nén và parse mỗi part đúng một lần.
+    source: đường dẫn file hoặc file-like (BytesIO).
+    """
+
+    def __init__(self, source):
+        self.zip = zipfile.ZipFile(source, 'r')
+        try:
+            wb_root = _etree.fromstring(self.zip.read('xl/workbook.xml'))
+            rels_root = _etree.fromstring(self.zip.read('xl/_rels/workbook.xml.rels'))
+        except Exception:
+            self.zip.close()
+            raise
+        rid_to_rel = {rel.get('Id'): rel for rel in rels_root}
+
+        self.parts = {}
+        for rel in rels_root:
+            rel_type = rel.get('Type') or ''
+            for kind in ('sharedStrings', 'styles'):
+                if rel_type.endswith('/' + kind):
+                    self.parts[kind] = _xlsx_part_path('xl', rel.get('Target', ''))
+
+        # sheet_paths: mọi sheet (kể cả chartsheet) theo thứ tự workbook
+        # worksheets: chỉ worksheet có part thật trong ZIP (nguồn của cell text)
+        self.sheet_paths = {}
+        self.worksheets = []
+        for sheet_el in wb_root.iter(f'{{{_NS_WB}}}sheet'):
+            rel = rid_to_rel.get(sheet_el.get(f'{{{_NS_R}}}id'))
+            sheet_name = sheet_el.get('name')
+            sheet_path = _xlsx_part_path('xl', rel.get('Target', '') if rel is not None else '')
+            self.sheet_paths[sheet_name] = sheet_path
+            if rel is None or 'chartsheet' in (rel.get('Type') or ''):
+                continue
+            if sheet_path in self.zip.NameToInfo:
+                self.worksheets.append((sheet_name, sheet_path))
+
+        self._sheet_drawings = {}
+        self._shared_strings = None
+        self._style_rgbs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def read(self, name):
+        return self.zip.read(name)
+
+    def sheet_drawings(self, sheet_name):
+        """
+        List đường dẫn drawing XML của một sheet (resolve từ rels của sheet đó, có cache).
+        Chỉ đọc file .rels nhỏ của sheet — không giải nén worksheet/drawing part.
+        """
+        if sheet_name in self._sheet_drawings:
+            return self._sheet_drawings[sheet_name]
+        names = self.zip.NameToInfo
+        drawing_paths = []
+        sheet_path = self.sheet_paths.get(sheet_name)
+        if sheet_path in names:
+            sheet_dir, sheet_file = _posixpath.split(sheet_path)
+            rels_path = _posixpath.join(sheet_dir, '_rels', f'{sheet_file}.rels')
+            if rels_path in names:
+                rels_root = _etree.fromstring(self.zip.read(rels_path))
+                for rel in rels_root:
+                    if 'drawing' in (rel.get('Type') or '').lower():
+                        draw_path = _xlsx_part_path(sheet_dir, rel.get('Target', ''))
+                        if draw_path in names:
+                            drawing_paths.append(draw_path)
+        self._sheet_drawings[sheet_name] = drawing_paths
+        return drawing_paths
+
+    @property
+    def drawing_map(self):
+        """sheet_name → list đường dẫn drawing XML, vd {'Sheet1': ['xl/drawings/drawing1.xml']}."""
+        return dict(self.drawing_parts())
+
+    def worksheet_parts(self, selected_sheets=None):
+        """[(sheet_name, sheet_path)] của các worksheet được chọn, theo thứ tự workbook."""
+        return [
+            (sheet_name, sheet_path) for sheet_name, sheet_path in self.worksheets
+            if not selected_sheets or sheet_name in selected_sheets
+        ]
+
+    def drawing_parts(self, selected_sheets=None):
+        """[(sheet_name, [drawing paths])] của các sheet được chọn có drawing, theo thứ tự workbook."""
+        result = []
+        for sheet_name in self.sheet_paths:
+            if selected_sheets and sheet_name not in selected_sheets:
+                continue
+            drawing_paths = self.sheet_drawings(sheet_name)
+            if drawing_paths:
+                result.append((sheet_name, drawing_paths))
+        return result
+
+    @property
+    def shared_strings(self):
+        if self._shared_strings is None:
+            self._shared_strings = _xlsx_read_shared_strings(self.zip, self.parts.get('sharedStrings'))
+        return self._shared_strings
+
+    @property
+    def style_rgbs(self):
+        """style id (cellXfs index) → màu chữ HEX 6 ký tự, đọc từ styles.xml một lần."""
+        if self._style_rgbs is None:
+            self._style_rgbs = _xlsx_read_style_rgbs(self.zip, self.parts.get('styles'))
+        return self._style_rgbs
+
+    def part_size(self, paths):
+        """Tổng dung lượng (chưa nén) của các part — dùng để ước lượng tiến độ."""
+        return sum(self.zip.getinfo(path).file_size for path in paths)
+
+    def cell_texts(self, extracted_data, color_filter=None, selected_sheets=None, data_only=False, progress=None,
+                   groups=None):
+        """Ghi các ô text vào extracted_data: {"SheetName!A1": "Content"}, thứ tự row-major."""
+        for sheet_name, sheet_path in self.worksheet_parts(selected_sheets):
+            extracted_data.update(self.sheet_cell_texts(sheet_name, sheet_path, color_filter, data_only, progress,
+                                                        groups))
+        return extracted_data
+
+    def sheet_cell_texts(self, sheet_name, sheet_path, color_filter=None, data_only=False, progress=None,
+                         groups=None):
+        """
+        Các ô text của một worksheet part: {"SheetName!A1": "Content"}, thứ tự row-major.
+        groups: _XlsxValueGroups hoặc None — nhận từng (value, key) để dedup sẵn.
+        """
+        shared_strings = self.shared_strings
+        if color_filter is not None:
+            style_ok, default_ok = _xlsx_style_filter(self.style_rgbs, color_filter)
+        sheet_data = {}
+        kept = {}         # (row, col) → key, dùng để lọc merged cells ở cuối sheet
+        merged_refs = []
+        if progress is not None:
+            progress.begin(sheet_name)
+        for row_cells in _xlsx_iter_sheet_rows(self.zip, sheet_path, merged_refs, progress):
+            kept_before = len(kept)
+            for row, col, c in row_cells:
+                value = _xlsx_cell_text(c, shared_strings, data_only)
+                if value is None or value.startswith('='):
+                    continue
+                if color_filter is not None and not style_ok.get(c.get('s') or '0', default_ok):
+                    continue
+                key = f"{sheet_name}!{_get_column_letter(col)}{row}"
+                sheet_data[key] = value
+                kept[(row, col)] = key
+                if groups is not None:
+                    groups.add(value, key)
+            if progress is not None:
+                progress.advance(len(kept) - kept_before)
+        if progress is not None:
+            progress.end_part(self.part_size([sheet_path]))
+        if merged_refs and kept:
+            for cell in _xlsx_merged_hidden_cells(kept, merged_refs):
+                value = sheet_data.pop(kept[cell], None)
+                if groups is not None and value is not None:
+                    groups.discard(value, kept[cell])
+        return sheet_data
+
+    def shape_texts(self, extracted_data, selected_sheets=None, progress=None, groups=None):
+        """
+        Ghi text của shape/text-box vào extracted_data: {"SheetName!XLShape{n}": "text"}
+        - n là thứ tự shape (đếm TẤT CẢ sp, bao gồm cả sp không có text) → index ổn định.
+        - selected_sheets: chỉ đọc drawing part của các sheet được chọn.
+        """
+        try:
+            for sheet_name, drawing_paths in self.drawing_parts(selected_sheets):
+                if progress is not None:
+                    progress.begin(f'{sheet_name} (shapes)')
+                shapes_data = self.sheet_shape_texts(sheet_name, drawing_paths)
+                extracted_data.update(shapes_data)
+                if groups is not None:
+                    for key, value in shapes_data.items():
+                        groups.add(value, key)
+                if progress is not None:
+                    progress.end_part(self.part_size(drawing_paths), len(shapes_data))
+        except Exception as e:
+            print(f"Warning: Không thể trích xuất shapes từ xlsx: {e}")
+        return extracted_data
+
+    def sheet_shape_texts(self, sheet_name, drawing_paths):
+        """Text các shape trong các drawing part của một sheet: {"SheetName!XLShape{n}": "text"}."""
+        shapes_data = {}
+        for drawing_path in drawing_paths:
+            drawing_root = _etree.fromstring(self.zip.read(drawing_path))
+            for shape_idx, sp in enumerate(_collect_sp_elements(drawing_root), start=1):
+                text = _get_sp_text(sp)
+                if text.strip():
+                    shapes_data[f"{sheet_name}!XLShape{shape_idx}"] = text.strip()
+        return shapes_data
+
+    def cell_font_colors(self):
+        """Tập màu chữ HEX (màu rgb; theme/indexed/auto tính là '' và bỏ qua) của mọi ô có giá trị, bỏ ô ẩn trong vùng merge."""
+        colors = set()
+        style_rgb = {str(sid): rgb for sid, rgb in enumerate(self.style_rgbs) if rgb}
+        for _sheet_name, sheet_path in self.worksheets:
+            colored = {}      # (row, col) → rgb, chỉ giữ ô có màu xác định
+            merged_refs = []
+            for row_cells in _xlsx_iter_sheet_rows(self.zip, sheet_path, merged_refs):
+                for row, col, c in row_cells:
+                    if not _xlsx_cell_has_value(c, data_only=False):
+                        continue
+                    rgb = style_rgb.get(c.get('s') or '0')
+                    if rgb:
+                        colored[(row, col)] = rgb
+            hidden = _xlsx_merged_hidden_cells(colored, merged_refs) if merged_refs else ()
+            colors.update(rgb for cell, rgb in colored.items() if cell not in hidden)
+        return colors
+
+
+# ---- Chế độ song song (opt-in): mỗi worksheet part / drawing part là một task ----
+# Mỗi process worker mở package một lần trong initializer (sharedStrings, styles
+# chỉ parse một lần mỗi worker), task trả về dict của một sheet, process cha
+# ghép lại theo đúng thứ tự sheet của đường serial.
+
+_xlsx_worker_pkg = None
+
+
+def _process_pool(workers, initializer, initargs):
+    """
+    ProcessPoolExecutor cho các worker extract/inject. Không fork trực tiếp: server Flask chạy
+    đa luồng (extract còn chạy trong thread nền), fork lúc thread khác đang giữ lock
+    (_glossary_cache_lock, _extract_cache_lock, lock stdio/import...) có thể làm worker treo.
+    forkserver (hoặc spawn nếu nền tảng không hỗ trợ) tạo worker từ process sạch; forkserver
+    preload sẵn module này nên worker không phải import lại app mỗi lần.
+    """
+    if 'forkserver' in _multiprocessing.get_all_start_methods():
+        ctx = _multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload(['__main__', __name__])
+    else:
+        ctx = _multiprocessing.get_context('spawn')
+    return _ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=initializer, initargs=initargs)
+
+
+def _xlsx_worker_init(filepath):
+    global _xlsx_worker_pkg
+    _xlsx_worker_pkg = _XlsxPackage(filepath)
+
+
+def _xlsx_worker_task(kind, sheet_name, paths, color_filter, data_only):
+    if kind == 'cells':
+        return _xlsx_worker_pkg.sheet_cell_texts(sheet_name, paths[0], color_filter, data_only)
+    return _xlsx_worker_pkg.sheet_shape_texts(sheet_name, paths)
+
+
+def _xlsx_extract_parallel(pkg, filepath, workers, color_filter, selected_sheets, data_only, progress=None):
+    """Chạy cell + shape extraction trên ProcessPoolExecutor, kết quả giống hệt đường serial."""
+    cell_tasks = [('cells', sheet_name, [sheet_path]) for sheet_name, sheet_path in pkg.worksheet_parts(selected_sheets)]
+    shape_tasks = [('shapes', sheet_name, paths) for sheet_name, paths in pkg.drawing_parts(selected_sheets)]
+
+    def part_size(task):
+        return pkg.part_size(task[2])
+
+    def collect(task):
+        if progress is not None:
+            progress.begin(task[1] if task[0] == 'cells' else f'{task[1]} (shapes)')
+        result = futures[task[:2]].result()
+        extracted_data.update(result)
+        if progress is not None:
+            progress.end_part(part_size(task), len(result))
+
+    extracted_data = {}
+    with _process_pool(workers, _xlsx_worker_init, (filepath,)) as pool:
+        # Submit part lớn trước để cân bằng tải, nhưng ghép theo thứ tự gốc
+        futures = {}
+        for task in sorted(cell_tasks + shape_tasks, key=part_size, reverse=True):
+            futures[task[:2]] = pool.submit(_xlsx_worker_task, *task, color_filter, data_only)
+        for task in cell_tasks:
+            collect(task)
+        try:
+            for task in shape_tasks:
+                collect(task)
+        except Exception as e:
+            print(f"Warning: Không thể trích xuất shapes từ xlsx: {e}")
+    return extracted_data
+
+
+def extract_text_from_xlsx(filepath, color_filter=None, selected_sheets=None, data_only=False, workers=None,
+                           progress=None, value_groups=None):
+    """
+    Trích xuất text từ file XLSX bằng streaming parser (không load_workbook).
+    Trả về dictionary với format: {"SheetName!A1": "Content"}, sau đó là
+    các shape/text-box {"SheetName!XLShape{n}": "Content"}.
+    color_filter: set HEX strings hoặc None (không lọc)
+    selected_sheets: list tên sheet muốn extract, hoặc None (tất cả) — worksheet/drawing
+                     part của sheet không được chọn không bị giải nén hay parse
+    data_only: True → lấy giá trị cache của ô công thức (như load_workbook(data_only=True))
+    workers: số process song song (None → app.config['EXTRACT_WORKERS']; <= 1 → serial)
+    progress: callback(info) nhận tiến độ theo sheet (xem _ExtractProgress), hoặc None
+    value_groups: dict rỗng hoặc None — nếu truyền vào (đường serial) sẽ được điền
+                  {value: [keys]} dùng trực tiếp cho build_dedup_data
+    """
+    if workers is None:
+        workers = app.config.get('EXTRACT_WORKERS', 0)
+    with _XlsxPackage(filepath) as pkg:
+        sheet_parts = pkg.worksheet_parts(selected_sheets)
+        drawing_parts = pkg.drawing_parts(selected_sheets)
+        tracker = None
+        if progress is not None:
+            total_work = (pkg.part_size(path for _name, path in sheet_parts)
+                          + pkg.part_size(path for _name, paths in drawing_parts for path in paths))
+            tracker = _ExtractProgress(progress, total_work)
+        if workers > 1 and len(sheet_parts) + len(drawing_parts) > 1:
+            extracted_data = _xlsx_extract_parallel(pkg, filepath, workers, color_filter, selected_sheets,
+                                                    data_only, tracker)
+        else:
+            extracted_data = {}
+            groups = _XlsxValueGroups() if value_groups is not None else None
+            pkg.cell_texts(extracted_data, color_filter, selected_sheets, data_only, tracker, groups)
+            # TODO: color filter for xlsx shapes not yet implemented
+            pkg.shape_texts(extracted_data, selected_sheets, tracker, groups)
+            if groups is not None:
+                value_groups.update(groups.value_to_keys())
+    if tracker is not None:
+        tracker.finish()
+    return extracted_data
+
+
+def _xlsx_ref_column(cell_ref):
+    """Chỉ số cột (1-based) của "A1"; 0 nếu ref không hợp lệ."""
+    m = _XLSX_COORD_RE.fullmatch(cell_ref or '')
     if not m:
-        return
+        return 0
+    try:
+        return _column_index_from_string(m.group(1).upper())
+    except ValueError:
+        return 0
+
+
+def _xlsx_sorted_cell_updates(updates):
+    """{cell_ref: text} -> [(row, [(col, REF, text), ...]), ...] sắp theo (row, col); bỏ ref không hợp lệ."""
+    ordered = []
+    for cell_ref, value in updates.items():
+        col = _xlsx_ref_column(cell_ref)
+        if col:
+            ordered.append((int(_XLSX_COORD_RE.fullmatch(cell_ref).group(2)), col, cell_ref.upper(), value))
+    ordered.sort(key=lambda item: (item[0], item[1]))
+    rows = []
+    for row_num, col, ref, value in ordered:
+        if not rows or rows[-1][0] != row_num:
+            rows.append((row_num, []))
+        rows[-1][1].append((col, ref, value))
+    return rows
+
+
+def _xlsx_row_apply_updates(row_elem, cells, shared=None):
+    """
+    Gán text cho các cell của một <row>; cells: [(col, REF, text)] tăng dần theo cột.
+    Cell chưa có được chèn trước cell đầu tiên có cột lớn hơn (merge một lượt).
+    shared: {REF: sst_index} ở chế độ sharedStrings (ghi t="s"), None → inlineStr.
+    """
+    c_tag = _XLSX_C_TAG
+    cell_index = {}
+    cell_list = []   # [(col, elem)] theo thứ tự tài liệu
+    for cell in row_elem.iterchildren(c_tag):
+        ref = (cell.get('r') or '').upper()
+        cell_index.setdefault(ref, cell)
+        cell_list.append((_xlsx_ref_column(ref), cell))
+    cells_sorted = all(a[0] <= b[0] for a, b in zip(cell_list, cell_list[1:]))
+    j = 0            # con trỏ merge: cells và cell_list cùng tăng dần theo cột
+
+    for col, ref, value in cells:
+        cell_elem = cell_index.get(ref)
+        if cell_elem is None:
+            cell_elem = _etree.Element(c_tag, r=ref)
+            if cells_sorted:
+                while j < len(cell_list) and cell_list[j][0] <= col:
+                    j += 1
+                next_cell = cell_list[j][1] if j < len(cell_list) else None
+            else:
+                next_cell = next((cell for c_col, cell in cell_list if c_col > col), None)
+            if next_cell is not None:
+                next_cell.addprevious(cell_elem)
+            else:
+                row_elem.append(cell_elem)
+            cell_index[ref] = cell_elem
+        if shared is not None:
+            _xlsx_write_cell_shared(cell_elem, shared[ref])
+        else:
+            _xlsx_write_cell_inline_text(cell_elem, value)
+
 
-    row_num = int(m.group(2))
+def _xlsx_apply_cell_updates(sheet_root, updates, shared=None):
+    """
+    Gán text inlineStr cho nhiều cell của một sheet trong MỘT lượt:
+    - index <row> theo số dòng một lần (thay vì findall + quét tuyến tính cho từng cell)
+    - duyệt updates đã sắp theo (row, col); row/cell mới được chèn đúng vị trí
+      (trước row/cell đầu tiên có chỉ số lớn hơn), giữ sheetData đúng thứ tự.
+    updates: {cell_ref: text}; shared: xem _xlsx_row_apply_updates
+    """
     sheet_data = sheet_root.find(f'{{{_NS_WB}}}sheetData')
     if sheet_data is None:
         return
+    row_updates = _xlsx_sorted_cell_updates(updates)
+    if not row_updates:
+        return
 
-    row_elem = None
-    rows = sheet_data.findall(f'{{{_NS_WB}}}row')
-    for row in rows:
-        if int(row.get('r', '0') or 0) == row_num:
-            row_elem = row
-            break
+    row_tag = _XLSX_ROW_TAG
+    row_index = {}
+    row_list = []        # [(row_num, elem)] theo thứ tự tài liệu
+    for row in sheet_data.iterchildren(row_tag):
+        row_num = int(row.get('r', '0') or 0)
+        row_index.setdefault(row_num, row)
+        row_list.append((row_num, row))
+    row_nums = [num for num, _row in row_list]
+    rows_sorted = all(a <= b for a, b in zip(row_nums, row_nums[1:]))
+
+    for row_num, cells in row_updates:
+        row_elem = row_index.get(row_num)
+        if row_elem is None:
+            row_elem = _etree.Element(row_tag, r=str(row_num))
+            if rows_sorted:
+                pos = _bisect_right(row_nums, row_num)
+                next_row = row_list[pos][1] if pos < len(row_list) else None
+            else:
+                next_row = next((row for num, row in row_list if num > row_num), None)
+            if next_row is not None:
+                next_row.addprevious(row_elem)
+            else:
+                sheet_data.append(row_elem)
+            row_index[row_num] = row_elem
+        _xlsx_row_apply_updates(row_elem, cells, shared)
+
+
+def _xlsx_sync_hyperlink_display(hyperlinks_elem, updates):
+    """Đồng bộ thuộc tính display của <hyperlink> theo giá trị cell đã cập nhật."""
+    for hl in hyperlinks_elem.findall(f'{{{_NS_WB}}}hyperlink'):
+        ref = hl.get('ref', '')
+        if ref in updates and hl.get('display') is not None:
+            hl.set('display', str(updates[ref]))
 
-    if row_elem is None:
-        row_elem = _etree.Element(f'{{{_NS_WB}}}row', r=str(row_num))
-        inserted = False
-        for idx, row in enumerate(rows):
-            existing = int(row.get('r', '0') or 0)
-            if existing > row_num:
-                sheet_data.insert(idx, row_elem)
-                inserted = True
-                break
-        if not inserted:
-            sheet_data.append(row_elem)
 
-    cell_elem = None
-    for cell in row_elem.findall(f'{{{_NS_WB}}}c'):
-        if (cell.get('r') or '').upper() == cell_ref.upper():
-            cell_elem = cell
+_XML_DECLARATION_STANDALONE = b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+
+
+def _xml_shell_element(elem, parent=None):
+    """Bản sao rỗng (tag + attribute + nsmap, không con/text) của elem để làm vỏ serialize."""
+    if parent is None:
+        shell = _etree.Element(elem.tag, nsmap=elem.nsmap)
+    else:
+        shell = _etree.SubElement(parent, elem.tag)
+    for name, value in elem.attrib.items():
+        shell.set(name, value)
+    return shell
+
+
+class _XmlFragmentWriter:
+    """
+    Serialize từng phần tử con vào đúng ngữ cảnh namespace của một "vỏ" (shell) nhỏ
+    dựng lại từ các tổ tiên, để byte ra giống hệt khi tostring() cả cây
+    (không lặp lại khai báo xmlns ở từng phần tử con).
+    """
+
+    def __init__(self, shell_root, context=None):
+        self.shell_root = shell_root
+        self.context = shell_root if context is None else context
+        context = self.context
+        marker = uuid.uuid4().hex
+        context.text = marker
+        data = self._dump()
+        context.text = None
+        i = data.index(marker.encode('ascii'))
+        self.prefix = data[:i]
+        self.suffix = data[i + len(marker):]
+
+    def _dump(self):
+        return _etree.tostring(self.shell_root, encoding='UTF-8', xml_declaration=False)
+
+    def fragment(self, elem):
+        """Byte của elem (kể cả tail) như khi nằm trong context; elem bị tách khỏi cây gốc."""
+        self.context.append(elem)
+        data = self._dump()
+        self.context.remove(elem)
+        return data[len(self.prefix):len(data) - len(self.suffix)]
+
+
+def _xlsx_stream_patch_sheet(source, out, updates, shared=None):
+    """
+    Patch worksheet XML dạng stream (iterparse -> ghi tuần tự ra out) cho sheet rất lớn:
+    bộ nhớ chỉ tỉ lệ với một <row>, không dựng cả cây lxml.
+    Kết quả giống _xlsx_apply_cell_updates + _xlsx_sync_hyperlink_display trên cây đầy đủ
+    (giả định các <row> tăng dần theo r như Excel ghi); khoảng trắng giữa các phần tử
+    cấp sheet/row (file pretty-print) không được giữ lại.
+    source: file-like đọc XML gốc; out: file-like ghi bytes; shared: xem _xlsx_row_apply_updates.
+    """
+    row_updates = _xlsx_sorted_cell_updates(updates)
+    ptr = 0
+    sheet_data_tag = f'{{{_NS_WB}}}sheetData'
+    hyperlinks_tag = f'{{{_NS_WB}}}hyperlinks'
+    root = None
+    top = rows = None          # _XmlFragmentWriter cho con của root / con của sheetData
+    sheet_data_open = False
+
+    def new_rows_before(limit):
+        # Row có update nhưng chưa tồn tại trong sheet và r < limit (None = tất cả còn lại)
+        nonlocal ptr
+        while ptr < len(row_updates) and (limit is None or row_updates[ptr][0] < limit):
+            row_num, cells = row_updates[ptr]
+            ptr += 1
+            row_elem = _etree.Element(_XLSX_ROW_TAG, r=str(row_num))
+            _xlsx_row_apply_updates(row_elem, cells, shared)
+            yield row_elem
+
+    out.write(_XML_DECLARATION_STANDALONE)
+    for _event, elem in _etree.iterparse(source, events=('end',), huge_tree=True):
+        parent = elem.getparent()
+        if parent is None:
+            if top is None:     # root không có phần tử con
+                elem.tail = None
+                out.write(_etree.tostring(elem, encoding='UTF-8', xml_declaration=False))
             break
+        if root is None:
+            root = elem.getroottree().getroot()
+            top = _XmlFragmentWriter(_xml_shell_element(root), None)
+            out.write(top.prefix)
+
+        if parent is root:
+            elem.tail = None
+            if elem.tag == sheet_data_tag:
+                if sheet_data_open:
+                    for row_elem in new_rows_before(None):
+                        out.write(rows.fragment(row_elem))
+                    out.write(rows.suffix[:len(rows.suffix) - len(top.suffix)])
+                    continue
+                # sheetData không có row nào: thêm row mới (nếu có) rồi ghi như phần tử thường
+                for row_elem in new_rows_before(None):
+                    elem.append(row_elem)
+            elif elem.tag == hyperlinks_tag:
+                _xlsx_sync_hyperlink_display(elem, updates)
+            out.write(top.fragment(elem))
+        elif elem.tag == _XLSX_ROW_TAG and parent.tag == sheet_data_tag and parent.getparent() is root:
+            if not sheet_data_open:
+                rows_shell = _xml_shell_element(root)
+                rows = _XmlFragmentWriter(rows_shell, _xml_shell_element(parent, rows_shell))
+                out.write(rows.prefix[len(top.prefix):])
+                sheet_data_open = True
+            elem.tail = None
+            row_num = int(elem.get('r', '0') or 0)
+            for row_elem in new_rows_before(row_num):
+                out.write(rows.fragment(row_elem))
+            if ptr < len(row_updates) and row_updates[ptr][0] == row_num:
+                _xlsx_row_apply_updates(elem, row_updates[ptr][1], shared)
+                ptr += 1
+            out.write(rows.fragment(elem))
+
+    if top is not None:
+        out.write(top.suffix)
+
+
+_XML_SPACE_ATTR = '{http://www.w3.org/XML/1998/namespace}space'
+
+
+def _xlsx_set_t_text(t_elem, text):
+    """Gán text cho <t>, bật/tắt xml:space="preserve" theo khoảng trắng đầu/cuối và xuống dòng."""
+    t_elem.text = text
+    if text != text.strip() or '\n' in text:
+        t_elem.set(_XML_SPACE_ATTR, 'preserve')
+    elif _XML_SPACE_ATTR in t_elem.attrib:
+        del t_elem.attrib[_XML_SPACE_ATTR]
+
+
+def _xlsx_set_runs_text(runs, text_str):
+    """
+    Ghi text mới vào các rich-text run (<r>), giữ nguyên rPr của từng run:
+    chia text theo tỉ lệ số ký tự gốc của mỗi run; run cuối nhận phần còn lại.
+    """
+    t_tag = _XLSX_T_TAG
+    orig_lengths = [len((r.findtext(t_tag) or '')) for r in runs]
+    total_orig = sum(orig_lengths)
+    new_total = len(text_str)
+    pos = 0
+    for i, (run_elem, orig_len) in enumerate(zip(runs, orig_lengths)):
+        t_elem = run_elem.find(t_tag)
+        if t_elem is None:
+            t_elem = _etree.SubElement(run_elem, t_tag)
+        if i == len(runs) - 1:
+            part = text_str[pos:]
+        else:
+            if total_orig > 0:
+                count = round(new_total * orig_len / total_orig)
+                count = min(count, new_total - pos - (len(runs) - i - 1))
+                count = max(count, 0)
+            else:
+                count = 0
+            part = text_str[pos:pos + count]
+            pos += count
+        _xlsx_set_t_text(t_elem, part)
 
-    if cell_elem is None:
-        cell_elem = _etree.Element(f'{{{_NS_WB}}}c', r=cell_ref.upper())
-        row_elem.append(cell_elem)
 
+def _xlsx_write_cell_inline_text(cell_elem, text_value):
+    """Gán text vào một cell theo kiểu inlineStr, giữ nguyên style của cell nếu có."""
     text_str = '' if text_value is None else str(text_value)
 
     # Check if cell already has an <is> with rich-text runs
-    existing_is = cell_elem.find(f'{{{_NS_WB}}}is')
-    r_tag = f'{{{_NS_WB}}}r'
-    t_tag = f'{{{_NS_WB}}}t'
-    xml_space_attr = '{http://www.w3.org/XML/1998/namespace}space'
-
+    existing_is = cell_elem.find(_XLSX_IS_TAG)
     if existing_is is not None:
-        runs = existing_is.findall(r_tag)
-        if len(runs) > 1:
-            # Rich text: distribute new_text across runs by original char-count ratio
-            orig_lengths = [len((r.findtext(t_tag) or '')) for r in runs]
-            total_orig = sum(orig_lengths)
-            new_total = len(text_str)
-            pos = 0
-            for i, (run_elem, orig_len) in enumerate(zip(runs, orig_lengths)):
-                t_elem = run_elem.find(t_tag)
-                if t_elem is None:
-                    t_elem = _etree.SubElement(run_elem, t_tag)
-                if i == len(runs) - 1:
-                    part = text_str[pos:]
-                else:
-                    if total_orig > 0:
-                        count = round(new_total * orig_len / total_orig)
-                        count = min(count, new_total - pos - (len(runs) - i - 1))
-                        count = max(count, 0)
-                    else:
-                        count = 0
-                    part = text_str[pos:pos + count]
-                    pos += count
-                t_elem.text = part
-                if part != part.strip() or '\n' in part:
-                    t_elem.set(xml_space_attr, 'preserve')
-                elif xml_space_attr in t_elem.attrib:
-                    del t_elem.attrib[xml_space_attr]
+        runs = existing_is.findall(_XLSX_R_TAG)
+        if runs:
+            # Rich text: distribute new_text across runs by original char-count ratio (1 run: giữ rPr)
+            _xlsx_set_runs_text(runs, text_str)
             # Ensure cell type is inlineStr
             cell_elem.set('t', 'inlineStr')
             for child in list(cell_elem):
-                if child.tag in {f'{{{_NS_WB}}}v', f'{{{_NS_WB}}}f'}:
-                    cell_elem.remove(child)
-            return
-        elif len(runs) == 1:
-            # Single run: just replace the text element, keep rPr
-            t_elem = runs[0].find(t_tag)
-            if t_elem is None:
-                t_elem = _etree.SubElement(runs[0], t_tag)
-            t_elem.text = text_str
-            if text_str != text_str.strip() or '\n' in text_str:
-                t_elem.set(xml_space_attr, 'preserve')
-            elif xml_space_attr in t_elem.attrib:
-                del t_elem.attrib[xml_space_attr]
-            cell_elem.set('t', 'inlineStr')
-            for child in list(cell_elem):
-                if child.tag in {f'{{{_NS_WB}}}v', f'{{{_NS_WB}}}f'}:
+                if child.tag in {_XLSX_V_TAG, _XLSX_F_TAG}:
                     cell_elem.remove(child)
             return
         # else: plain <is><t>...</t></is> — fall through to rewrite below
@@ -1514,34 +2689,228 @@ def _xlsx_set_cell_inline_text(sheet_root, cell_ref, text_value):
     # No existing <is>, or plain <is><t> only: rewrite from scratch
     cell_elem.set('t', 'inlineStr')
     for child in list(cell_elem):
-        if child.tag in {
-            f'{{{_NS_WB}}}v',
-            f'{{{_NS_WB}}}f',
-            f'{{{_NS_WB}}}is',
-        }:
+        if child.tag in {_XLSX_V_TAG, _XLSX_F_TAG, _XLSX_IS_TAG}:
             cell_elem.remove(child)
 
-    is_elem = _etree.SubElement(cell_elem, f'{{{_NS_WB}}}is')
-    t_elem = _etree.SubElement(is_elem, t_tag)
-    t_elem.text = text_str
-    if text_str != text_str.strip() or '\n' in text_str:
-        t_elem.set(xml_space_attr, 'preserve')
+    is_elem = _etree.SubElement(cell_elem, _XLSX_IS_TAG)
+    t_elem = _etree.SubElement(is_elem, _XLSX_T_TAG)
+    _xlsx_set_t_text(t_elem, text_str)
 
 
-def inject_xlsx_shapes(source_filepath, output_filepath, json_data):
+def _xlsx_write_cell_shared(cell_elem, sst_index):
+    """Chế độ sharedStrings: cell trỏ tới <si> thứ sst_index (t="s"), giữ nguyên style."""
+    cell_elem.set('t', 's')
+    for child in list(cell_elem):
+        if child.tag in {_XLSX_V_TAG, _XLSX_F_TAG, _XLSX_IS_TAG}:
+            cell_elem.remove(child)
+    v_elem = _etree.Element(_XLSX_V_TAG)
+    v_elem.text = str(sst_index)
+    cell_elem.insert(0, v_elem)
+
+
+def _xlsx_scan_update_cells(source, refs):
+    """
+    Quét stream một worksheet, lấy trạng thái hiện tại của các cell sắp được ghi:
+    {REF: (t, v_text, is_xml)} — is_xml là <is> đã serialize nếu cell là inline rich-text, ngược lại None.
+    Dùng để cấp phát sharedStrings (tái dùng rich-text run, tính count) trước khi patch.
+    """
+    found = {}
+    for _event, elem in _etree.iterparse(source, events=('end',), tag=(_XLSX_C_TAG, _XLSX_ROW_TAG), huge_tree=True):
+        if elem.tag == _XLSX_ROW_TAG:
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+            continue
+        ref = (elem.get('r') or '').upper()
+        if ref in refs and ref not in found:
+            is_elem = elem.find(_XLSX_IS_TAG)
+            is_xml = None
+            if is_elem is not None and is_elem.find(_XLSX_R_TAG) is not None:
+                is_xml = _etree.tostring(is_elem)
+            found[ref] = (elem.get('t'), elem.findtext(_XLSX_V_TAG), is_xml)
+    return found
+
+
+def inject_xlsx_shapes(source_filepath, output_filepath, json_data, workers=None, shared_strings=None):
     """
     ZIP-level patch cho XLSX:
     - Không dùng openpyxl.save
     - Patch trực tiếp cell XML
     - Patch trực tiếp drawing XML (shape text)
     - Giữ nguyên toàn bộ parts khác của file gốc
+    workers: số process patch song song theo part (None → app.config['INJECT_WORKERS']; <= 1 → serial)
+    shared_strings: True → bản dịch được dedup vào xl/sharedStrings.xml, cell ghi t="s"
+                    (None → app.config['INJECT_XLSX_SHARED_STRINGS']); False → inlineStr như cũ
+    """
+    if workers is None:
+        workers = app.config.get('INJECT_WORKERS', 0)
+    if shared_strings is None:
+        shared_strings = app.config.get('INJECT_XLSX_SHARED_STRINGS', False)
+    with _XlsxPackage(source_filepath) as pkg:
+        tasks = _xlsx_inject_tasks(pkg, json_data)
+        sst = None
+        if shared_strings and any(kind == 'sheet' for kind, *_rest in tasks):
+            sst = _XlsxSharedStrings(pkg)
+        spool_paths = []
+        try:
+            if workers > 1 and len(tasks) > 1:
+                patched = _xlsx_inject_parallel(pkg, source_filepath, output_filepath, workers, tasks,
+                                                spool_paths, sst)
+            else:
+                shared_maps = {}
+                if sst is not None:
+                    for kind, path, updates, _stream in tasks:
+                        if kind == 'sheet':
+                            shared_maps[path] = sst.assign(updates, _xlsx_scan_part(pkg, path, updates))
+                patched = {}
+                for kind, path, updates, stream in tasks:
+                    if stream:
+                        # Sheet khổng lồ: patch khi ghi output, đọc/ghi tuần tự từng row
+                        patched[path] = _xlsx_sheet_stream_writer(pkg.zip, path, updates, shared_maps.get(path))
+                    else:
+                        patched[path] = _xlsx_patch_part(pkg, kind, path, updates, shared=shared_maps.get(path))
+            if sst is not None:
+                patched.update(sst.parts())
+            _zip_rewrite(pkg.zip, output_filepath, patched)
+        finally:
+            for spool_path in spool_paths:
+                if os.path.exists(spool_path):
+                    os.remove(spool_path)
+
+
+_NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_NS_CONTENT_TYPES = 'http://schemas.openxmlformats.org/package/2006/content-types'
+_XLSX_SST_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+_XLSX_SST_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'
+_XLSX_RPH_TAG = f'{{{_NS_WB}}}rPh'
+
+
+class _XlsxSharedStrings:
+    """
+    sharedStrings.xml của output ở chế độ inject shared_strings:
+    - bản dịch thuần text được dedup (dùng lại cả <si> thuần text sẵn có cùng nội dung)
+    - cell vốn là rich-text (<si>/<is> có <r>) → <si> rich-text mới giữ rPr từng run,
+      text chia theo tỉ lệ như inlineStr (bỏ <rPh> phiên âm của text cũ)
+    - count (số tham chiếu t="s") và uniqueCount (số <si>) được cập nhật đúng
+    Cấp phát index chạy tuần tự ở process cha theo thứ tự task/cell, nên kết quả
+    không phụ thuộc serial hay song song. Workbook chưa có sharedStrings thì tạo mới
+    (thêm relationship + content type).
     """
-    with zipfile.ZipFile(source_filepath, 'r') as z_src:
-        infos = {info.filename: info for info in z_src.infolist()}
-        order = [info.filename for info in z_src.infolist()]
-        files = {name: z_src.read(name) for name in order}
 
-    sheet_map = _xlsx_sheet_path_map(files)
+    def __init__(self, pkg):
+        self.pkg = pkg
+        self.path = pkg.parts.get('sharedStrings')
+        self.created = not self.path or self.path not in pkg.zip.NameToInfo
+        if self.created:
+            self.path = 'xl/sharedStrings.xml'
+            self.root = _etree.Element(f'{{{_NS_WB}}}sst', nsmap={None: _NS_WB})
+        else:
+            self.root = _etree.fromstring(pkg.read(self.path))
+        self.items = self.root.findall(_XLSX_SI_TAG)
+        self.plain = {}      # text -> index của <si><t>text</t></si>
+        for idx, si in enumerate(self.items):
+            if len(si) == 1 and si[0].tag == _XLSX_T_TAG:
+                self.plain.setdefault(si[0].text or '', idx)
+        self.rich = {}       # (nguồn run, text) -> index
+        self.added_refs = 0
+
+    def _append(self, si):
+        self.root.append(si)
+        self.items.append(si)
+        return len(self.items) - 1
+
+    def plain_index(self, text):
+        idx = self.plain.get(text)
+        if idx is None:
+            si = _etree.Element(_XLSX_SI_TAG)
+            _xlsx_set_t_text(_etree.SubElement(si, _XLSX_T_TAG), text)
+            idx = self.plain[text] = self._append(si)
+        return idx
+
+    def rich_index(self, source_key, source, text):
+        key = (source_key, text)
+        idx = self.rich.get(key)
+        if idx is None:
+            si = _etree.Element(_XLSX_SI_TAG)
+            for child in source:
+                if child.tag != _XLSX_RPH_TAG:
+                    si.append(deepcopy(child))
+            _xlsx_set_runs_text(si.findall(_XLSX_R_TAG), text)
+            idx = self.rich[key] = self._append(si)
+        return idx
+
+    def _rich_source(self, state):
+        """(key, phần tử chứa run) nếu cell hiện tại là rich-text, ngược lại None."""
+        if state is None:
+            return None
+        t, v_text, is_xml = state
+        if t == 's':
+            try:
+                si = self.items[int(v_text)]
+            except (TypeError, ValueError, IndexError):
+                return None
+            return (('s', int(v_text)), si) if si.find(_XLSX_R_TAG) is not None else None
+        if is_xml is not None:
+            return ('is', is_xml), _etree.fromstring(is_xml)
+        return None
+
+    def assign(self, updates, scanned):
+        """
+        Cấp index cho các cell của một sheet -> {REF: sst_index}.
+        scanned: trạng thái cell hiện tại từ _xlsx_scan_update_cells.
+        """
+        shared = {}
+        for _row, cells in _xlsx_sorted_cell_updates(updates):
+            for _col, ref, value in cells:
+                text = '' if value is None else str(value)
+                state = scanned.get(ref)
+                rich = self._rich_source(state)
+                if rich is not None:
+                    shared[ref] = self.rich_index(rich[0], rich[1], text)
+                else:
+                    shared[ref] = self.plain_index(text)
+        for ref in shared:
+            state = scanned.get(ref)
+            if state is None or state[0] != 's':
+                self.added_refs += 1
+        return shared
+
+    def parts(self):
+        """{part_name: bytes} cần ghi vào output: sharedStrings (+ rels/content types nếu tạo mới)."""
+        if 'count' in self.root.attrib or self.created:
+            self.root.set('count', str(int(self.root.get('count') or 0) + self.added_refs))
+        self.root.set('uniqueCount', str(len(self.items)))
+        parts = {self.path: _etree.tostring(self.root, xml_declaration=True, encoding='UTF-8', standalone=True)}
+        if self.created:
+            rels_path = 'xl/_rels/workbook.xml.rels'
+            rels_root = _etree.fromstring(self.pkg.read(rels_path))
+            ids = {rel.get('Id') for rel in rels_root}
+            n = len(ids) + 1
+            while f'rId{n}' in ids:
+                n += 1
+            rel = _etree.SubElement(rels_root, f'{{{_NS_PKG_REL}}}Relationship')
+            rel.set('Id', f'rId{n}')
+            rel.set('Type', _XLSX_SST_REL_TYPE)
+            rel.set('Target', 'sharedStrings.xml')
+            parts[rels_path] = _etree.tostring(rels_root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+            ct_path = '[Content_Types].xml'
+            ct_root = _etree.fromstring(self.pkg.read(ct_path))
+            override = _etree.SubElement(ct_root, f'{{{_NS_CONTENT_TYPES}}}Override')
+            override.set('PartName', '/' + self.path)
+            override.set('ContentType', _XLSX_SST_CONTENT_TYPE)
+            parts[ct_path] = _etree.tostring(ct_root, xml_declaration=True, encoding='UTF-8', standalone=True)
+        return parts
+
+
+def _xlsx_inject_tasks(pkg, json_data):
+    """
+    Gom bản dịch theo part cần patch: [(kind, part_path, updates, stream)]
+    - ('sheet', path, {cell_ref: text}, stream): stream=True nếu sheet vượt INJECT_STREAM_SHEET_BYTES
+    - ('drawing', path, {shape_idx: text}, False)
+    """
+    names = set(pkg.zip.namelist())
+    sheet_map = pkg.sheet_paths
 
     cell_updates = {}
     shape_updates = {}
@@ -1561,25 +2930,19 @@ def inject_xlsx_shapes(source_filepath, output_filepath, json_data):
         else:
             cell_updates.setdefault(sheet_name, {})[second_part] = translated_value
 
+    tasks = []
+    seen = set()
+    stream_limit = app.config.get('INJECT_STREAM_SHEET_BYTES') or 0
     for sheet_name, updates in cell_updates.items():
         sheet_path = sheet_map.get(sheet_name)
-        if not sheet_path or sheet_path not in files:
+        if not sheet_path or sheet_path not in names or sheet_path in seen:
             continue
-        sheet_root = _etree.fromstring(files[sheet_path])
-        for cell_ref, value in updates.items():
-            _xlsx_set_cell_inline_text(sheet_root, cell_ref, value)
-        # Sync hyperlink display attributes to match updated cell values
-        hyperlinks_elem = sheet_root.find(f'{{{_NS_WB}}}hyperlinks')
-        if hyperlinks_elem is not None:
-            for hl in hyperlinks_elem.findall(f'{{{_NS_WB}}}hyperlink'):
-                ref = hl.get('ref', '')
-                if ref in updates and hl.get('display') is not None:
-                    hl.set('display', str(updates[ref]))
-        files[sheet_path] = _etree.tostring(sheet_root, xml_declaration=True, encoding='UTF-8', standalone=True)
+        seen.add(sheet_path)
+        stream = bool(stream_limit) and pkg.part_size([sheet_path]) > stream_limit
+        tasks.append(('sheet', sheet_path, updates, stream))
 
     if shape_updates:
-        drawing_map = _xlsx_sheet_drawing_map_from_files(files, sheet_map)
-        for sheet_name, drawing_paths in drawing_map.items():
+        for sheet_name, drawing_paths in pkg.drawing_map.items():
             wanted = {
                 idx: val
                 for (sn, idx), val in shape_updates.items()
@@ -1589,40 +2952,685 @@ def inject_xlsx_shapes(source_filepath, output_filepath, json_data):
                 continue
 
             for drawing_path in drawing_paths:
-                if drawing_path not in files:
+                if drawing_path not in names or drawing_path in seen:
                     continue
-                drawing_root = _etree.fromstring(files[drawing_path])
-                for shape_idx, sp in enumerate(_collect_sp_elements(drawing_root), start=1):
-                    if shape_idx in wanted:
-                        _set_sp_text(sp, wanted[shape_idx])
-                files[drawing_path] = _etree.tostring(
-                    drawing_root,
-                    xml_declaration=True,
-                    encoding='UTF-8',
-                    standalone=True,
-                )
+                seen.add(drawing_path)
+                tasks.append(('drawing', drawing_path, wanted, False))
+    return tasks
+
+
+def _xlsx_patch_sheet_xml(raw, updates, shared=None):
+    """Patch worksheet XML trên cây lxml đầy đủ -> bytes."""
+    sheet_root = _etree.fromstring(raw)
+    _xlsx_apply_cell_updates(sheet_root, updates, shared)
+    # Sync hyperlink display attributes to match updated cell values
+    hyperlinks_elem = sheet_root.find(f'{{{_NS_WB}}}hyperlinks')
+    if hyperlinks_elem is not None:
+        _xlsx_sync_hyperlink_display(hyperlinks_elem, updates)
+    return _etree.tostring(sheet_root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+
+def _xlsx_patch_drawing_xml(raw, wanted):
+    """Gán text cho các shape (đánh số theo _collect_sp_elements) của một drawing part -> bytes."""
+    drawing_root = _etree.fromstring(raw)
+    for shape_idx, sp in enumerate(_collect_sp_elements(drawing_root), start=1):
+        if shape_idx in wanted:
+            _set_sp_text(sp, wanted[shape_idx])
+    return _etree.tostring(
+        drawing_root,
+        xml_declaration=True,
+        encoding='UTF-8',
+        standalone=True,
+    )
 
-    with zipfile.ZipFile(output_filepath, 'w') as z_out:
-        written = set()
-        for name in order:
-            content = files.get(name)
-            if content is None:
-                continue
-            original = infos[name]
-            zi = zipfile.ZipInfo(name, original.date_time)
-            zi.compress_type = original.compress_type
-            zi.external_attr = original.external_attr
-            zi.create_system = original.create_system
-            z_out.writestr(zi, content)
-            written.add(name)
 
-        for name, content in files.items():
-            if name in written:
+def _xlsx_patch_part(pkg, kind, path, updates, spool_path=None, shared=None):
+    """
+    Patch một part của pkg -> bytes; spool_path: stream sheet ra file đó (trả về spool_path).
+    shared: {REF: sst_index} khi ghi cell ở chế độ sharedStrings.
+    """
+    if spool_path is not None:
+        with pkg.zip.open(path) as src, open(spool_path, 'wb') as out:
+            _xlsx_stream_patch_sheet(src, out, updates, shared)
+        return spool_path
+    if kind == 'sheet':
+        return _xlsx_patch_sheet_xml(pkg.read(path), updates, shared)
+    return _xlsx_patch_drawing_xml(pkg.read(path), updates)
+
+
+def _xlsx_scan_part(pkg, path, updates):
+    """Trạng thái hiện tại của các cell trong updates (xem _xlsx_scan_update_cells)."""
+    refs = {ref for _row, cells in _xlsx_sorted_cell_updates(updates) for _col, ref, _value in cells}
+    with pkg.zip.open(path) as src:
+        return _xlsx_scan_update_cells(src, refs)
+
+
+def _xlsx_sheet_stream_writer(z, sheet_path, updates, shared=None):
+    """callable(fp) cho _zip_rewrite: stream sheet gốc từ z qua _xlsx_stream_patch_sheet vào fp."""
+    def write(fp_out):
+        with z.open(sheet_path) as src:
+            _xlsx_stream_patch_sheet(src, fp_out, updates, shared)
+    return write
+
+
+def _file_copy_writer(path):
+    """callable(fp) cho _zip_rewrite: copy nội dung file path vào fp."""
+    def write(fp_out):
+        with open(path, 'rb') as src:
+            shutil.copyfileobj(src, fp_out, _ZIP_COPY_CHUNK)
+    return write
+
+
+def _xlsx_inject_worker_task(kind, path, updates, spool_path, shared):
+    return _xlsx_patch_part(_xlsx_worker_pkg, kind, path, updates, spool_path, shared)
+
+
+def _xlsx_scan_worker_task(path, updates):
+    return _xlsx_scan_part(_xlsx_worker_pkg, path, updates)
+
+
+def _xlsx_inject_parallel(pkg, source_filepath, output_filepath, workers, tasks, spool_paths, sst=None):
+    """
+    Patch các part (độc lập nhau) trên ProcessPoolExecutor, gom kết quả trước khi ghi package.
+    Mỗi part dùng đúng hàm của đường serial nên output giống hệt byte-for-byte.
+    Sheet dạng stream được worker ghi ra file tạm cạnh output (thêm vào spool_paths để caller dọn).
+    sst: _XlsxSharedStrings ở chế độ sharedStrings — worker quét cell trước, process cha
+         cấp index theo đúng thứ tự serial rồi mới patch.
+    """
+    spool_dir = os.path.dirname(os.path.abspath(output_filepath))
+    by_size = sorted(tasks, key=lambda task: pkg.part_size([task[1]]), reverse=True)
+    with _process_pool(workers, _xlsx_worker_init, (source_filepath,)) as pool:
+        shared_maps = {}
+        if sst is not None:
+            scans = {path: pool.submit(_xlsx_scan_worker_task, path, updates)
+                     for kind, path, updates, _stream in by_size if kind == 'sheet'}
+            for kind, path, updates, _stream in tasks:
+                if kind == 'sheet':
+                    shared_maps[path] = sst.assign(updates, scans[path].result())
+
+        # Submit part lớn trước để cân bằng tải, nhưng ghép theo thứ tự task
+        futures = {}
+        for kind, path, updates, stream in by_size:
+            spool_path = None
+            if stream:
+                fd, spool_path = _tempfile.mkstemp(suffix='.part', dir=spool_dir)
+                os.close(fd)
+                spool_paths.append(spool_path)
+            futures[path] = pool.submit(_xlsx_inject_worker_task, kind, path, updates, spool_path,
+                                        shared_maps.get(path))
+        patched = {}
+        for _kind, path, _updates, stream in tasks:
+            result = futures[path].result()
+            patched[path] = _file_copy_writer(result) if stream else result
+    return patched
+
+
+# ==================== PPTX STREAMING EXTRACTOR ====================
+# Đọc trực tiếp ppt/slides/slideN.xml bằng lxml thay vì Presentation(...):
+# không dựng proxy slide/shape/text_frame của python-pptx. Thứ tự slide theo
+# <p:sldIdLst> của presentation.xml; keys "SlideX!ShapeY", "SlideX!ShapeY_Z",
+# "SlideX!ShapeY!Table_RxCy", text và kết quả lọc màu chữ giống hệt cách duyệt
+# slide.shapes / shape.text / table.rows của python-pptx 0.6.23.
+
+_NS_P = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+_PPTX_OFFICE_DOCUMENT_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+_PPTX_TABLE_URI = 'http://schemas.openxmlformats.org/drawingml/2006/table'
+
+_PPTX_SP_TAG      = f'{{{_NS_P}}}sp'
+_PPTX_GRPSP_TAG   = f'{{{_NS_P}}}grpSp'
+_PPTX_FRAME_TAG   = f'{{{_NS_P}}}graphicFrame'
+_PPTX_TXBODY_TAG  = f'{{{_NS_P}}}txBody'
+# Các con của <p:spTree>/<p:grpSp> mà python-pptx coi là shape (CT_GroupShape._shape_tags)
+_PPTX_SHAPE_TAGS  = frozenset(f'{{{_NS_P}}}{tag}' for tag in
+                              ('sp', 'grpSp', 'graphicFrame', 'cxnSp', 'pic', 'contentPart'))
+_A_P_TAG          = f'{{{_NS_A}}}p'
+_A_R_TAG          = f'{{{_NS_A}}}r'
+_A_BR_TAG         = f'{{{_NS_A}}}br'
+_A_FLD_TAG        = f'{{{_NS_A}}}fld'
+_A_T_TAG          = f'{{{_NS_A}}}t'
+_A_RPR_TAG        = f'{{{_NS_A}}}rPr'
+_A_TR_TAG         = f'{{{_NS_A}}}tr'
+_A_TC_TAG         = f'{{{_NS_A}}}tc'
+_A_TXBODY_TAG     = f'{{{_NS_A}}}txBody'
+_A_SOLID_FILL_TAG = f'{{{_NS_A}}}solidFill'
+_A_SRGB_TAG       = f'{{{_NS_A}}}srgbClr'
+# Thứ tự ưu tiên của EG_ColorChoice trong python-pptx (first_child_found_in), không phải thứ tự XML
+_A_COLOR_TAGS     = tuple(f'{{{_NS_A}}}{tag}' for tag in
+                          ('scrgbClr', 'srgbClr', 'hslClr', 'sysClr', 'schemeClr', 'prstClr'))
+
+
+def _first_child_found_in(elem, tags):
+    for tag in tags:
+        child = elem.find(tag)
+        if child is not None:
+            return child
+    return None
+
+
+def _pptx_text_body_text(txBody):
+    """
+    Text của một <p:txBody>/<a:txBody>, giống TextFrame.text của python-pptx:
+    các <a:p> nối bằng "\\n"; trong đoạn, <a:r>/<a:fld> lấy <a:t>, <a:br> → "\\v".
+    """
+    if txBody is None:
+        return ''
+    paragraphs = []
+    for para in txBody.iterchildren(_A_P_TAG):
+        pieces = []
+        for child in para:
+            tag = child.tag
+            if tag == _A_R_TAG or tag == _A_FLD_TAG:
+                t = child.find(_A_T_TAG)
+                if t is not None and t.text:
+                    pieces.append(t.text)
+            elif tag == _A_BR_TAG:
+                pieces.append('\v')
+        paragraphs.append(''.join(pieces))
+    return '\n'.join(paragraphs)
+
+
+def _pptx_run_rgb(r):
+    """
+    Màu chữ HEX 6 ký tự của một <a:r>, cùng quy tắc với _get_font_rgb_pptx(run):
+    chỉ <a:rPr><a:solidFill><a:srgbClr val=".."/> mới có màu; theme/scheme/không fill → ''.
+    Font.color dùng <a:solidFill> nếu có (kể cả khi đứng sau fill khác), nên chỉ cần find.
+    """
+    rPr = r.find(_A_RPR_TAG)
+    if rPr is None:
+        return ''
+    fill = rPr.find(_A_SOLID_FILL_TAG)
+    if fill is None:
+        return ''
+    color = _first_child_found_in(fill, _A_COLOR_TAGS)
+    if color is None or color.tag != _A_SRGB_TAG:
+        return ''
+    val = color.get('val')
+    try:
+        rgb = (int(val[:2], 16), int(val[2:4], 16), int(val[4:], 16))
+    except (TypeError, ValueError):
+        return ''
+    if not all(0 <= v <= 255 for v in rgb):
+        return ''
+    return '%02X%02X%02X' % rgb
+
+
+def _pptx_text_body_matches_color_filter(txBody, color_filter):
+    """
+    True nếu bất kỳ <a:r> nào (con trực tiếp của <a:p>) khớp color_filter;
+    không có run nào → match khi '000000' trong filter (màu mặc định).
+    """
+    has_any_run = False
+    if txBody is not None:
+        for para in txBody.iterchildren(_A_P_TAG):
+            for r in para.iterchildren(_A_R_TAG):
+                has_any_run = True
+                if (_pptx_run_rgb(r) or '000000') in color_filter:
+                    return True
+    if not has_any_run:
+        return '000000' in color_filter
+    return False
+
+
+def _pptx_frame_table(frame):
+    """<a:tbl> của một <p:graphicFrame> chứa bảng (graphicData uri = table), hoặc None."""
+    graphic_data = frame.find(f'{{{_NS_A}}}graphic/{{{_NS_A}}}graphicData')
+    if graphic_data is None or graphic_data.get('uri') != _PPTX_TABLE_URI:
+        return None
+    return graphic_data.find(f'{{{_NS_A}}}tbl')
+
+
+def _pptx_collect_shape_texts(shape_elem, shape_path, extracted_data, color_filter=None):
+    """
+    Đệ quy theo đúng cấu trúc của python-pptx:
+    <p:sp> → shape.text, <p:graphicFrame> bảng → Table_RxCy, <p:grpSp> → shape con "_Z".
+    """
+    tag = shape_elem.tag
+    if tag == _PPTX_SP_TAG:
+        txBody = shape_elem.find(_PPTX_TXBODY_TAG)
+        text_content = _pptx_text_body_text(txBody).strip()
+        if text_content:
+            if color_filter is None or _pptx_text_body_matches_color_filter(txBody, color_filter):
+                extracted_data[shape_path] = text_content
+    elif tag == _PPTX_FRAME_TAG:
+        tbl = _pptx_frame_table(shape_elem)
+        if tbl is None:
+            return
+        for row_idx, tr in enumerate(tbl.iterchildren(_A_TR_TAG), start=1):
+            for col_idx, tc in enumerate(tr.iterchildren(_A_TC_TAG), start=1):
+                txBody = tc.find(_A_TXBODY_TAG)
+                text_content = _pptx_text_body_text(txBody).strip()
+                if text_content:
+                    if color_filter is None or _pptx_text_body_matches_color_filter(txBody, color_filter):
+                        extracted_data[f"{shape_path}!Table_R{row_idx}C{col_idx}"] = text_content
+    elif tag == _PPTX_GRPSP_TAG:
+        children = (child for child in shape_elem if child.tag in _PPTX_SHAPE_TAGS)
+        for child_idx, child in enumerate(children, start=1):
+            _pptx_collect_shape_texts(child, f"{shape_path}_{child_idx}", extracted_data, color_filter)
+
+
+class _PptxPackage:
+    """
+    Đọc package PPTX một lần: mở ZIP, resolve presentation.xml qua _rels/.rels,
+    rồi map <p:sldId> → slide part theo đúng thứ tự trình chiếu.
+    source: đường dẫn file hoặc file-like (BytesIO).
+    """
+
+    def __init__(self, source):
+        self.zip = zipfile.ZipFile(source, 'r')
+        try:
+            pres_path = 'ppt/presentation.xml'
+            root_rels = _etree.fromstring(self.zip.read('_rels/.rels'))
+            for rel in root_rels:
+                if rel.get('Type') == _PPTX_OFFICE_DOCUMENT_REL:
+                    pres_path = _xlsx_part_path('', rel.get('Target', ''))
+                    break
+            pres_dir, pres_file = _posixpath.split(pres_path)
+            pres_root = _etree.fromstring(self.zip.read(pres_path))
+            rels_root = _etree.fromstring(self.zip.read(_posixpath.join(pres_dir, '_rels', f'{pres_file}.rels')))
+        except Exception:
+            self.zip.close()
+            raise
+        rid_to_target = {rel.get('Id'): rel.get('Target', '') for rel in rels_root}
+
+        # slides: [(slide_idx, slide_path)]; slide_path None nếu sldId trỏ tới part không có
+        # (vẫn giữ số thứ tự để key của các slide sau không bị lệch)
+        self.slides = []
+        sld_id_lst = pres_root.find(f'{{{_NS_P}}}sldIdLst')
+        sld_ids = sld_id_lst.iterchildren(f'{{{_NS_P}}}sldId') if sld_id_lst is not None else ()
+        for slide_idx, sld_id in enumerate(sld_ids, start=1):
+            target = rid_to_target.get(sld_id.get(f'{{{_NS_R}}}id'))
+            slide_path = _xlsx_part_path(pres_dir, target) if target else None
+            self.slides.append((slide_idx, slide_path if slide_path in self.zip.NameToInfo else None))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def part_size(self, path):
+        return self.zip.getinfo(path).file_size if path else 0
+
+    def slide_texts(self, slide_idx, slide_path, color_filter=None):
+        """{"SlideX!ShapeY...": text} của một slide, theo thứ tự shape trong <p:spTree>."""
+        extracted_data = {}
+        if not slide_path:
+            return extracted_data
+        root = _etree.fromstring(self.zip.read(slide_path))
+        sp_tree = root.find(f'{{{_NS_P}}}cSld/{{{_NS_P}}}spTree')
+        if sp_tree is None:
+            return extracted_data
+        shapes = (child for child in sp_tree if child.tag in _PPTX_SHAPE_TAGS)
+        for shape_idx, shape_elem in enumerate(shapes, start=1):
+            _pptx_collect_shape_texts(shape_elem, f"Slide{slide_idx}!Shape{shape_idx}", extracted_data, color_filter)
+        return extracted_data
+
+
+# ---- Chế độ song song (opt-in): mỗi slide là một task, dùng chung EXTRACT_WORKERS ----
+
+_pptx_worker_pkg = None
+
+
+def _pptx_worker_init(filepath):
+    global _pptx_worker_pkg
+    _pptx_worker_pkg = _PptxPackage(filepath)
+
+
+def _pptx_worker_task(slide_idx, slide_path, color_filter):
+    return _pptx_worker_pkg.slide_texts(slide_idx, slide_path, color_filter)
+
+
+def _pptx_extract_parallel(pkg, filepath, workers, color_filter, progress=None):
+    """Trích xuất các slide trên ProcessPoolExecutor, ghép lại theo thứ tự slide như đường serial."""
+    extracted_data = {}
+    with _process_pool(workers, _pptx_worker_init, (filepath,)) as pool:
+        # Submit slide lớn trước để cân bằng tải
+        futures = {}
+        for slide_idx, slide_path in sorted(pkg.slides, key=lambda s: pkg.part_size(s[1]), reverse=True):
+            futures[slide_idx] = pool.submit(_pptx_worker_task, slide_idx, slide_path, color_filter)
+        for slide_idx, _slide_path in pkg.slides:
+            if progress is not None:
+                progress.begin(f'Slide {slide_idx}')
+            result = futures[slide_idx].result()
+            extracted_data.update(result)
+            if progress is not None:
+                progress.end_part(1, len(result))
+    return extracted_data
+
+
+def extract_text_from_pptx(filepath, color_filter=None, progress=None, workers=None):
+    """
+    Trích xuất text từ file PPTX, bao gồm cả text trong grouped shapes
+    Trả về dictionary với format: {"SlideX!ShapeY": "Content"}
+    Với nested shapes: {"SlideX!ShapeY_Z": "Content"} (Z là shape con)
+    color_filter: set HEX strings hoặc None (không lọc)
+    progress: callback(info) nhận tiến độ theo slide (xem _ExtractProgress), hoặc None
+    workers: số process song song (None → app.config['EXTRACT_WORKERS']; <= 1 → serial)
+    """
+    if workers is None:
+        workers = app.config.get('EXTRACT_WORKERS', 0)
+    with _PptxPackage(filepath) as pkg:
+        tracker = _ExtractProgress(progress, len(pkg.slides)) if progress is not None else None
+        if workers > 1 and len(pkg.slides) > 1:
+            extracted_data = _pptx_extract_parallel(pkg, filepath, workers, color_filter, tracker)
+        else:
+            extracted_data = {}
+            for slide_idx, slide_path in pkg.slides:
+                if tracker is not None:
+                    tracker.begin(f'Slide {slide_idx}')
+                result = pkg.slide_texts(slide_idx, slide_path, color_filter)
+                extracted_data.update(result)
+                if tracker is not None:
+                    tracker.end_part(1, len(result))
+    if tracker is not None:
+        tracker.finish()
+    return extracted_data
+
+
+# ==================== PPTX ZIP-LEVEL INJECT ====================
+# Nạp bản dịch PPTX mà không qua Presentation(...).save(): chỉ slide part có key
+# được parse + patch <a:t> trên cây lxml, mọi entry khác (ảnh, media, layout...)
+# copy raw qua _zip_rewrite. Cách gán text giống hệt replace_text_keep_format.
+
+_PPTX_EXTLST_TAG     = f'{{{_NS_P}}}extLst'
+_A_END_PARA_RPR_TAG  = f'{{{_NS_A}}}endParaRPr'
+_A_BODY_PR_TAG       = f'{{{_NS_A}}}bodyPr'
+_A_TCPR_TAG          = f'{{{_NS_A}}}tcPr'
+_A_EXTLST_TAG        = f'{{{_NS_A}}}extLst'
+_A_CONTENT_TAGS      = (_A_R_TAG, _A_BR_TAG, _A_FLD_TAG)
+_PPTX_CTRL_CHAR_RE   = re.compile(r'([\x00-\x08\x0B-\x1F])')
+
+
+def _pptx_set_run_text(r, text):
+    """Giống `run.text = text` của python-pptx: ký tự điều khiển (trừ \\t, \\n) → "_xHHHH_"."""
+    t = r.find(_A_T_TAG)
+    if t is None:
+        t = _etree.SubElement(r, _A_T_TAG)
+    t.text = _PPTX_CTRL_CHAR_RE.sub(lambda m: '_x%04X_' % ord(m.group(1)), text)
+
+
+def _pptx_insert_child(parent, tag, successor_tags=()):
+    """Tạo con `tag` của parent, đặt trước con đầu tiên thuộc successor_tags (như xmlchemy của python-pptx)."""
+    elem = _etree.SubElement(parent, tag)
+    successor = _first_child_found_in(parent, successor_tags)
+    if successor is not None and successor is not elem:
+        successor.addprevious(elem)
+    return elem
+
+
+def _pptx_paragraph_append_text(p, text):
+    """Giống CT_TextParagraph.append_text: "\\n"/"\\v" → <a:br/>, đoạn text rỗng không tạo run."""
+    for idx, piece in enumerate(re.split('\n|\v', text)):
+        if idx > 0:
+            _pptx_insert_child(p, _A_BR_TAG, (_A_END_PARA_RPR_TAG,))
+        if piece:
+            r = _pptx_insert_child(p, _A_R_TAG, (_A_END_PARA_RPR_TAG,))
+            _etree.SubElement(r, _A_T_TAG)
+            _pptx_set_run_text(r, piece)
+
+
+def _pptx_get_or_add_txbody(parent, tag, successor_tags):
+    """txBody của <p:sp>/<a:tc>; chưa có thì tạo <txBody><a:bodyPr/><a:p/></txBody> như text_frame."""
+    txBody = parent.find(tag)
+    if txBody is None:
+        txBody = _pptx_insert_child(parent, tag, successor_tags)
+        _etree.SubElement(txBody, _A_BODY_PR_TAG)
+        _etree.SubElement(txBody, _A_P_TAG)
+    return txBody
+
+
+def _pptx_replace_text_keep_format(txBody, new_text):
+    """
+    Bản XML của replace_text_keep_format:
+    - có run → xóa text mọi <a:r>, gán text mới vào run đầu tiên (giữ <a:rPr>)
+    - không có run → xóa nội dung đoạn đầu rồi thêm run/<a:br> như paragraphs[0].text = ...
+    """
+    paragraphs = txBody.findall(_A_P_TAG)
+    if not paragraphs:
+        return
+    all_runs = [r for p in paragraphs for r in p.iterchildren(_A_R_TAG)]
+    if not all_runs:
+        first_para = paragraphs[0]
+        for child in [child for child in first_para if child.tag in _A_CONTENT_TAGS]:
+            first_para.remove(child)
+        _pptx_paragraph_append_text(first_para, new_text)
+        return
+    for r in all_runs:
+        _pptx_set_run_text(r, '')
+    _pptx_set_run_text(all_runs[0], new_text)
+
+
+def _pptx_index_shape_elements(container, prefix, shapes, cells):
+    """
+    Địa chỉ shape trong một slide (cùng cách đánh số với extract):
+    shapes[(Y, Z, ...)] = <p:sp>, cells[(Y, Z, ..., row, col)] = <a:tc> (row/col 0-based).
+    """
+    children = (child for child in container if child.tag in _PPTX_SHAPE_TAGS)
+    for shape_no, shape_elem in enumerate(children, start=1):
+        path = prefix + (shape_no,)
+        tag = shape_elem.tag
+        if tag == _PPTX_SP_TAG:
+            shapes[path] = shape_elem
+        elif tag == _PPTX_FRAME_TAG:
+            tbl = _pptx_frame_table(shape_elem)
+            if tbl is not None:
+                for row_idx, tr in enumerate(tbl.iterchildren(_A_TR_TAG)):
+                    for col_idx, tc in enumerate(tr.iterchildren(_A_TC_TAG)):
+                        cells[path + (row_idx, col_idx)] = tc
+        elif tag == _PPTX_GRPSP_TAG:
+            _pptx_index_shape_elements(shape_elem, path, shapes, cells)
+
+
+def _pptx_patch_slide_xml(raw, updates):
+    """Gán text cho một slide part; updates: [(path, table_pos | None, text)] → bytes."""
+    slide_root = _etree.fromstring(raw)
+    shapes, cells = {}, {}
+    sp_tree = slide_root.find(f'{{{_NS_P}}}cSld/{{{_NS_P}}}spTree')
+    if sp_tree is not None:
+        _pptx_index_shape_elements(sp_tree, (), shapes, cells)
+    for path, table_pos, text in updates:
+        if table_pos is not None:
+            tc = cells.get(path + table_pos)
+            if tc is None:
                 continue
-            z_out.writestr(name, content)
+            txBody = _pptx_get_or_add_txbody(tc, _A_TXBODY_TAG, (_A_TCPR_TAG, _A_EXTLST_TAG))
+        else:
+            sp = shapes.get(path)
+            if sp is None:
+                continue
+            txBody = _pptx_get_or_add_txbody(sp, _PPTX_TXBODY_TAG, (_PPTX_EXTLST_TAG,))
+        _pptx_replace_text_keep_format(txBody, text)
+    return _etree.tostring(slide_root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+
+def _pptx_inject_tasks(pkg, json_data):
+    """Gom bản dịch theo slide part: {slide_path: [(path, table_pos, text)]} theo thứ tự key."""
+    slide_paths = dict(pkg.slides)
+    tasks = {}
+    for key, translated_value in json_data.items():
+        parsed = _PptxShapeIndex.parse_key(key)
+        if parsed is None:
+            continue
+        slide_no, path, table_pos = parsed
+        slide_path = slide_paths.get(slide_no)
+        if not slide_path:
+            continue
+        text = '' if translated_value is None else str(translated_value)
+        tasks.setdefault(slide_path, []).append((path, table_pos, text))
+    return tasks
+
+
+def inject_text_to_pptx(source_filepath, output_filepath, json_data):
+    """
+    ZIP-level patch cho PPTX (thay cho Presentation.save):
+    - Chỉ slide part có bản dịch được parse và ghi lại
+    - Mọi part khác (ảnh, media, layout, master...) copy raw từ file gốc
+    - Key giống extract: "SlideX!ShapeY", "SlideX!ShapeY_Z", "SlideX!ShapeY!Table_RxCy"
+    """
+    with _PptxPackage(source_filepath) as pkg:
+        patched = {
+            slide_path: _pptx_patch_slide_xml(pkg.zip.read(slide_path), updates)
+            for slide_path, updates in _pptx_inject_tasks(pkg, json_data).items()
+        }
+        _zip_rewrite(pkg.zip, output_filepath, patched)
+
+
+# ==================== DOCX XML HELPERS ====================
+# Đọc trực tiếp <w:p>/<w:r>/<w:tbl> bằng lxml, cùng ngữ nghĩa với python-docx 1.1.0
+# (paragraph.text, table.rows[i].cells, font.color.rgb) — dùng chung cho extract và inject.
+
+_NS_W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_DOCX_OFFICE_DOCUMENT_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+_DOCX_NSMAP = {'w': _NS_W}
+
+_W_BODY_TAG       = f'{{{_NS_W}}}body'
+_W_P_TAG          = f'{{{_NS_W}}}p'
+_W_PPR_TAG        = f'{{{_NS_W}}}pPr'
+_W_R_TAG          = f'{{{_NS_W}}}r'
+_W_RPR_TAG        = f'{{{_NS_W}}}rPr'
+_W_HYPERLINK_TAG  = f'{{{_NS_W}}}hyperlink'
+_W_T_TAG          = f'{{{_NS_W}}}t'
+_W_TAB_TAG        = f'{{{_NS_W}}}tab'
+_W_PTAB_TAG       = f'{{{_NS_W}}}ptab'
+_W_BR_TAG         = f'{{{_NS_W}}}br'
+_W_CR_TAG         = f'{{{_NS_W}}}cr'
+_W_NO_BREAK_HYPHEN_TAG = f'{{{_NS_W}}}noBreakHyphen'
+_W_TBL_TAG        = f'{{{_NS_W}}}tbl'
+_W_TBL_GRID_TAG   = f'{{{_NS_W}}}tblGrid'
+_W_GRID_COL_TAG   = f'{{{_NS_W}}}gridCol'
+_W_TR_TAG         = f'{{{_NS_W}}}tr'
+_W_TC_TAG         = f'{{{_NS_W}}}tc'
+_W_TCPR_TAG       = f'{{{_NS_W}}}tcPr'
+_W_GRID_SPAN_TAG  = f'{{{_NS_W}}}gridSpan'
+_W_VMERGE_TAG     = f'{{{_NS_W}}}vMerge'
+_W_COLOR_TAG      = f'{{{_NS_W}}}color'
+_W_VAL_ATTR       = f'{{{_NS_W}}}val'
+_W_TYPE_ATTR      = f'{{{_NS_W}}}type'
+
+
+def _docx_run_text(r):
+    """Giống CT_R.text của python-docx: <w:t> + <w:tab>/<w:ptab> → \\t, <w:br>/<w:cr> → \\n, <w:noBreakHyphen> → -."""
+    pieces = []
+    for child in r:
+        tag = child.tag
+        if tag == _W_T_TAG:
+            pieces.append(child.text or '')
+        elif tag == _W_TAB_TAG or tag == _W_PTAB_TAG:
+            pieces.append('\t')
+        elif tag == _W_BR_TAG:
+            # Chỉ ngắt dòng (textWrapping) mới là "\n"; ngắt trang/cột → ""
+            if child.get(_W_TYPE_ATTR, 'textWrapping') == 'textWrapping':
+                pieces.append('\n')
+        elif tag == _W_CR_TAG:
+            pieces.append('\n')
+        elif tag == _W_NO_BREAK_HYPHEN_TAG:
+            pieces.append('-')
+    return ''.join(pieces)
+
+
+def _docx_paragraph_text(p):
+    """Giống paragraph.text: run trực tiếp + run trong <w:hyperlink>, theo thứ tự tài liệu."""
+    pieces = []
+    for child in p:
+        if child.tag == _W_R_TAG:
+            pieces.append(_docx_run_text(child))
+        elif child.tag == _W_HYPERLINK_TAG:
+            pieces.extend(_docx_run_text(r) for r in child.iterchildren(_W_R_TAG))
+    return ''.join(pieces)
+
+
+def _docx_table_rows(tbl):
+    """
+    Lưới cell của một <w:tbl> như table.rows[i].cells của python-docx: [[<w:tc>, ...] mỗi row],
+    ô gộp ngang (gridSpan) / dọc (vMerge continue) lặp lại <w:tc> gốc.
+    Lưới không dựng được (bảng hỏng) → [].
+    """
+    grid = tbl.find(_W_TBL_GRID_TAG)
+    col_count = len(grid.findall(_W_GRID_COL_TAG)) if grid is not None else 0
+    trs = tbl.findall(_W_TR_TAG)
+    cells = []
+    try:
+        for tr in trs:
+            for tc in tr.iterchildren(_W_TC_TAG):
+                tcPr = tc.find(_W_TCPR_TAG)
+                grid_span = vmerge = None
+                if tcPr is not None:
+                    grid_span = tcPr.find(_W_GRID_SPAN_TAG)
+                    vmerge = tcPr.find(_W_VMERGE_TAG)
+                span = int(grid_span.get(_W_VAL_ATTR)) if grid_span is not None else 1
+                merged = vmerge is not None and vmerge.get(_W_VAL_ATTR, 'continue') == 'continue'
+                for span_idx in range(span):
+                    if merged:
+                        cells.append(cells[-col_count])
+                    elif span_idx > 0:
+                        cells.append(cells[-1])
+                    else:
+                        cells.append(tc)
+    except (TypeError, ValueError, IndexError):
+        return []
+    return [cells[row * col_count:(row + 1) * col_count] for row in range(len(trs))]
+
+
+def _docx_run_rgb(r):
+    """Màu chữ HEX 6 ký tự của một <w:r>, cùng quy tắc với _get_font_rgb_docx(run): <w:rPr><w:color w:val>, "auto" → ''."""
+    rPr = r.find(_W_RPR_TAG)
+    if rPr is None:
+        return ''
+    color = rPr.find(_W_COLOR_TAG)
+    if color is None:
+        return ''
+    val = color.get(_W_VAL_ATTR)
+    if val == 'auto':
+        return ''
+    try:
+        rgb = (int(val[:2], 16), int(val[2:4], 16), int(val[4:], 16))
+    except (TypeError, ValueError):
+        return ''
+    if not all(0 <= v <= 255 for v in rgb):
+        return ''
+    return '%02X%02X%02X' % rgb
+
+
+def _docx_cell_text(tc):
+    """Giống cell.text: text các paragraph trực tiếp của <w:tc>, nối bằng "\n"."""
+    return '\n'.join(_docx_paragraph_text(p) for p in tc.iterchildren(_W_P_TAG))
+
+
+def _docx_tc_matches_color_filter(tc, color_filter: set) -> bool:
+    """Trả về True nếu bất kỳ run nào trong table cell (<w:tc>) khớp color_filter."""
+    has_any_run = False
+    for p in tc.iterchildren(_W_P_TAG):
+        for r in p.iterchildren(_W_R_TAG):
+            has_any_run = True
+            if (_docx_run_rgb(r) or '000000') in color_filter:
+                return True
+    if not has_any_run:
+        return '000000' in color_filter
+    return False
 
 
-def extract_text_from_docx(filepath, color_filter=None):
+def _docx_collect_table_texts(tbl, key_prefix, extracted_data, color_filter=None):
+    """
+    Ghi {"<key_prefix>!RyCz": text} của một <w:tbl> vào extracted_data, cùng key với
+    vòng lặp table.rows / row.cells cũ nhưng lưới cell chỉ dựng một lần cho cả bảng;
+    text/màu của ô gộp (cùng <w:tc> lặp lại) chỉ tính một lần.
+    """
+    seen = {}
+    for row_idx, row in enumerate(_docx_table_rows(tbl), start=1):
+        for col_idx, tc in enumerate(row, start=1):
+            if tc not in seen:
+                text_content = _docx_cell_text(tc).strip()
+                matched = bool(text_content) and (
+                    color_filter is None or _docx_tc_matches_color_filter(tc, color_filter))
+                seen[tc] = text_content if matched else None
+            if seen[tc] is not None:
+                extracted_data[f"{key_prefix}!R{row_idx}C{col_idx}"] = seen[tc]
+
+
+def extract_text_from_docx(filepath, color_filter=None, progress=None):
     """
     Trích xuất text từ file DOCX, bao gồm paragraphs, tables, headers, footers
     Trả về dictionary với format:
@@ -1631,33 +3639,46 @@ def extract_text_from_docx(filepath, color_filter=None):
     - Headers: {"Header_SectionX!ParagraphY": "Content"}
     - Footers: {"Footer_SectionX!ParagraphY": "Content"}
     color_filter: set HEX strings hoặc None (không lọc)
+    progress: callback(info) nhận tiến độ theo đoạn/bảng/section (xem _ExtractProgress), hoặc None
     """
     extracted_data = {}
     doc = Document(filepath)
+    paragraphs = doc.paragraphs
+    tables = doc.tables
+    sections = doc.sections
+    tracker = None
+    if progress is not None:
+        # work: mỗi paragraph body, mỗi bảng, header + footer của mỗi section
+        tracker = _ExtractProgress(progress, len(paragraphs) + len(tables) + 2 * len(sections))
+        tracker.begin('Paragraphs')
     
     # 1. Trích xuất text từ các paragraph thông thường (không trong table)
     # Luôn đếm TẤT CẢ paragraph không rỗng để giữ index nhất quán với inject
     paragraph_idx = 0
-    for para in doc.paragraphs:
+    for para in paragraphs:
         text_content = para.text.strip()
         if text_content:  # Đếm tất cả paragraph không rỗng
             paragraph_idx += 1
             if color_filter is None or _docx_para_matches_color_filter(para, color_filter):
                 key = f"Paragraph{paragraph_idx}"
                 extracted_data[key] = text_content
+        if tracker is not None:
+            tracker.advance(1 if text_content else 0, 1)
     
     # 2. Trích xuất text từ các bảng
-    for table_idx, table in enumerate(doc.tables, start=1):
-        for row_idx, row in enumerate(table.rows, start=1):
-            for col_idx, cell in enumerate(row.cells, start=1):
-                text_content = cell.text.strip()
-                if text_content:
-                    if color_filter is None or _docx_cell_matches_color_filter(cell, color_filter):
-                        key = f"Table{table_idx}!R{row_idx}C{col_idx}"
-                        extracted_data[key] = text_content
+    for table_idx, table in enumerate(tables, start=1):
+        if tracker is not None:
+            tracker.begin(f'Table {table_idx}')
+            items_before = len(extracted_data)
+        _docx_collect_table_texts(table._tbl, f"Table{table_idx}", extracted_data, color_filter)
+        if tracker is not None:
+            tracker.end_part(1, len(extracted_data) - items_before)
     
     # 3. Trích xuất text từ headers
-    for section_idx, section in enumerate(doc.sections, start=1):
+    for section_idx, section in enumerate(sections, start=1):
+        if tracker is not None:
+            tracker.begin(f'Header Section {section_idx}')
+            items_before = len(extracted_data)
         header = section.header
         for para_idx, para in enumerate(header.paragraphs, start=1):
             text_content = para.text.strip()
@@ -1668,16 +3689,16 @@ def extract_text_from_docx(filepath, color_filter=None):
         
         # Trích xuất từ table trong header (nếu có)
         for table_idx, table in enumerate(header.tables, start=1):
-            for row_idx, row in enumerate(table.rows, start=1):
-                for col_idx, cell in enumerate(row.cells, start=1):
-                    text_content = cell.text.strip()
-                    if text_content:
-                        if color_filter is None or _docx_cell_matches_color_filter(cell, color_filter):
-                            key = f"Header_Section{section_idx}!Table{table_idx}!R{row_idx}C{col_idx}"
-                            extracted_data[key] = text_content
+            _docx_collect_table_texts(table._tbl, f"Header_Section{section_idx}!Table{table_idx}",
+                                      extracted_data, color_filter)
+        if tracker is not None:
+            tracker.end_part(1, len(extracted_data) - items_before)
     
     # 4. Trích xuất text từ footers
-    for section_idx, section in enumerate(doc.sections, start=1):
+    for section_idx, section in enumerate(sections, start=1):
+        if tracker is not None:
+            tracker.begin(f'Footer Section {section_idx}')
+            items_before = len(extracted_data)
         footer = section.footer
         for para_idx, para in enumerate(footer.paragraphs, start=1):
             text_content = para.text.strip()
@@ -1688,205 +3709,358 @@ def extract_text_from_docx(filepath, color_filter=None):
         
         # Trích xuất từ table trong footer (nếu có)
         for table_idx, table in enumerate(footer.tables, start=1):
-            for row_idx, row in enumerate(table.rows, start=1):
-                for col_idx, cell in enumerate(row.cells, start=1):
-                    text_content = cell.text.strip()
-                    if text_content:
-                        if color_filter is None or _docx_cell_matches_color_filter(cell, color_filter):
-                            key = f"Footer_Section{section_idx}!Table{table_idx}!R{row_idx}C{col_idx}"
-                            extracted_data[key] = text_content
+            _docx_collect_table_texts(table._tbl, f"Footer_Section{section_idx}!Table{table_idx}",
+                                      extracted_data, color_filter)
+        if tracker is not None:
+            tracker.end_part(1, len(extracted_data) - items_before)
     
+    if tracker is not None:
+        tracker.finish()
     return extracted_data
 
 def replace_text_keep_format_docx(paragraph, new_text):
     """
-    Thay thế text trong paragraph nhưng GIỮ NGUYÊN format của từng run riêng lẻ.
-    Chiến lược: phân phối new_text vào các runs theo tỉ lệ ký tự gốc.
+    Thay thế text trong paragraph nhưng GIỮ NGUYÊN format của từng run riêng lẻ.
+    Chiến lược: phân phối new_text vào các runs theo tỉ lệ ký tự gốc.
+    """
+    if not paragraph.runs:
+        paragraph.text = new_text
+        return
+
+    runs = paragraph.runs
+    orig_lengths = [len(run.text) for run in runs]
+    total_orig = sum(orig_lengths)
+
+    if total_orig == 0:
+        # All runs empty — assign everything to first run
+        runs[0].text = new_text
+        for run in runs[1:]:
+            run.text = ""
+        return
+
+    new_total = len(new_text)
+    pos = 0
+    for i, (run, orig_len) in enumerate(zip(runs, orig_lengths)):
+        if i == len(runs) - 1:
+            run.text = new_text[pos:]
+        else:
+            count = round(new_total * orig_len / total_orig)
+            count = min(count, new_total - pos - (len(runs) - i - 1))
+            count = max(count, 0)
+            run.text = new_text[pos:pos + count]
+            pos += count
+
+class _DocxPositionIndex:
+    """
+    Index vị trí của một Document, cùng cách đánh số với extract_text_from_docx:
+    - "ParagraphN": paragraph KHÔNG rỗng thứ N của body
+    - "TableX!RyCz": cell (y, z) của bảng X trong body
+    - "Header_SectionS!ParagraphN" / "Header_SectionS!TableX!RyCz" (Footer_ tương tự)
+    Danh sách paragraph không rỗng / lưới cell của mỗi phạm vi chỉ dựng một lần,
+    khi key đầu tiên cần tới, nên proof-map tra key O(1) thay vì đếm lại
+    doc.paragraphs cho từng key. Header/footer của section không có key không bị chạm tới
+    (truy cập section.header có thể tạo header part mới).
+    Vị trí tính trên tài liệu gốc: nạp text rỗng vào một paragraph không làm lệch key sau.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._sections = None
+        self._parts = {}        # scope → doc / header / footer
+        self._paragraphs = {}   # scope → [paragraph không rỗng]
+        self._tables = {}       # scope → [table]
+        self._rows = {}         # (scope, X) → [[cell, ...] của từng row]
+
+    @staticmethod
+    def parse_key(key):
+        """
+        → (scope, paragraph_no, table_pos); scope: None (body) hoặc ('Header'|'Footer', S),
+        table_pos: (X, y, z) 1-based hoặc None; key không hợp lệ → None
+        """
+        scope = None
+        parts = key.split('!')
+        for kind in ('Header', 'Footer'):
+            if key.startswith(f'{kind}_Section'):
+                if len(parts) < 2:
+                    return None
+                try:
+                    scope = (kind, int(parts[0].replace(f'{kind}_Section', '')))
+                except ValueError:
+                    return None
+                parts = parts[1:]
+                break
+        else:
+            if key.startswith('Header_') or key.startswith('Footer_'):
+                return None
+        try:
+            if parts[0].startswith('Paragraph') and (scope is not None or len(parts) == 1):
+                return scope, int(parts[0].replace('Paragraph', '')), None
+            if parts[0].startswith('Table') and len(parts) == 2 and parts[1].startswith('R'):
+                cell_parts = parts[1].replace('R', '').split('C')
+                if len(cell_parts) != 2:
+                    return None
+                table_no = int(parts[0].replace('Table', ''))
+                return scope, None, (table_no, int(cell_parts[0]), int(cell_parts[1]))
+        except ValueError:
+            return None
+        return None
+
+    def _part(self, scope):
+        if scope not in self._parts:
+            part = self.doc
+            if scope is not None:
+                if self._sections is None:
+                    self._sections = list(self.doc.sections)
+                kind, section_no = scope
+                if not 1 <= section_no <= len(self._sections):
+                    part = None
+                else:
+                    section = self._sections[section_no - 1]
+                    part = section.header if kind == 'Header' else section.footer
+            self._parts[scope] = part
+        return self._parts[scope]
+
+    def _scope_paragraphs(self, scope):
+        if scope not in self._paragraphs:
+            part = self._part(scope)
+            self._paragraphs[scope] = [] if part is None else [p for p in part.paragraphs if p.text.strip()]
+        return self._paragraphs[scope]
+
+    def _scope_tables(self, scope):
+        if scope not in self._tables:
+            part = self._part(scope)
+            self._tables[scope] = [] if part is None else list(part.tables)
+        return self._tables[scope]
+
+    def _table_rows(self, scope, table_no, table):
+        key = (scope, table_no)
+        if key not in self._rows:
+            # Giống table.rows[i].cells nhưng lưới cell (gộp gridSpan/vMerge) chỉ tính MỘT lần
+            # cho cả bảng — row.cells của python-docx dựng lại toàn bộ lưới mỗi lần gọi.
+            cells = table._cells
+            column_count = table._column_count
+            self._rows[key] = [cells[row * column_count:(row + 1) * column_count]
+                               for row in range(len(table.rows))]
+        return self._rows[key]
+
+    def paragraph(self, key):
+        """Paragraph mà key trỏ tới (paragraph đầu tiên của cell với key bảng), hoặc None."""
+        parsed = self.parse_key(key)
+        if parsed is None:
+            return None
+        scope, paragraph_no, table_pos = parsed
+        if table_pos is None:
+            paragraphs = self._scope_paragraphs(scope)
+            return paragraphs[paragraph_no - 1] if 1 <= paragraph_no <= len(paragraphs) else None
+        table_no, row_no, col_no = table_pos
+        tables = self._scope_tables(scope)
+        if not 1 <= table_no <= len(tables):
+            return None
+        rows = self._table_rows(scope, table_no, tables[table_no - 1])
+        if not (1 <= row_no <= len(rows) and 1 <= col_no <= len(rows[row_no - 1])):
+            return None
+        cell_paragraphs = rows[row_no - 1][col_no - 1].paragraphs
+        return cell_paragraphs[0] if cell_paragraphs else None
+
+
+# ==================== DOCX ZIP-LEVEL INJECT ====================
+# Nạp bản dịch DOCX mà không qua Document(...).save(): chỉ document.xml và các
+# header/footer part có key được parse + patch <w:r> trên cây lxml, mọi entry khác
+# (ảnh, styles, numbering...) copy raw qua _zip_rewrite. Cách đánh số key giống
+# _DocxPositionIndex, cách chia text vào run giống replace_text_keep_format_docx.
+
+def _docx_set_run_text(r, text):
+    """Giống `run.text = text`: giữ <w:rPr>, \\t → <w:tab/>, \\n/\\r → <w:br/>, phần còn lại gom vào <w:t>."""
+    for child in [child for child in r if child.tag != _W_RPR_TAG]:
+        r.remove(child)
+    for idx, piece in enumerate(re.split(r'([\t\r\n])', text)):
+        if idx % 2:
+            _etree.SubElement(r, _W_TAB_TAG if piece == '\t' else _W_BR_TAG)
+        elif piece:
+            t = _etree.SubElement(r, _W_T_TAG)
+            t.text = piece
+            if len(piece.strip()) < len(piece):
+                t.set(_XML_SPACE_ATTR, 'preserve')
+
+
+def _docx_replace_text_keep_format(p, new_text):
+    """
+    Bản XML của replace_text_keep_format_docx: chia new_text vào các <w:r> trực tiếp
+    theo tỉ lệ số ký tự gốc; paragraph không có run → như `paragraph.text = new_text`.
     """
-    if not paragraph.runs:
-        paragraph.text = new_text
+    runs = list(p.iterchildren(_W_R_TAG))
+    if not runs:
+        for child in [child for child in p if child.tag != _W_PPR_TAG]:
+            p.remove(child)
+        r = _etree.SubElement(p, _W_R_TAG)
+        if new_text:
+            _docx_set_run_text(r, new_text)
         return
 
-    runs = paragraph.runs
-    orig_lengths = [len(run.text) for run in runs]
+    orig_lengths = [len(_docx_run_text(r)) for r in runs]
     total_orig = sum(orig_lengths)
 
     if total_orig == 0:
-        # All runs empty — assign everything to first run
-        runs[0].text = new_text
-        for run in runs[1:]:
-            run.text = ""
+        _docx_set_run_text(runs[0], new_text)
+        for r in runs[1:]:
+            _docx_set_run_text(r, '')
         return
 
     new_total = len(new_text)
     pos = 0
-    for i, (run, orig_len) in enumerate(zip(runs, orig_lengths)):
+    for i, (r, orig_len) in enumerate(zip(runs, orig_lengths)):
         if i == len(runs) - 1:
-            run.text = new_text[pos:]
+            _docx_set_run_text(r, new_text[pos:])
         else:
             count = round(new_total * orig_len / total_orig)
             count = min(count, new_total - pos - (len(runs) - i - 1))
             count = max(count, 0)
-            run.text = new_text[pos:pos + count]
+            _docx_set_run_text(r, new_text[pos:pos + count])
             pos += count
 
-def inject_text_to_docx(filepath, json_data):
+
+class _DocxPartIndex:
     """
-    Nạp text đã dịch vào file DOCX
-    Giữ nguyên định dạng (font, màu, size, bold, italic...)
+    Vị trí trong một phạm vi (body của document.xml, hoặc root <w:hdr>/<w:ftr>):
+    paragraph KHÔNG rỗng thứ N và cell (y, z) của bảng X — cùng cách đếm với _DocxPositionIndex.
     """
-    doc = Document(filepath)
-    
-    for key, translated_value in json_data.items():
+
+    def __init__(self, container):
+        self.paragraphs = [p for p in container.iterchildren(_W_P_TAG) if _docx_paragraph_text(p).strip()]
+        self.tables = container.findall(_W_TBL_TAG)
+        self._rows = {}
+
+    def paragraph(self, paragraph_no, table_pos):
+        """<w:p> mà vị trí trỏ tới (paragraph đầu tiên của cell với vị trí bảng), hoặc None."""
+        if table_pos is None:
+            if 1 <= paragraph_no <= len(self.paragraphs):
+                return self.paragraphs[paragraph_no - 1]
+            return None
+        table_no, row_no, col_no = table_pos
+        if not 1 <= table_no <= len(self.tables):
+            return None
+        if table_no not in self._rows:
+            self._rows[table_no] = _docx_table_rows(self.tables[table_no - 1])
+        rows = self._rows[table_no]
+        if not (1 <= row_no <= len(rows) and 1 <= col_no <= len(rows[row_no - 1])):
+            return None
+        return rows[row_no - 1][col_no - 1].find(_W_P_TAG)
+
+
+class _DocxPackage:
+    """
+    Đọc package DOCX một lần: mở ZIP, resolve main document qua _rels/.rels và
+    relationship của nó (header/footer part). Cây XML của part chỉ parse khi cần.
+    source: đường dẫn file hoặc file-like (BytesIO).
+    """
+
+    def __init__(self, source):
+        self.zip = zipfile.ZipFile(source, 'r')
         try:
-            # 1. Xử lý Paragraph thông thường: "ParagraphX"
-            if key.startswith('Paragraph') and '!' not in key:
-                para_num = int(key.replace('Paragraph', ''))
-                # Đếm lại các paragraph không rỗng để map đúng index
-                current_para_idx = 0
-                for para in doc.paragraphs:
-                    if para.text.strip():  # Chỉ đếm paragraph không rỗng
-                        current_para_idx += 1
-                        if current_para_idx == para_num:
-                            replace_text_keep_format_docx(para, translated_value)
-                            break
-            
-            # 2. Xử lý Table: "TableX!RyCz"
-            elif key.startswith('Table') and '!' in key and not key.startswith('Header_') and not key.startswith('Footer_'):
-                parts = key.split('!')
-                if len(parts) != 2:
-                    continue
-                
-                # Parse table index
-                table_part = parts[0]
-                table_idx = int(table_part.replace('Table', '')) - 1
-                
-                if table_idx >= len(doc.tables):
-                    continue
-                
-                table = doc.tables[table_idx]
-                
-                # Parse cell position: "R2C3"
-                cell_part = parts[1]
-                if not cell_part.startswith('R'):
-                    continue
-                
-                cell_parts = cell_part.replace('R', '').split('C')
-                if len(cell_parts) != 2:
-                    continue
-                
-                row_idx = int(cell_parts[0]) - 1
-                col_idx = int(cell_parts[1]) - 1
-                
-                if row_idx < len(table.rows) and col_idx < len(table.rows[row_idx].cells):
-                    cell = table.rows[row_idx].cells[col_idx]
-                    # Thay thế text trong paragraph đầu tiên của cell
-                    if cell.paragraphs:
-                        replace_text_keep_format_docx(cell.paragraphs[0], translated_value)
-            
-            # 3. Xử lý Header: "Header_SectionX!ParagraphY" hoặc "Header_SectionX!TableY!RzCw"
-            elif key.startswith('Header_Section'):
-                parts = key.split('!')
-                if len(parts) < 2:
-                    continue
-                
-                # Parse section index
-                section_part = parts[0].replace('Header_Section', '')
-                section_idx = int(section_part) - 1
-                
-                if section_idx >= len(doc.sections):
-                    continue
-                
-                header = doc.sections[section_idx].header
-                
-                # Check if it's a paragraph or table
-                if parts[1].startswith('Paragraph'):
-                    para_num = int(parts[1].replace('Paragraph', ''))
-                    para_idx = 0
-                    for para in header.paragraphs:
-                        if para.text.strip():
-                            para_idx += 1
-                            if para_idx == para_num:
-                                replace_text_keep_format_docx(para, translated_value)
-                                break
-                
-                elif parts[1].startswith('Table') and len(parts) == 3:
-                    # Header table cell
-                    table_idx = int(parts[1].replace('Table', '')) - 1
-                    if table_idx >= len(header.tables):
-                        continue
-                    
-                    table = header.tables[table_idx]
-                    cell_part = parts[2]
-                    if not cell_part.startswith('R'):
-                        continue
-                    
-                    cell_parts = cell_part.replace('R', '').split('C')
-                    if len(cell_parts) != 2:
-                        continue
-                    
-                    row_idx = int(cell_parts[0]) - 1
-                    col_idx = int(cell_parts[1]) - 1
-                    
-                    if row_idx < len(table.rows) and col_idx < len(table.rows[row_idx].cells):
-                        cell = table.rows[row_idx].cells[col_idx]
-                        if cell.paragraphs:
-                            replace_text_keep_format_docx(cell.paragraphs[0], translated_value)
-            
-            # 4. Xử lý Footer: "Footer_SectionX!ParagraphY" hoặc "Footer_SectionX!TableY!RzCw"
-            elif key.startswith('Footer_Section'):
-                parts = key.split('!')
-                if len(parts) < 2:
-                    continue
-                
-                # Parse section index
-                section_part = parts[0].replace('Footer_Section', '')
-                section_idx = int(section_part) - 1
-                
-                if section_idx >= len(doc.sections):
-                    continue
-                
-                footer = doc.sections[section_idx].footer
-                
-                # Check if it's a paragraph or table
-                if parts[1].startswith('Paragraph'):
-                    para_num = int(parts[1].replace('Paragraph', ''))
-                    para_idx = 0
-                    for para in footer.paragraphs:
-                        if para.text.strip():
-                            para_idx += 1
-                            if para_idx == para_num:
-                                replace_text_keep_format_docx(para, translated_value)
-                                break
-                
-                elif parts[1].startswith('Table') and len(parts) == 3:
-                    # Footer table cell
-                    table_idx = int(parts[1].replace('Table', '')) - 1
-                    if table_idx >= len(footer.tables):
-                        continue
-                    
-                    table = footer.tables[table_idx]
-                    cell_part = parts[2]
-                    if not cell_part.startswith('R'):
-                        continue
-                    
-                    cell_parts = cell_part.replace('R', '').split('C')
-                    if len(cell_parts) != 2:
-                        continue
-                    
-                    row_idx = int(cell_parts[0]) - 1
-                    col_idx = int(cell_parts[1]) - 1
-                    
-                    if row_idx < len(table.rows) and col_idx < len(table.rows[row_idx].cells):
-                        cell = table.rows[row_idx].cells[col_idx]
-                        if cell.paragraphs:
-                            replace_text_keep_format_docx(cell.paragraphs[0], translated_value)
-        
-        except (ValueError, IndexError, AttributeError) as e:
-            # Bỏ qua các key không hợp lệ
+            doc_path = 'word/document.xml'
+            root_rels = _etree.fromstring(self.zip.read('_rels/.rels'))
+            for rel in root_rels:
+                if rel.get('Type') == _DOCX_OFFICE_DOCUMENT_REL:
+                    doc_path = _xlsx_part_path('', rel.get('Target', ''))
+                    break
+            doc_dir, doc_file = _posixpath.split(doc_path)
+            rels_path = _posixpath.join(doc_dir, '_rels', f'{doc_file}.rels')
+            rels_root = _etree.fromstring(self.zip.read(rels_path)) if rels_path in self.zip.NameToInfo else ()
+        except Exception:
+            self.zip.close()
+            raise
+        self.document_path = doc_path
+        self.rid_to_path = {
+            rel.get('Id'): _xlsx_part_path(doc_dir, rel.get('Target', ''))
+            for rel in rels_root
+            if rel.get('TargetMode') != 'External'
+        }
+        self.roots = {}         # part_path → root lxml đã parse (dùng chung giữa các key)
+        self._sect_prs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def root(self, path):
+        if path not in self.roots:
+            self.roots[path] = _etree.fromstring(self.zip.read(path))
+        return self.roots[path]
+
+    def header_footer_path(self, kind, section_no):
+        """
+        Part header/footer (loại default) của section thứ section_no (1-based), như
+        section.header/section.footer: section không có reference thì dùng của section trước.
+        Không tìm được → None (python-docx sẽ tạo header rỗng; ở đây không thêm part nào).
+        """
+        if self._sect_prs is None:
+            self._sect_prs = self.root(self.document_path).xpath(
+                './w:body/w:p/w:pPr/w:sectPr | ./w:body/w:sectPr', namespaces=_DOCX_NSMAP)
+        if not 1 <= section_no <= len(self._sect_prs):
+            return None
+        ref_tag = f'{{{_NS_W}}}{kind.lower()}Reference'
+        sect_pr = self._sect_prs[section_no - 1]
+        while sect_pr is not None:
+            for ref in sect_pr.iterchildren(ref_tag):
+                if ref.get(_W_TYPE_ATTR) == 'default':
+                    path = self.rid_to_path.get(ref.get(f'{{{_NS_R}}}id'))
+                    return path if path in self.zip.NameToInfo else None
+            preceding = sect_pr.xpath('./preceding::w:sectPr[1]', namespaces=_DOCX_NSMAP)
+            sect_pr = preceding[0] if preceding else None
+        return None
+
+
+def _docx_apply_updates(pkg, json_data):
+    """
+    Gán bản dịch theo thứ tự key lên cây XML của các part → {part_path: root} đã sửa.
+    Mỗi phạm vi (body / header / footer của từng section) dựng _DocxPartIndex một lần,
+    khi key đầu tiên cần tới — giống _DocxPositionIndex trên Document.
+    """
+    touched = {}
+    scopes = {}     # scope → (part_path, _DocxPartIndex) hoặc None
+    for key, translated_value in json_data.items():
+        parsed = _DocxPositionIndex.parse_key(key)
+        if parsed is None:
             continue
-    
-    return doc
+        scope, paragraph_no, table_pos = parsed
+        if scope not in scopes:
+            if scope is None:
+                path = pkg.document_path
+                container = pkg.root(path).find(_W_BODY_TAG)
+            else:
+                path = pkg.header_footer_path(*scope)
+                container = pkg.root(path) if path else None
+            scopes[scope] = (path, _DocxPartIndex(container)) if container is not None else None
+        if scopes[scope] is None:
+            continue
+        path, index = scopes[scope]
+        p = index.paragraph(paragraph_no, table_pos)
+        if p is None:
+            continue
+        _docx_replace_text_keep_format(p, '' if translated_value is None else str(translated_value))
+        touched[path] = pkg.roots[path]
+    return touched
+
+
+def inject_text_to_docx(source_filepath, output_filepath, json_data):
+    """
+    ZIP-level patch cho DOCX (thay cho Document.save):
+    - Chỉ document.xml / header / footer part có bản dịch được parse và ghi lại
+    - Mọi part khác (ảnh, styles, numbering...) copy raw từ file gốc
+    - Key giống extract: "ParagraphX", "TableX!RyCz", "Header_SectionX!ParagraphY"...
+    Giữ nguyên định dạng (font, màu, size, bold, italic...) của từng run.
+    """
+    with _DocxPackage(source_filepath) as pkg:
+        patched = {
+            path: _etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+            for path, root in _docx_apply_updates(pkg, json_data).items()
+        }
+        _zip_rewrite(pkg.zip, output_filepath, patched)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -1996,29 +4170,134 @@ def api_save_templates():
 
 # ==================== API: GLOSSARY ====================
 
+# Catalogue glossary lưu ở GLOSSARY_DIR/_catalog.json: {gid: {name, rows, size, mtime_ns, meta}},
+# meta = [mtime_ns, size] của {gid}.meta.json (None nếu không có). Các route upload/sửa/xóa/import cập nhật
+# entry tại chỗ; lúc list chỉ đọc catalogue và stat CSV + meta: CSV lệch (mtime_ns, size) hoặc thiếu entry
+# (file chép tay vào thư mục) thì đếm lại dòng, meta lệch thì đọc lại tên.
+_GLOSSARY_CATALOG_NAME = '_catalog.json'
+_glossary_catalog_lock = threading.Lock()
+
+
+def _glossary_count_rows(csv_path):
+    """Số dòng không rỗng của file CSV glossary (0 nếu không đọc được)."""
+    try:
+        with open(csv_path, 'r', encoding='utf-8-sig') as f:
+            return sum(1 for r in csv.reader(f) if any(r))
+    except Exception:
+        return 0
+
+
+def _glossary_read_name(gid):
+    """Tên hiển thị trong {gid}.meta.json, mặc định là gid."""
+    try:
+        with open(os.path.join(GLOSSARY_DIR, f'{gid}.meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f).get('name', gid)
+    except (OSError, ValueError):
+        return gid
+
+
+def _glossary_catalog_load():
+    """Đọc catalogue (dict rỗng nếu chưa có/hỏng)."""
+    try:
+        with open(os.path.join(GLOSSARY_DIR, _GLOSSARY_CATALOG_NAME), 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        return catalog if isinstance(catalog, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _glossary_catalog_save(catalog):
+    """Ghi catalogue (atomic qua file tạm + os.replace)."""
+    path = os.path.join(GLOSSARY_DIR, _GLOSSARY_CATALOG_NAME)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Không thể ghi glossary catalogue: {e}")
+
+
+def _glossary_meta_stat(gid):
+    """[mtime_ns, size] của {gid}.meta.json, None nếu không có."""
+    try:
+        st = os.stat(os.path.join(GLOSSARY_DIR, f'{gid}.meta.json'))
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _glossary_catalog_entry(gid):
+    """Entry mới cho gid từ file CSV + meta hiện tại (None nếu CSV không còn)."""
+    csv_path = os.path.join(GLOSSARY_DIR, f'{gid}.csv')
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return None
+    return {
+        'name': _glossary_read_name(gid),
+        'rows': _glossary_count_rows(csv_path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'meta': _glossary_meta_stat(gid),
+    }
+
+
+def _glossary_catalog_update(gid):
+    """Cập nhật entry của gid sau khi route ghi CSV/meta."""
+    with _glossary_catalog_lock:
+        catalog = _glossary_catalog_load()
+        entry = _glossary_catalog_entry(gid)
+        if entry is None:
+            catalog.pop(gid, None)
+        else:
+            catalog[gid] = entry
+        _glossary_catalog_save(catalog)
+        return entry
+
+
+def _glossary_catalog_remove(gid):
+    """Bỏ entry của glossary đã xóa."""
+    with _glossary_catalog_lock:
+        catalog = _glossary_catalog_load()
+        if catalog.pop(gid, None) is not None:
+            _glossary_catalog_save(catalog)
+
+
 @app.route('/api/glossaries', methods=['GET'])
 @login_required
 def api_list_glossaries():
-    """Trả về danh sách tất cả file glossary đã lưu."""
-    result = []
-    for fname in sorted(os.listdir(GLOSSARY_DIR)):
-        if not fname.endswith('.csv'):
-            continue
-        gid = fname[:-4]
-        meta_path = os.path.join(GLOSSARY_DIR, f'{gid}.meta.json')
-        display_name = gid
-        if os.path.exists(meta_path):
-            with open(meta_path, 'r', encoding='utf-8') as f:
-                meta = json.load(f)
-                display_name = meta.get('name', gid)
-        # Đếm số dòng
-        try:
-            with open(os.path.join(GLOSSARY_DIR, fname), 'r', encoding='utf-8-sig') as f:
-                row_count = sum(1 for r in csv.reader(f) if any(r))
-        except Exception:
-            row_count = 0
-        result.append({'id': gid, 'name': display_name, 'rows': row_count})
-    return jsonify(result)
+    """Trả về danh sách tất cả file glossary đã lưu (đọc từ catalogue, chỉ đối chiếu lại CSV/meta bằng stat)."""
+    if _glossary_use_db():
+        with _glossary_db() as conn:
+            return jsonify(_glossary_db_list(conn))
+    with _glossary_catalog_lock:
+        catalog = _glossary_catalog_load()
+        fresh = {}
+        changed = False
+        for entry in sorted(os.scandir(GLOSSARY_DIR), key=lambda e: e.name):
+            if not entry.name.endswith('.csv'):
+                continue
+            gid = entry.name[:-4]
+            cached = catalog.get(gid)
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if cached is None or (cached.get('mtime_ns'), cached.get('size')) != (st.st_mtime_ns, st.st_size):
+                cached = _glossary_catalog_entry(gid)
+                if cached is None:
+                    continue
+                changed = True
+            else:
+                meta = _glossary_meta_stat(gid)
+                if cached.get('meta') != meta:
+                    cached = dict(cached, name=_glossary_read_name(gid), meta=meta)
+                    changed = True
+            fresh[gid] = cached
+        if changed or len(fresh) != len(catalog):
+            _glossary_catalog_save(fresh)
+    return jsonify([{'id': gid, 'name': e['name'], 'rows': e['rows']} for gid, e in fresh.items()])
 
 
 @app.route('/api/glossaries', methods=['POST'])
@@ -2033,21 +4312,31 @@ def api_upload_glossary():
         return jsonify({'error': 'Chỉ chấp nhận file .csv'}), 400
     display_name = request.form.get('name', '').strip() or os.path.splitext(f.filename)[0]
     gid = f'glossary_{int(time.time())}'
+    if _glossary_use_db():
+        rows = _glossary_csv_rows(io.StringIO(f.read().decode('utf-8-sig'), newline=None))
+        with _glossary_db(write=True) as conn:
+            _glossary_db_create(conn, gid, display_name, rows)
+        _glossary_cache_invalidate(gid)
+        return jsonify({'success': True, 'id': gid, 'name': display_name, 'rows': len(rows)})
     csv_path  = os.path.join(GLOSSARY_DIR, f'{gid}.csv')
     meta_path = os.path.join(GLOSSARY_DIR, f'{gid}.meta.json')
     f.save(csv_path)
+    _glossary_cache_invalidate(gid)
     with open(meta_path, 'w', encoding='utf-8') as mf:
         json.dump({'name': display_name}, mf, ensure_ascii=False)
-    # Đếm dòng
-    with open(csv_path, 'r', encoding='utf-8-sig') as cf:
-        row_count = sum(1 for r in csv.reader(cf) if any(r))
-    return jsonify({'success': True, 'id': gid, 'name': display_name, 'rows': row_count})
+    entry = _glossary_catalog_update(gid)
+    return jsonify({'success': True, 'id': gid, 'name': display_name, 'rows': entry['rows'] if entry else 0})
 
 
 @app.route('/api/glossaries/<gid>', methods=['GET'])
 @login_required
 def api_get_glossary(gid):
     """Trả về toàn bộ nội dung glossary dưới dạng list of {src, dst}."""
+    if _glossary_use_db():
+        with _glossary_db() as conn:
+            if _glossary_db_name(conn, gid) is None:
+                return jsonify({'error': 'Không tìm thấy'}), 404
+            return jsonify([{'dst': dst, 'src': src} for dst, src in _glossary_db_rows(conn, gid)])
     csv_path = os.path.join(GLOSSARY_DIR, f'{gid}.csv')
     if not os.path.exists(csv_path):
         return jsonify({'error': 'Không tìm thấy'}), 404
@@ -2068,6 +4357,8 @@ def api_update_glossary(gid):
     Cập nhật nội dung glossary.
     Body JSON: { "name": "...", "rows": [{"src": "...", "dst": "..."}, ...] }
     """
+    if _glossary_use_db():
+        return _api_update_glossary_db(gid)
     csv_path  = os.path.join(GLOSSARY_DIR, f'{gid}.csv')
     meta_path = os.path.join(GLOSSARY_DIR, f'{gid}.meta.json')
     if not os.path.exists(csv_path):
@@ -2086,6 +4377,30 @@ def api_update_glossary(gid):
             for row in data['rows']:
                 if row.get('src') or row.get('dst'):
                     w.writerow([row.get('dst', ''), row.get('src', '')])
+        _glossary_cache_invalidate(gid)
+    _glossary_catalog_update(gid)
+    return jsonify({'success': True})
+
+
+def _api_update_glossary_db(gid):
+    """PUT /api/glossaries/<gid> với backend SQLite: chỉ sửa các dòng thay đổi."""
+    data = request.get_json()
+    with _glossary_db(write=True) as conn:
+        if _glossary_db_name(conn, gid) is None:
+            return jsonify({'error': 'Không tìm thấy'}), 404
+        if not data:
+            return jsonify({'error': 'Body rỗng'}), 400
+        if 'name' in data:
+            conn.execute('UPDATE glossaries SET name = ? WHERE id = ?', (data['name'], gid))
+        if 'rows' in data:
+            rows = []
+            for row in data['rows']:
+                if row.get('src') or row.get('dst'):
+                    dst, src = row.get('dst'), row.get('src')
+                    rows.append(('' if dst is None else str(dst).strip(), '' if src is None else str(src).strip()))
+            _glossary_db_replace_rows(conn, gid, rows)
+    if 'rows' in data:
+        _glossary_cache_invalidate(gid)
     return jsonify({'success': True})
 
 
@@ -2093,6 +4408,12 @@ def api_update_glossary(gid):
 @login_required
 def api_delete_glossary(gid):
     """Xóa glossary và meta file."""
+    if _glossary_use_db():
+        with _glossary_db(write=True) as conn:
+            conn.execute('DELETE FROM terms WHERE glossary_id = ?', (gid,))
+            conn.execute('DELETE FROM glossaries WHERE id = ?', (gid,))
+        _glossary_cache_invalidate(gid)
+        return jsonify({'success': True})
     csv_path  = os.path.join(GLOSSARY_DIR, f'{gid}.csv')
     meta_path = os.path.join(GLOSSARY_DIR, f'{gid}.meta.json')
     for p in [csv_path, meta_path]:
@@ -2100,9 +4421,35 @@ def api_delete_glossary(gid):
             os.remove(p)
         except FileNotFoundError:
             pass
+    _glossary_cache_invalidate(gid)
+    _glossary_catalog_remove(gid)
     return jsonify({'success': True})
 
 
+@app.route('/api/glossaries/<gid>/export', methods=['GET'])
+@login_required
+def api_export_glossary(gid):
+    """Tải glossary về dạng CSV (cột A = đích, cột B = gốc, UTF-8 BOM) — cùng format với backend CSV."""
+    if _glossary_use_db():
+        with _glossary_db() as conn:
+            name = _glossary_db_name(conn, gid)
+            if name is None:
+                return jsonify({'error': 'Không tìm thấy'}), 404
+            rows = _glossary_db_rows(conn, gid)
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        data = buf.getvalue().encode('utf-8-sig')
+    else:
+        csv_path = os.path.join(GLOSSARY_DIR, f'{gid}.csv')
+        if not os.path.exists(csv_path):
+            return jsonify({'error': 'Không tìm thấy'}), 404
+        name = _glossary_read_name(gid)
+        with open(csv_path, 'rb') as f:
+            data = f.read()
+    response = send_file(io.BytesIO(data), mimetype='text/csv')
+    return set_download_headers(response, f'{name}.csv', f'{gid}.csv')
+
+
 # ==================== API: EXTRACT COLORS ====================
 
 @app.route('/api/extract-colors', methods=['POST'])
@@ -2121,19 +4468,16 @@ def api_extract_colors():
 
     ext = f.filename.rsplit('.', 1)[1].lower()
     file_bytes = f.read()
+    cache_key = _extract_cache_key(hashlib.sha256(file_bytes).hexdigest(), 'colors', ext=ext)
+    cached = _extract_cache_get(cache_key)
+    if cached is not None:
+        return jsonify({'colors': cached})
     colors = set()
 
     try:
         if ext == 'xlsx':
-            wb = load_workbook(io.BytesIO(file_bytes))
-            for ws in wb.worksheets:
-                for row in ws.iter_rows():
-                    for cell in row:
-                        if cell.value is not None:
-                            c = _get_font_rgb_xlsx(cell)
-                            if c:
-                                colors.add(c)
-            wb.close()
+            with _XlsxPackage(io.BytesIO(file_bytes)) as pkg:
+                colors.update(pkg.cell_font_colors())
 
         elif ext == 'pptx':
             prs = Presentation(io.BytesIO(file_bytes))
@@ -2149,11 +4493,11 @@ def api_extract_colors():
                     if c:
                         colors.add(c)
             for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for para in cell.paragraphs:
-                            for run in para.runs:
-                                c = _get_font_rgb_docx(run)
+                for row in _docx_table_rows(table._tbl):
+                    for tc in row:
+                        for p in tc.iterchildren(_W_P_TAG):
+                            for r in p.iterchildren(_W_R_TAG):
+                                c = _docx_run_rgb(r)
                                 if c:
                                     colors.add(c)
 
@@ -2163,6 +4507,7 @@ def api_extract_colors():
     # Luôn bao gồm 000000 cho màu đen/auto
     colors.add('000000')
 
+    _extract_cache_put(cache_key, sorted(colors))
     return jsonify({'colors': sorted(colors)})
 
 
@@ -2171,7 +4516,7 @@ def api_extract_colors():
 def extract():
     """
     Trích xuất file → trả về Server-Sent Events (SSE) với progress feedback.
-    Events: reading(10%), chunking(40-60%), writing(75-88%), done(100%, result) | error.
+    Events: reading(10-40%, kèm tiến độ theo sheet/slide/section), chunking(40-60%), writing(75-88%), done(100%, result) | error.
     """
     # Phase 1: Xử lý file TRƯỚC khi bắt đầu stream (session phải được set trước khi trả response)
     su_info = session.get('tab1_from_smart_update')
@@ -2203,6 +4548,7 @@ def extract():
     glossary_ids_raw = request.form.get('glossary_ids', '')
     glossary_ids = [g.strip() for g in glossary_ids_raw.split(',') if g.strip()]
     proofread_mode = request.form.get('proofread_mode', '').strip().lower() in ('1', 'true', 'yes', 'on')
+    selected_sheets = _parse_selected_sheets(request.form)
 
     # Tạo session key để inject có thể tìm lại file nguồn (phải set TRƯỚC khi stream)
     session_key = f'sse_extract_{datetime.now().strftime("%Y%m%d_%H%M%S_%f")}'
@@ -2212,7 +4558,8 @@ def extract():
 
     resp = Response(
         stream_with_context(stream_extract(
-            filepath, original_filename, glossary_ids, session_folder, color_filter, proofread_mode=proofread_mode
+            filepath, original_filename, glossary_ids, session_folder, color_filter, proofread_mode=proofread_mode,
+            selected_sheets=selected_sheets,
         )),
         mimetype='text/event-stream',
     )
@@ -2223,6 +4570,148 @@ def extract():
 
 
 
+# ==================== EXTRACTION CACHE ====================
+# Cache dict raw đã trích xuất (sau proofread filter, TRƯỚC glossary) trên đĩa.
+# Key = SHA-256 nội dung file + loại kết quả + các tùy chọn ảnh hưởng tới output,
+# nên cùng một file upload lại (preview màu, extract, align...) không phải parse lại.
+# Mỗi entry là một file JSON; mtime = lần dùng gần nhất → evict theo LRU, và bị xóa
+# trong cleanup_old_sessions khi lần dùng gần nhất từ hôm qua trở về trước.
+
+# Tăng mỗi khi sửa extractor xlsx/pptx/docx hoặc _is_proofread_excluded_text (entry cũ tự miss)
+EXTRACT_CACHE_VERSION = 1
+
+_extract_cache_lock = threading.Lock()
+
+
+def _hash_file(filepath):
+    """SHA-256 hex của nội dung file, đọc theo block."""
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _extract_cache_key(file_hash, kind, **options):
+    """Key của entry: EXTRACT_CACHE_VERSION + hash file + kind ('text' | 'colors') + options (đã chuẩn hóa)."""
+    payload = json.dumps({'version': EXTRACT_CACHE_VERSION, 'file': file_hash, 'kind': kind, **options},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _extract_cache_get(key):
+    """Đọc entry; chạm mtime để đánh dấu vừa dùng. Trả None nếu miss/hỏng."""
+    path = os.path.join(app.config['EXTRACT_CACHE_DIR'], f'{key}.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            value = json.load(f)
+        os.utime(path, None)
+        return value
+    except (OSError, ValueError):
+        return None
+
+
+def _extract_cache_put(key, value):
+    """Ghi entry (atomic qua file tạm + os.replace) rồi evict theo LRU."""
+    cache_dir = app.config['EXTRACT_CACHE_DIR']
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f'{key}.json')
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        _extract_cache_evict()
+    except OSError as e:
+        print(f"Warning: Không thể ghi extract cache: {e}")
+
+
+def _extract_cache_cleanup_old():
+    """Xóa entry (và file tạm sót lại) dùng lần cuối từ hôm qua trở về trước."""
+    cache_dir = app.config['EXTRACT_CACHE_DIR']
+    if not os.path.isdir(cache_dir):
+        return
+    today = datetime.now().date()
+    with _extract_cache_lock:
+        for entry in os.scandir(cache_dir):
+            if not entry.is_file():
+                continue
+            try:
+                if datetime.fromtimestamp(entry.stat().st_mtime).date() < today:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+
+def _extract_cache_evict():
+    """Xóa entry cũ nhất cho tới khi thỏa cả giới hạn số entry và tổng dung lượng."""
+    cache_dir = app.config['EXTRACT_CACHE_DIR']
+    max_entries = app.config['EXTRACT_CACHE_MAX_ENTRIES']
+    max_bytes = app.config['EXTRACT_CACHE_MAX_BYTES']
+    with _extract_cache_lock:
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith('.json'):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _mtime, size, _path in entries)
+        while entries and (len(entries) > max_entries or total > max_bytes):
+            _mtime, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def _extract_by_ext(filepath, ext, color_filter=None, selected_sheets=None, data_only=False, progress=None,
+                    value_groups=None):
+    """Gọi extractor theo định dạng. Ném ValueError nếu không hỗ trợ."""
+    if ext == 'xlsx':
+        return extract_text_from_xlsx(filepath, color_filter, selected_sheets, data_only=data_only, progress=progress,
+                                      value_groups=value_groups)
+    elif ext == 'pptx':
+        return extract_text_from_pptx(filepath, color_filter, progress=progress)
+    elif ext == 'docx':
+        return extract_text_from_docx(filepath, color_filter, progress=progress)
+    raise ValueError(f'Không hỗ trợ định dạng .{ext}')
+
+
+def extract_cached(filepath, ext, color_filter=None, selected_sheets=None, proofread_mode=False, data_only=False,
+                   progress=None, value_groups=None):
+    """
+    Trích xuất raw text (đã lọc proofread nếu bật) qua extraction cache.
+    Glossary KHÔNG nằm trong giá trị cache — caller áp dụng sau khi lookup.
+    progress: callback(info) chỉ được gọi khi cache miss (phải parse thật).
+    value_groups: dict rỗng — được điền {value: [keys]} khi extractor gom sẵn được
+                  (xlsx, cache miss); để trống thì caller tự gom như cũ.
+    """
+    key = _extract_cache_key(
+        _hash_file(filepath), 'text',
+        ext=ext,
+        color_filter=sorted(color_filter) if color_filter is not None else None,
+        selected_sheets=sorted(selected_sheets) if (selected_sheets and ext == 'xlsx') else None,
+        proofread_mode=bool(proofread_mode),
+        data_only=bool(data_only and ext == 'xlsx'),
+    )
+    cached = _extract_cache_get(key)
+    if cached is not None:
+        return cached
+
+    extracted_data = _extract_by_ext(filepath, ext, color_filter, selected_sheets, data_only, progress, value_groups)
+    if proofread_mode:
+        extracted_data = _filter_proofread_extract_data(extracted_data)
+        if value_groups:
+            for value in [v for v in value_groups if isinstance(v, str) and _is_proofread_excluded_text(v)]:
+                del value_groups[value]
+    _extract_cache_put(key, extracted_data)
+    return extracted_data
+
+
 # ==================== HELPER: raw extract (no chunking/zip) ====================
 
 def _extract_raw(filepath, original_filename, glossary_ids, session_folder, color_filter=None, selected_sheets=None, proofread_mode=False):
@@ -2232,34 +4721,10 @@ def _extract_raw(filepath, original_filename, glossary_ids, session_folder, colo
     """
     original_ext = original_filename.rsplit('.', 1)[-1].lower() if '.' in original_filename else 'xlsx'
 
-    if original_ext == 'xlsx':
-        workbook = load_workbook(filepath)
-        extracted_data = {}
-        for sheet_name in workbook.sheetnames:
-            if selected_sheets and sheet_name not in selected_sheets:
-                continue
-            sheet = workbook[sheet_name]
-            for row in sheet.iter_rows():
-                for cell in row:
-                    if cell.value is None:
-                        continue
-                    if isinstance(cell.value, str) and not cell.value.startswith('='):
-                        if color_filter is None or (_get_font_rgb_xlsx(cell) or '000000') in color_filter:
-                            extracted_data[f"{sheet_name}!{cell.coordinate}"] = cell.value
-        extracted_data.update(extract_xlsx_shapes(filepath))
-        workbook.close()
-    elif original_ext == 'pptx':
-        extracted_data = extract_text_from_pptx(filepath, color_filter)
-    elif original_ext == 'docx':
-        extracted_data = extract_text_from_docx(filepath, color_filter)
-    else:
-        raise ValueError(f'Không hỗ trợ định dạng .{original_ext}')
-
-    if proofread_mode:
-        extracted_data = _filter_proofread_extract_data(extracted_data)
+    extracted_data = extract_cached(filepath, original_ext, color_filter, selected_sheets, proofread_mode)
 
     if glossary_ids:
-        extracted_data = apply_glossary(extracted_data, glossary_ids)
+        extracted_data, _value_groups = apply_glossary_grouped(extracted_data, glossary_ids)
 
     return extracted_data
 
@@ -2277,35 +4742,13 @@ def _run_extract(filepath, original_filename, glossary_ids, session_folder, colo
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     original_ext = original_filename.rsplit('.', 1)[-1].lower() if '.' in original_filename else 'xlsx'
 
-    if original_ext == 'xlsx':
-        workbook = load_workbook(filepath)
-        extracted_data = {}
-        for sheet_name in workbook.sheetnames:
-            if selected_sheets and sheet_name not in selected_sheets:
-                continue
-            sheet = workbook[sheet_name]
-            for row in sheet.iter_rows():
-                for cell in row:
-                    if cell.value is None:
-                        continue
-                    if isinstance(cell.value, str) and not cell.value.startswith('='):
-                        if color_filter is None or (_get_font_rgb_xlsx(cell) or '000000') in color_filter:
-                            extracted_data[f"{sheet_name}!{cell.coordinate}"] = cell.value
-        # TODO: color filter for xlsx shapes not yet implemented
-        extracted_data.update(extract_xlsx_shapes(filepath))
-        workbook.close()
-    elif original_ext == 'pptx':
-        extracted_data = extract_text_from_pptx(filepath, color_filter)
-    elif original_ext == 'docx':
-        extracted_data = extract_text_from_docx(filepath, color_filter)
-    else:
-        raise ValueError(f'Không hỗ trợ định dạng .{original_ext}')
-
-    if proofread_mode:
-        extracted_data = _filter_proofread_extract_data(extracted_data)
+    value_groups = {}
+    extracted_data = extract_cached(filepath, original_ext, color_filter, selected_sheets, proofread_mode,
+                                    value_groups=value_groups)
 
     if glossary_ids:
-        extracted_data = apply_glossary(extracted_data, glossary_ids)
+        # Glossary chạy theo value duy nhất rồi fan-out; value_groups đi theo sang dedup
+        extracted_data, value_groups = apply_glossary_grouped(extracted_data, glossary_ids, value_groups)
 
     CHUNK_SIZE = 400
     data_items  = list(extracted_data.items())
@@ -2350,7 +4793,7 @@ def _run_extract(filepath, original_filename, glossary_ids, session_folder, colo
         'temp_dir': temp_dir,
     }
 
-    dedup_files, dedup_mapping, dedup_stats = build_dedup_data(extracted_data, CHUNK_SIZE)
+    dedup_files, dedup_mapping, dedup_stats = build_dedup_data(extracted_data, CHUNK_SIZE, value_groups or None)
     dedup_map_path = os.path.join(session_folder, 'dedup_mapping.json')
     with open(dedup_map_path, 'w', encoding='utf-8') as f:
         json.dump(dedup_mapping, f, ensure_ascii=False, indent=2)
@@ -2404,9 +4847,8 @@ def load_google_sheet():
         f.write(resp.content)
 
     try:
-        wb = load_workbook(filepath, read_only=True)
-        sheet_names = wb.sheetnames
-        wb.close()
+        with _XlsxPackage(filepath) as pkg:
+            sheet_names = list(pkg.sheet_paths)
     except Exception:
         sheet_names = []
 
@@ -2526,6 +4968,11 @@ def download_zip():
     
     return response
 
+def _form_xlsx_shared_strings():
+    """Form field xlsx_shared_strings=1 → True (dedup bản dịch vào sharedStrings); không bật → None (theo config)."""
+    return request.form.get('xlsx_shared_strings', '').strip().lower() in ('1', 'true', 'yes', 'on') or None
+
+
 @app.route('/inject', methods=['POST'])
 @login_required
 def inject():
@@ -2697,14 +5144,12 @@ def inject():
             output_filepath = os.path.join(session_folder, safe_output_filename)
 
             # ZIP-level patch: nạp cả cell + shape trực tiếp trên package gốc
-            inject_xlsx_shapes(excel_filepath, output_filepath, json_data)
+            inject_xlsx_shapes(excel_filepath, output_filepath, json_data,
+                               shared_strings=_form_xlsx_shared_strings())
             
             output_mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         
         elif file_ext == 'pptx':
-            # Nạp text vào PPTX
-            prs = inject_text_to_pptx(excel_filepath, json_data)
-            
             # Tạo tên file output
             base_filename = os.path.splitext(original_excel_filename)[0]  # Tên gốc với tiếng Nhật
             
@@ -2712,16 +5157,12 @@ def inject():
             safe_output_filename = f"output_{timestamp}.pptx"  # Tên file trong filesystem
             output_filepath = os.path.join(session_folder, safe_output_filename)
             
-            # Lưu file PPTX đã được nạp dữ liệu
-            prs.save(output_filepath)
-            del prs  # Giải phóng memory
+            # ZIP-level patch: chỉ ghi lại các slide part có bản dịch
+            inject_text_to_pptx(excel_filepath, output_filepath, json_data)
             
             output_mimetype = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
         
         elif file_ext == 'docx':
-            # Nạp text vào DOCX
-            doc = inject_text_to_docx(excel_filepath, json_data)
-            
             # Tạo tên file output
             base_filename = os.path.splitext(original_excel_filename)[0]  # Tên gốc với tiếng Nhật
             
@@ -2729,9 +5170,8 @@ def inject():
             safe_output_filename = f"output_{timestamp}.docx"  # Tên file trong filesystem
             output_filepath = os.path.join(session_folder, safe_output_filename)
             
-            # Lưu file DOCX đã được nạp dữ liệu
-            doc.save(output_filepath)
-            del doc  # Giải phóng memory
+            # ZIP-level patch: chỉ ghi lại document/header/footer part có bản dịch
+            inject_text_to_docx(excel_filepath, output_filepath, json_data)
             
             output_mimetype = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
         
@@ -2859,17 +5299,6 @@ def proof_map_xlsx(source_path, output_path, json_data, hex_color, map_mode='app
     wb.save(output_path)
 
 
-def _proof_navigate_pptx_shape(shape, shape_indices):
-    """Navigate nested grouped shapes; returns final shape or None."""
-    if not shape_indices:
-        return shape
-    if hasattr(shape, 'shapes'):
-        idx = shape_indices[0]
-        if idx <= len(shape.shapes):
-            return _proof_navigate_pptx_shape(shape.shapes[idx - 1], shape_indices[1:])
-    return None
-
-
 def proof_map_pptx(source_path, output_path, json_data, hex_color, map_mode='append', apply_color=True):
     """Write proof-read output for pptx: appends colored correction paragraph."""
     from pptx.dml.color import RGBColor as _PptxRGB
@@ -2890,50 +5319,13 @@ def proof_map_pptx(source_path, output_path, json_data, hex_color, map_mode='app
     b_c = int(hex_color[5:7], 16)
     corr_rgb = _PptxRGB(r_c, g_c, b_c)
     prs = Presentation(source_path)
+    index = _PptxShapeIndex(prs)
 
     for key, corrected_text in json_data.items():
         try:
-            if '!' not in key:
-                continue
-            parts = key.split('!')
-            if len(parts) < 2:
-                continue
-            slide_part = parts[0]
-            if not slide_part.startswith('Slide'):
-                continue
-            slide_idx = int(slide_part.replace('Slide', '')) - 1
-            if slide_idx >= len(prs.slides):
-                continue
-            slide = prs.slides[slide_idx]
-
-            shape_part = parts[1]
-            if not shape_part.startswith('Shape'):
-                continue
-            shape_str = shape_part.replace('Shape', '')
-            shape_indices = [int(i) for i in shape_str.split('_')]
-            first_idx = shape_indices[0] - 1
-            if first_idx >= len(slide.shapes):
+            text_frame = index.text_frame(key)
+            if not text_frame:
                 continue
-            shape = slide.shapes[first_idx]
-            shape = _proof_navigate_pptx_shape(shape, shape_indices[1:])
-            if shape is None:
-                continue
-
-            is_table_cell = len(parts) == 3 and parts[2].startswith('Table_R')
-            if is_table_cell:
-                table_part = parts[2].replace('Table_R', '').split('C')
-                row_idx = int(table_part[0]) - 1
-                col_idx = int(table_part[1]) - 1
-                if not (hasattr(shape, 'has_table') and shape.has_table):
-                    continue
-                table = shape.table
-                if row_idx >= len(table.rows) or col_idx >= len(table.rows[row_idx].cells):
-                    continue
-                text_frame = table.rows[row_idx].cells[col_idx].text_frame
-            else:
-                if not hasattr(shape, 'text_frame') or not shape.text_frame:
-                    continue
-                text_frame = shape.text_frame
 
             corrected_one_line = _proof_single_line_text(corrected_text)
             orig_one_line = _proof_single_line_text(text_frame.text)
@@ -3015,119 +5407,17 @@ def proof_map_docx(source_path, output_path, json_data, hex_color, map_mode='app
             except Exception:
                 pass
 
+    index = _DocxPositionIndex(doc)
     for key, corrected_text in json_data.items():
         try:
-            # 1. Plain paragraph: "ParagraphX"
-            if key.startswith('Paragraph') and '!' not in key:
-                para_num = int(key.replace('Paragraph', ''))
-                para_idx = 0
-                for para in doc.paragraphs:
-                    if para.text.strip():
-                        para_idx += 1
-                        if para_idx == para_num:
-                            if _proof_single_line_text(para.text) != _proof_single_line_text(corrected_text):
-                                if map_mode == 'overwrite':
-                                    _overwrite_correction(para, corrected_text)
-                                else:
-                                    _insert_correction(para, corrected_text)
-                            break
-
-            # 2. Table cell: "TableX!RyCz"
-            elif key.startswith('Table') and '!' in key and not key.startswith('Header_') and not key.startswith('Footer_'):
-                parts = key.split('!')
-                if len(parts) != 2:
-                    continue
-                table_idx = int(parts[0].replace('Table', '')) - 1
-                if table_idx >= len(doc.tables):
-                    continue
-                table = doc.tables[table_idx]
-                cell_str = parts[1]
-                if not cell_str.startswith('R'):
-                    continue
-                rc = cell_str.replace('R', '').split('C')
-                row_idx = int(rc[0]) - 1
-                col_idx = int(rc[1]) - 1
-                if row_idx < len(table.rows) and col_idx < len(table.rows[row_idx].cells):
-                    cell = table.rows[row_idx].cells[col_idx]
-                    if cell.paragraphs:
-                        para = cell.paragraphs[0]
-                        if _proof_single_line_text(para.text) != _proof_single_line_text(corrected_text):
-                            if map_mode == 'overwrite':
-                                _overwrite_correction(para, corrected_text)
-                            else:
-                                _insert_correction(para, corrected_text)
-
-            # 3. Header: "Header_SectionX!ParagraphY" or "Header_SectionX!TableY!RzCw"
-            elif key.startswith('Header_Section'):
-                parts = key.split('!')
-                if len(parts) < 2:
-                    continue
-                sec_idx = int(parts[0].replace('Header_Section', '')) - 1
-                if sec_idx >= len(doc.sections):
-                    continue
-                header = doc.sections[sec_idx].header
-                if parts[1].startswith('Paragraph'):
-                    pn = int(parts[1].replace('Paragraph', ''))
-                    pi = 0
-                    for para in header.paragraphs:
-                        if para.text.strip():
-                            pi += 1
-                            if pi == pn:
-                                if _proof_single_line_text(para.text) != _proof_single_line_text(corrected_text):
-                                    if map_mode == 'overwrite':
-                                        _overwrite_correction(para, corrected_text)
-                                    else:
-                                        _insert_correction(para, corrected_text)
-                                break
-                elif parts[1].startswith('Table') and len(parts) == 3:
-                    ti = int(parts[1].replace('Table', '')) - 1
-                    if ti >= len(header.tables):
-                        continue
-                    rc = parts[2].replace('R', '').split('C')
-                    ri, ci = int(rc[0]) - 1, int(rc[1]) - 1
-                    if ri < len(header.tables[ti].rows) and ci < len(header.tables[ti].rows[ri].cells):
-                        para = header.tables[ti].rows[ri].cells[ci].paragraphs[0]
-                        if _proof_single_line_text(para.text) != _proof_single_line_text(corrected_text):
-                            if map_mode == 'overwrite':
-                                _overwrite_correction(para, corrected_text)
-                            else:
-                                _insert_correction(para, corrected_text)
-
-            # 4. Footer: "Footer_SectionX!ParagraphY" or "Footer_SectionX!TableY!RzCw"
-            elif key.startswith('Footer_Section'):
-                parts = key.split('!')
-                if len(parts) < 2:
-                    continue
-                sec_idx = int(parts[0].replace('Footer_Section', '')) - 1
-                if sec_idx >= len(doc.sections):
-                    continue
-                footer = doc.sections[sec_idx].footer
-                if parts[1].startswith('Paragraph'):
-                    pn = int(parts[1].replace('Paragraph', ''))
-                    pi = 0
-                    for para in footer.paragraphs:
-                        if para.text.strip():
-                            pi += 1
-                            if pi == pn:
-                                if _proof_single_line_text(para.text) != _proof_single_line_text(corrected_text):
-                                    if map_mode == 'overwrite':
-                                        _overwrite_correction(para, corrected_text)
-                                    else:
-                                        _insert_correction(para, corrected_text)
-                                break
-                elif parts[1].startswith('Table') and len(parts) == 3:
-                    ti = int(parts[1].replace('Table', '')) - 1
-                    if ti >= len(footer.tables):
-                        continue
-                    rc = parts[2].replace('R', '').split('C')
-                    ri, ci = int(rc[0]) - 1, int(rc[1]) - 1
-                    if ri < len(footer.tables[ti].rows) and ci < len(footer.tables[ti].rows[ri].cells):
-                        para = footer.tables[ti].rows[ri].cells[ci].paragraphs[0]
-                        if _proof_single_line_text(para.text) != _proof_single_line_text(corrected_text):
-                            if map_mode == 'overwrite':
-                                _overwrite_correction(para, corrected_text)
-                            else:
-                                _insert_correction(para, corrected_text)
+            para = index.paragraph(key)
+            if para is None:
+                continue
+            if _proof_single_line_text(para.text) != _proof_single_line_text(corrected_text):
+                if map_mode == 'overwrite':
+                    _overwrite_correction(para, corrected_text)
+                else:
+                    _insert_correction(para, corrected_text)
         except Exception:
             continue
 
@@ -3903,25 +6193,9 @@ def extract_text_from_file(filepath: str, ext: str) -> dict:
     ext: 'xlsx' | 'pptx' | 'docx'
     Trả về dict {key: text}.
     """
-    if ext == 'xlsx':
-        wb = load_workbook(filepath, data_only=True)
-        result = {}
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            for row in ws.iter_rows():
-                for cell in row:
-                    if cell.value is None:
-                        continue
-                    if isinstance(cell.value, str) and not cell.value.startswith('='):
-                        result[f"{sheet_name}!{cell.coordinate}"] = cell.value
-        result.update(extract_xlsx_shapes(filepath))
-        wb.close()
-        return result
-    elif ext == 'pptx':
-        return extract_text_from_pptx(filepath)
-    elif ext == 'docx':
-        return extract_text_from_docx(filepath)
-    return {}
+    if ext not in ALLOWED_EXTENSIONS:
+        return {}
+    return extract_cached(filepath, ext, data_only=True)
 
 
 @app.route('/api/terminology/align', methods=['POST'])
@@ -4010,6 +6284,36 @@ def api_save_terminology_prompts_route():
         return jsonify({'error': str(e)}), 500
 
 
+def _api_import_glossary_rows_db(valid_rows, target_gid, new_name):
+    """Phần ghi của import-csv/import-json với backend SQLite: merge qua index hoặc tạo glossary mới."""
+    if target_gid:
+        with _glossary_db(write=True) as conn:
+            gid_name = _glossary_db_name(conn, target_gid)
+            if gid_name is None:
+                return jsonify({'error': f'Không tìm thấy glossary: {target_gid}'}), 404
+            added, skipped = _glossary_db_merge(conn, target_gid, valid_rows)
+            total_rows = _glossary_db_count(conn, target_gid)
+        _glossary_cache_invalidate(target_gid)
+        return jsonify({
+            'success': True, 'gid': target_gid, 'name': gid_name,
+            'added': added, 'skipped_duplicate': skipped,
+            'total_rows': total_rows,
+        })
+
+    if not new_name:
+        new_name = f'Thuật ngữ {datetime.now().strftime("%Y-%m-%d %H:%M")}'
+    gid = f'glossary_{int(time.time())}'
+    with _glossary_db(write=True) as conn:
+        _glossary_db_create(conn, gid, new_name, [])
+        added, skipped = _glossary_db_merge(conn, gid, valid_rows)
+    _glossary_cache_invalidate(gid)
+    return jsonify({
+        'success': True, 'gid': gid, 'name': new_name,
+        'added': added, 'skipped_duplicate': skipped,
+        'total_rows': added,
+    })
+
+
 @app.route('/api/terminology/import-csv', methods=['POST'])
 @login_required
 def api_terminology_import_csv():
@@ -4051,6 +6355,9 @@ def api_terminology_import_csv():
     if not valid_rows:
         return jsonify({'error': 'Không tìm thấy dữ liệu hợp lệ trong CSV'}), 400
 
+    if _glossary_use_db():
+        return _api_import_glossary_rows_db(valid_rows, target_gid, new_name)
+
     added = 0
     skipped = 0
 
@@ -4088,6 +6395,7 @@ def api_terminology_import_csv():
                 w.writerow(r)
             for r in new_rows:
                 w.writerow(r)
+        _glossary_cache_invalidate(target_gid)
 
         # Lấy tên từ meta
         meta_path = os.path.join(GLOSSARY_DIR, f'{target_gid}.meta.json')
@@ -4097,6 +6405,7 @@ def api_terminology_import_csv():
                 gid_name = json.load(f).get('name', target_gid)
         except Exception:
             pass
+        _glossary_catalog_update(target_gid)
 
         return jsonify({
             'success': True,
@@ -4127,9 +6436,11 @@ def api_terminology_import_csv():
                     w.writerow([dst, src])
                     seen.add(key)
                     added += 1
+        _glossary_cache_invalidate(gid)
 
         with open(meta_path, 'w', encoding='utf-8') as f:
             json.dump({'name': new_name}, f, ensure_ascii=False)
+        _glossary_catalog_update(gid)
 
         return jsonify({
             'success': True,
@@ -4186,6 +6497,9 @@ def api_terminology_import_json():
     if not valid_rows:
         return jsonify({'error': 'Không tìm thấy cặp thuật ngữ hợp lệ trong JSON'}), 400
 
+    if _glossary_use_db():
+        return _api_import_glossary_rows_db(valid_rows, target_gid, new_name)
+
     added = 0
     skipped = 0
 
@@ -4221,6 +6535,7 @@ def api_terminology_import_json():
                 w.writerow(r)
             for r in new_rows:
                 w.writerow(r)
+        _glossary_cache_invalidate(target_gid)
 
         meta_path = os.path.join(GLOSSARY_DIR, f'{target_gid}.meta.json')
         gid_name = target_gid
@@ -4229,6 +6544,7 @@ def api_terminology_import_json():
                 gid_name = json.load(f).get('name', target_gid)
         except Exception:
             pass
+        _glossary_catalog_update(target_gid)
 
         return jsonify({
             'success': True, 'gid': target_gid, 'name': gid_name,
@@ -4254,9 +6570,11 @@ def api_terminology_import_json():
                     added += 1
                 else:
                     skipped += 1
+        _glossary_cache_invalidate(gid)
 
         with open(meta_path, 'w', encoding='utf-8') as f:
             json.dump({'name': new_name}, f, ensure_ascii=False)
+        _glossary_catalog_update(gid)
 
         return jsonify({
             'success': True, 'gid': gid, 'name': new_name,
@@ -4273,7 +6591,7 @@ def batch_extract():
     """
     Trích xuất nhiều file cùng lúc với cross-file dedup.
     Gộp tất cả values unique từ mọi file → 1 JSON duy nhất để dịch.
-    Input (form-data): files[] + glossary_ids (comma-sep)
+    Input (form-data): files[] + glossary_ids (comma-sep) + selected_sheets (tùy chọn, áp dụng cho file xlsx)
     Output JSON: { batch_id, files:[{name,items}], total_items, dedup_stats, dedup_chunks, zip_display_name }
     """
     uploaded_files = request.files.getlist('files')
@@ -4289,6 +6607,7 @@ def batch_extract():
 
     color_filter_raw = request.form.get('color_filter', '')
     color_filter_list = [c.strip() for c in color_filter_raw.split(',') if c.strip()] if color_filter_raw else None
+    selected_sheets = _parse_selected_sheets(request.form)
 
     session_folder = get_session_folder()
     batch_id = uuid.uuid4().hex[:10]
@@ -4305,7 +6624,8 @@ def batch_extract():
 
         try:
             cf = color_filter_list if len(valid_files) == 1 else None
-            extracted = _extract_raw(filepath, original_filename, glossary_ids, session_folder, color_filter=cf)
+            extracted = _extract_raw(filepath, original_filename, glossary_ids, session_folder, color_filter=cf,
+                                     selected_sheets=selected_sheets)
         except Exception as e:
             return jsonify({'error': f'Lỗi khi xử lý "{original_filename}": {str(e)}'}), 500
 
@@ -4507,15 +6827,12 @@ def batch_inject():
 
         try:
             if ext == 'xlsx':
-                inject_xlsx_shapes(source_filepath, out_path, file_json_data)
+                inject_xlsx_shapes(source_filepath, out_path, file_json_data,
+                                   shared_strings=_form_xlsx_shared_strings())
             elif ext == 'pptx':
-                prs = inject_text_to_pptx(source_filepath, file_json_data)
-                prs.save(out_path)
-                del prs
+                inject_text_to_pptx(source_filepath, out_path, file_json_data)
             elif ext == 'docx':
-                doc = inject_text_to_docx(source_filepath, file_json_data)
-                doc.save(out_path)
-                del doc
+                inject_text_to_docx(source_filepath, out_path, file_json_data)
             else:
                 error_details.append(f'"{source_name}": định dạng .{ext} không hỗ trợ')
                 continue
@@ -4660,15 +6977,12 @@ def batch_inject_one():
 
     try:
         if ext == 'xlsx':
-            inject_xlsx_shapes(source_filepath, out_path, json_data)
+            inject_xlsx_shapes(source_filepath, out_path, json_data,
+                               shared_strings=_form_xlsx_shared_strings())
         elif ext == 'pptx':
-            prs = inject_text_to_pptx(source_filepath, json_data)
-            prs.save(out_path)
-            del prs
+            inject_text_to_pptx(source_filepath, out_path, json_data)
         elif ext == 'docx':
-            doc = inject_text_to_docx(source_filepath, json_data)
-            doc.save(out_path)
-            del doc
+            inject_text_to_docx(source_filepath, out_path, json_data)
         else:
             return jsonify({'error': f'Định dạng .{ext} không hỗ trợ.'}), 400
     except Exception as e: